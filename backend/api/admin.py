@@ -1,3 +1,379 @@
+from django.conf import settings
+from django.apps import apps
 from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.contrib.auth.admin import UserAdmin
+from django.contrib.auth.forms import UserChangeForm, UserCreationForm
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.functional import cached_property
+from django.utils.text import capfirst
 
-# Register your models here.
+from . import deletion, tasks, usage
+from .models import (
+    User, Ingredient, Recipe, IngredientAmount, Subscription, Favorite,
+    ShoppingCart, TimelineEntry, RecipeSignature, RecipeBucket, MediaFile,
+    RecipeSnapshot, Task, CanonicalIngredient, UnitConversion, Deletion,
+    StartupState, ImportProgress
+)
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор, который не считает строки больших таблиц.
+
+    Для запроса без фильтров в PostgreSQL берётся оценка числа строк из
+    pg_class. Если оценка меньше ADMIN_ESTIMATED_COUNT_THRESHOLD или
+    запрос отфильтрован, выполняется обычный COUNT(*). Фильтр менеджера
+    по умолчанию (скрытые удаляемые строки) фильтром не считается.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        unfiltered = queryset.query.where == (
+            queryset.model._default_manager.all().query.where
+        )
+        if connection.vendor == 'postgresql' and unfiltered:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples::bigint FROM pg_class '
+                    'WHERE oid = %s::regclass',
+                    [queryset.model._meta.db_table]
+                )
+                row = cursor.fetchone()
+            threshold = getattr(
+                settings, 'ADMIN_ESTIMATED_COUNT_THRESHOLD', 100000
+            )
+            if row is not None and row[0] > threshold:
+                return row[0]
+        return super().count
+
+
+class BaseAdmin(admin.ModelAdmin):
+    """Общие настройки списков для таблиц с большим числом строк."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+
+class BackgroundDeletionMixin:
+    """Подтверждение удаления без обхода каскада.
+
+    Связанные строки удаляет api.deletion в фоне, поэтому страница
+    подтверждения перечисляет только сами удаляемые объекты.
+    """
+
+    def get_deleted_objects(self, objs, request):
+        objs = list(objs)
+        perms_needed = set()
+        if not self.has_delete_permission(request):
+            perms_needed.add(self.opts.verbose_name)
+        deleted_objects = [
+            f'{capfirst(self.opts.verbose_name)}: {obj}' for obj in objs
+        ]
+        model_count = {self.opts.verbose_name_plural: len(objs)}
+        return deleted_objects, model_count, perms_needed, []
+
+
+class CustomUserCreationForm(UserCreationForm):
+    class Meta(UserCreationForm.Meta):
+        model = User
+        fields = ('email', 'username', 'first_name', 'last_name')
+
+
+class CustomUserChangeForm(UserChangeForm):
+    class Meta(UserChangeForm.Meta):
+        model = User
+
+
+@admin.register(User)
+class CustomUserAdmin(BackgroundDeletionMixin, BaseAdmin, UserAdmin):
+    form = CustomUserChangeForm
+    add_form = CustomUserCreationForm
+    list_display = (
+        'id', 'email', 'username', 'first_name', 'last_name', 'is_staff'
+    )
+    list_filter = ('is_staff', 'is_superuser', 'is_active')
+    search_fields = ('email', 'username')
+    ordering = ('id',)
+    fieldsets = (
+        (None, {'fields': ('email', 'username', 'password')}),
+        ('Персональные данные', {
+            'fields': ('first_name', 'last_name', 'avatar')
+        }),
+        ('Права доступа', {
+            'fields': (
+                'is_active', 'is_staff', 'is_superuser',
+                'groups', 'user_permissions'
+            )
+        }),
+        ('Важные даты', {'fields': ('last_login', 'date_joined')}),
+    )
+    add_fieldsets = (
+        (None, {
+            'classes': ('wide',),
+            'fields': (
+                'email', 'username', 'first_name', 'last_name',
+                'password1', 'password2'
+            ),
+        }),
+    )
+
+    # Пользователь с рецептами удаляется в фоне (api.deletion).
+    def delete_model(self, request, obj):
+        deletion.delete_user(obj)
+
+    def delete_queryset(self, request, queryset):
+        for user in queryset:
+            deletion.delete_user(user)
+
+
+@admin.register(CanonicalIngredient)
+class CanonicalIngredientAdmin(BaseAdmin):
+    list_display = ('id', 'name', 'key')
+    search_fields = ('name', 'key')
+
+
+@admin.register(UnitConversion)
+class UnitConversionAdmin(BaseAdmin):
+    list_display = ('unit', 'base_unit', 'factor')
+
+
+@admin.register(Ingredient)
+class IngredientAdmin(BaseAdmin):
+    list_display = (
+        'id', 'name', 'measurement_unit', 'canonical', 'recipes_count'
+    )
+    list_select_related = ('canonical',)
+    search_fields = ('name',)
+    list_filter = ('measurement_unit',)
+    raw_id_fields = ('canonical',)
+
+
+class PrefetchedAutocompleteSelect(AutocompleteSelect):
+    """Виджет автодополнения, который берёт подпись выбранного значения
+    из уже загруженного объекта, а не делает запрос на каждую строку."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.labels = {}
+
+    def optgroups(self, name, value, attr=None):
+        selected = [str(item) for item in value if item not in ('', None)]
+        if not selected or not all(
+            item in self.labels for item in selected
+        ):
+            return super().optgroups(name, value, attr)
+        options = [] if self.is_required else [
+            self.create_option(name, '', '', False, 0)
+        ]
+        for item in selected:
+            options.append(self.create_option(
+                name, item, self.labels[item], set(selected), len(options)
+            ))
+        return [(None, options, 0)]
+
+
+class IngredientAmountInline(admin.TabularInline):
+    model = IngredientAmount
+    autocomplete_fields = ('ingredient',)
+    min_num = 1
+    extra = 0
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('ingredient')
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'ingredient':
+            kwargs['widget'] = PrefetchedAutocompleteSelect(
+                db_field, self.admin_site, using=kwargs.get('using')
+            )
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+
+        class PrefetchedFormSet(formset):
+            def _construct_form(self, i, **kwargs):
+                form = super()._construct_form(i, **kwargs)
+                instance = form.instance
+                if instance.pk and instance.ingredient_id:
+                    widget = form.fields['ingredient'].widget.widget
+                    widget.labels[str(instance.ingredient_id)] = (
+                        form.fields['ingredient'].label_from_instance(
+                            instance.ingredient
+                        )
+                    )
+                return form
+
+        return PrefetchedFormSet
+
+
+@admin.register(Recipe)
+class RecipeAdmin(BackgroundDeletionMixin, BaseAdmin):
+    list_display = ('id', 'name', 'author', 'pub_date', 'favorites_count')
+    list_select_related = ('author',)
+    search_fields = ('name', 'author__username', 'author__email')
+    list_filter = ('pub_date',)
+    autocomplete_fields = ('author',)
+    readonly_fields = ('favorites_count',)
+    inlines = (IngredientAmountInline,)
+
+    def get_queryset(self, request):
+        # Подзапрос считается только для строк текущей страницы,
+        # в отличие от Count('favorites') с GROUP BY по всей таблице.
+        favorites_count = Favorite.objects.filter(
+            recipe=OuterRef('pk')
+        ).values('recipe').annotate(count=Count('id')).values('count')
+        return super().get_queryset(request).annotate(
+            favorites_count=Coalesce(
+                Subquery(favorites_count, output_field=IntegerField()), 0
+            )
+        )
+
+    @admin.display(description='В избранном', ordering='favorites_count')
+    def favorites_count(self, obj):
+        return obj.favorites_count
+
+    def save_related(self, request, form, formsets, change):
+        # Ингредиенты из инлайна сохраняются в обход api.usage.
+        amounts = IngredientAmount.objects.filter(recipe=form.instance)
+        ingredient_ids = set(amounts.values_list('ingredient_id', flat=True))
+        super().save_related(request, form, formsets, change)
+        ingredient_ids.update(amounts.values_list('ingredient_id', flat=True))
+        usage.recount(apps, ingredient_ids)
+
+    def delete_model(self, request, obj):
+        deletion.delete_recipe(obj)
+
+    def delete_queryset(self, request, queryset):
+        for recipe in queryset:
+            deletion.delete_recipe(recipe)
+
+
+@admin.register(IngredientAmount)
+class IngredientAmountAdmin(BaseAdmin):
+    list_display = ('id', 'recipe', 'ingredient', 'amount')
+    list_select_related = ('recipe', 'ingredient')
+    search_fields = ('recipe__name', 'ingredient__name')
+    autocomplete_fields = ('recipe', 'ingredient')
+
+    # Версия рецепта (updated_at) служит ETag, поэтому правка
+    # ингредиентов в обход рецепта должна ее менять, а снимок рецепта и
+    # его сигнатура похожести пересобираются, как при правке через API.
+    # Счетчики использования ингредиентов (api.usage) пересчитываются.
+    def save_model(self, request, obj, form, change):
+        ingredient_ids = [obj.ingredient_id]
+        if change:
+            ingredient_ids += IngredientAmount.objects.filter(
+                pk=obj.pk
+            ).values_list('ingredient_id', flat=True)
+        super().save_model(request, obj, form, change)
+        self.touch_recipes([obj.recipe_id])
+        usage.recount(apps, ingredient_ids)
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self.touch_recipes([obj.recipe_id])
+        usage.recount(apps, [obj.ingredient_id])
+
+    def delete_queryset(self, request, queryset):
+        rows = list(queryset.values_list('recipe_id', 'ingredient_id'))
+        super().delete_queryset(request, queryset)
+        self.touch_recipes([recipe_id for recipe_id, _ in rows])
+        usage.recount(apps, [ingredient_id for _, ingredient_id in rows])
+
+    @staticmethod
+    def touch_recipes(recipe_ids):
+        recipe_ids = sorted(set(recipe_ids))
+        Recipe.objects.filter(pk__in=recipe_ids).update(
+            updated_at=timezone.now()
+        )
+        tasks.enqueue('snapshots.rebuild', {'recipe_ids': recipe_ids})
+        tasks.enqueue(
+            'similarity.index_recipes', {'recipe_ids': recipe_ids}
+        )
+
+
+@admin.register(Subscription)
+class SubscriptionAdmin(BaseAdmin):
+    list_display = ('id', 'user', 'author')
+    list_select_related = ('user', 'author')
+    search_fields = ('user__username', 'author__username')
+    autocomplete_fields = ('user', 'author')
+
+
+@admin.register(Favorite, ShoppingCart)
+class UserRecipeAdmin(BaseAdmin):
+    list_display = ('id', 'user', 'recipe')
+    list_select_related = ('user', 'recipe')
+    search_fields = ('user__username', 'recipe__name')
+    autocomplete_fields = ('user', 'recipe')
+
+
+@admin.register(TimelineEntry)
+class TimelineEntryAdmin(BaseAdmin):
+    list_display = ('id', 'user', 'recipe', 'pub_date')
+    list_select_related = ('user', 'recipe')
+    raw_id_fields = ('user', 'recipe')
+
+
+@admin.register(RecipeSignature)
+class RecipeSignatureAdmin(BaseAdmin):
+    list_display = ('recipe',)
+    list_select_related = ('recipe',)
+    raw_id_fields = ('recipe',)
+
+
+@admin.register(RecipeBucket)
+class RecipeBucketAdmin(BaseAdmin):
+    list_display = ('id', 'recipe', 'key')
+    list_select_related = ('recipe',)
+    raw_id_fields = ('recipe',)
+
+
+@admin.register(RecipeSnapshot)
+class RecipeSnapshotAdmin(BaseAdmin):
+    list_display = ('recipe', 'recipe_updated_at', 'author_updated_at')
+    list_select_related = ('recipe',)
+    raw_id_fields = ('recipe',)
+
+
+@admin.register(MediaFile)
+class MediaFileAdmin(BaseAdmin):
+    list_display = ('id', 'name', 'ref_count')
+    search_fields = ('name',)
+
+
+@admin.register(Task)
+class TaskAdmin(BaseAdmin):
+    list_display = ('id', 'name', 'status', 'attempts', 'run_after')
+    list_filter = ('status', 'name')
+    search_fields = ('idempotency_key',)
+
+
+@admin.register(Deletion)
+class DeletionAdmin(BaseAdmin):
+    list_display = (
+        'id', 'kind', 'object_id', 'status', 'recipes_deleted',
+        'recipes_total', 'rows_deleted', 'created_at', 'finished_at'
+    )
+    list_filter = ('kind', 'status')
+    readonly_fields = (
+        'kind', 'object_id', 'status', 'recipes_total', 'recipes_deleted',
+        'rows_deleted', 'created_at', 'finished_at'
+    )
+
+
+@admin.register(StartupState)
+class StartupStateAdmin(BaseAdmin):
+    list_display = ('name', 'checksum', 'updated_at')
+
+
+@admin.register(ImportProgress)
+class ImportProgressAdmin(BaseAdmin):
+    list_display = ('source', 'line_number', 'updated_at')
@@ -0,0 +1,18 @@
+"""Настройка соединений с базой данных."""
+from django.conf import settings
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    """Применяет SQLITE_PRAGMAS к каждому новому соединению SQLite.
+
+    В Django 4.2 у SQLite нет init_command, поэтому PRAGMA выполняются по
+    сигналу connection_created.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    if not pragmas:
+        return
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
@@ -0,0 +1,97 @@
+"""Каталог ингредиентов в памяти процесса.
+
+Каталог небольшой (несколько тысяч строк) и почти не меняется, поэтому
+список ингредиентов и поиск по началу названия обслуживаются без
+обращения к базе. При запуске gunicorn с preload_app каталог загружается
+в мастер-процессе до fork, и воркеры разделяют его память.
+
+Изменения в текущем процессе сбрасывают каталог сигналами, остальные
+процессы перечитывают его не реже раза в INGREDIENT_CATALOGUE_TTL секунд.
+
+Подсказки по началу названия ранжируются: сначала точное совпадение,
+затем ингредиенты, которые чаще встречаются в рецептах (api.usage), и
+отдаются не больше INGREDIENT_AUTOCOMPLETE_LIMIT штук. Для этого при
+загрузке строятся списки позиций по убыванию популярности для каждых
+одной и двух первых букв: поиск идет по списку своего префикса и
+останавливается, набрав нужное число подсказок.
+"""
+import bisect
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+from .models import Ingredient
+
+_catalogue = None
+
+
+class Catalogue:
+    def __init__(self, rows):
+        # Строки хранятся в порядке базы (с ее правилами сортировки),
+        # а для поиска по префиксу строятся отдельные индексы.
+        counts = [row.pop('recipes_count') for row in rows]
+        self.rows = rows
+        self.index = sorted(
+            (row['name'], position) for position, row in enumerate(rows)
+        )
+        self.names = [name for name, _ in self.index]
+        self.popular = defaultdict(list)
+        for position in sorted(
+            range(len(rows)), key=lambda position: -counts[position]
+        ):
+            name = rows[position]['name']
+            for key in {name[:1], name[:2]}:
+                self.popular[key].append(position)
+        self.counts = counts
+        self.loaded_at = time.monotonic()
+
+    def search(self, prefix, limit=None):
+        if not prefix:
+            return self.rows
+        if limit is None:
+            limit = autocomplete_limit()
+        start = bisect.bisect_left(self.names, prefix)
+        exact = []
+        for name, position in self.index[start:]:
+            if name != prefix:
+                break
+            exact.append(position)
+        positions = sorted(
+            exact, key=lambda position: -self.counts[position]
+        )[:limit]
+        for position in self.popular.get(prefix[:2], ()):
+            if len(positions) >= limit:
+                break
+            name = self.rows[position]['name']
+            if name != prefix and name.startswith(prefix):
+                positions.append(position)
+        return [self.rows[position] for position in positions]
+
+
+def ttl():
+    return getattr(settings, 'INGREDIENT_CATALOGUE_TTL', 300)
+
+
+def autocomplete_limit():
+    return getattr(settings, 'INGREDIENT_AUTOCOMPLETE_LIMIT', 20)
+
+
+def load():
+    global _catalogue
+    _catalogue = Catalogue(list(Ingredient.objects.values(
+        'id', 'name', 'measurement_unit', 'recipes_count'
+    )))
+    return _catalogue
+
+
+def get():
+    catalogue = _catalogue
+    if catalogue is None or time.monotonic() - catalogue.loaded_at > ttl():
+        catalogue = load()
+    return catalogue
+
+
+def invalidate():
+    global _catalogue
+    _catalogue = None
@@ -0,0 +1,57 @@
+"""Условные GET-запросы: ETag, If-None-Match и If-Modified-Since.
+
+Валидаторы считаются по полям версий (updated_at, счетчикам изменений)
+одним коротким запросом, без сериализации ответа. Если копия клиента
+актуальна, обработчик не вызывается и отдается 304.
+"""
+import hashlib
+from functools import wraps
+
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import condition
+
+
+def make_etag(request, parts):
+    """ETag из частей версии и всего, от чего зависит представление."""
+    value = '|'.join(str(part) for part in (
+        *parts,
+        request.get_full_path(),
+        request.META.get('HTTP_ACCEPT', ''),
+    ))
+    return '"%s"' % hashlib.sha1(value.encode()).hexdigest()
+
+
+def conditional(get_validators):
+    """Декоратор обработчика DRF с поддержкой условных запросов.
+
+    get_validators(view, request, **kwargs) возвращает пару
+    (части версии, время изменения) или None, если валидаторов нет
+    (например, объект не найден). Время изменения можно не указывать
+    (None), если представление зависит от данных без отметки времени:
+    тогда клиенту отдается только ETag.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def wrapper(view, request, *args, **kwargs):
+            validators = get_validators(view, request, **kwargs)
+
+            def etag(request, *args, **kwargs):
+                if validators is not None:
+                    return make_etag(request, validators[0])
+                return None
+
+            def last_modified(request, *args, **kwargs):
+                if validators is not None:
+                    return validators[1]
+                return None
+
+            response = condition(etag, last_modified)(
+                lambda request, *args, **kwargs: handler(
+                    view, request, *args, **kwargs
+                )
+            )(request, *args, **kwargs)
+            # Ответ зависит от пользователя, а не только от адреса.
+            patch_vary_headers(response, ('Authorization', 'Cookie'))
+            return response
+        return wrapper
+    return decorator
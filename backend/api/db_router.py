@@ -0,0 +1,88 @@
+"""Маршрутизация чтения на реплики базы данных.
+
+Реплика выбирается для запросов с безопасным методом (GET, HEAD,
+OPTIONS). Запрос переходит на основную базу, как только в нем
+выполнена запись, и остается на ней до конца, чтобы видеть свои
+изменения. После записи клиент получает cookie REPLICA_PIN_COOKIE и еще
+REPLICA_PIN_SECONDS секунд читает с основной базы, пока реплики
+догоняют ее. Клиенты с токеном cookie не хранят, поэтому так же
+закрепляется и сам пользователь: его запросы читают с основной базы,
+как только он становится известен после аутентификации. Вне запросов
+(команды, тесты) все идет в основную базу.
+"""
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+_state = ContextVar('db_routing_state', default=None)
+
+
+class RoutingState:
+    def __init__(self, replica=None, pinned=None):
+        self.replica = replica
+        self.wrote = False
+        # Проверка закрепления пользователя: None, пока он не известен.
+        self.pinned = pinned
+
+    def use_primary(self):
+        if self.replica is not None and self.pinned is not None:
+            pinned = self.pinned()
+            if pinned is not None:
+                self.pinned = None
+                if pinned:
+                    self.replica = None
+        return self.replica is None or self.wrote
+
+
+def replicas():
+    return getattr(settings, 'REPLICA_DATABASES', [])
+
+
+def start_request(use_replica, pinned=None):
+    """Начинает маршрутизацию запроса; возвращает токен для finish.
+
+    pinned — функция, которая сообщает, закреплен ли пользователь за
+    основной базой, или возвращает None, пока он еще не известен.
+    """
+    aliases = replicas()
+    replica = random.choice(aliases) if use_replica and aliases else None
+    return _state.set(RoutingState(replica, pinned))
+
+
+def finish_request(token):
+    """Завершает маршрутизацию; возвращает True, если была запись."""
+    state = _state.get()
+    _state.reset(token)
+    return state is not None and state.wrote
+
+
+def pin_primary():
+    """Переводит оставшуюся часть запроса на основную базу."""
+    state = _state.get()
+    if state is not None:
+        state.wrote = True
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if (
+            state is None
+            or state.use_primary()
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        return state.replica
+
+    def db_for_write(self, model, **hints):
+        pin_primary()
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная база.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
@@ -0,0 +1,144 @@
+"""Удаление пользователей и рецептов в фоне.
+
+Удаление сразу только помечает строки (deleted_at): менеджеры objects
+их больше не возвращают, токены пользователя удаляются. Сами строки
+стирает задача deletion.purge небольшими шагами. Каждый шаг — отдельная
+транзакция, которая удаляет не больше DELETION_BATCH_SIZE зависимых
+строк одним DELETE без загрузки объектов и ставит в очередь следующий
+шаг. Прерванное удаление продолжается с того же места, ход виден в
+модели Deletion.
+
+Рецепты и пользователь стираются обычным delete() последними, когда
+ссылок на них почти не осталось: так срабатывают сигналы, которые
+освобождают файлы картинок и аватаров.
+"""
+from django.apps import apps
+from django.conf import settings
+from django.db import models, transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from . import edge_cache, tasks, usage
+from .models import Deletion, IngredientAmount, Recipe, User
+
+RECIPES_PER_STEP = 100
+
+
+def batch_size():
+    return getattr(settings, 'DELETION_BATCH_SIZE', 1000)
+
+
+def delete_recipe(recipe):
+    """Скрывает рецепт и ставит его удаление в очередь."""
+    hide_recipes(Recipe.objects.filter(pk=recipe.pk))
+    edge_cache.purge_later(['/api/recipes/', f'/api/recipes/{recipe.pk}/'])
+    return schedule(Deletion.RECIPE, recipe.pk, 1)
+
+
+def delete_user(user):
+    """Скрывает пользователя с рецептами и ставит удаление в очередь.
+
+    Почта и имя пользователя сразу освобождаются: проверки уникальности
+    при регистрации не видят скрытых пользователей.
+    """
+    User.all_objects.filter(pk=user.pk).update(
+        deleted_at=timezone.now(),
+        is_active=False,
+        email=f'deleted-{user.pk}@deleted.invalid',
+        username=f'deleted-{user.pk}',
+    )
+    Token.objects.filter(user_id=user.pk).delete()
+    total = hide_recipes(Recipe.objects.filter(author_id=user.pk))
+    edge_cache.purge_later(['/api/recipes/'])
+    return schedule(Deletion.USER, user.pk, total)
+
+
+def hide_recipes(queryset):
+    now = timezone.now()
+    # Списки покупок с этими рецептами получают новую версию.
+    User.objects.filter(
+        shopping_cart__recipe__in=queryset.values('pk')
+    ).update(
+        shopping_cart_version=F('shopping_cart_version') + 1,
+        shopping_cart_updated_at=now,
+    )
+    return queryset.update(deleted_at=now, updated_at=now)
+
+
+def schedule(kind, object_id, recipes_total):
+    deletion = Deletion.objects.create(
+        kind=kind, object_id=object_id, recipes_total=recipes_total
+    )
+    tasks.enqueue('deletion.purge', {'deletion_id': deletion.id})
+    return deletion
+
+
+def purge_references(model, ids, exclude=()):
+    """Удаляет до batch_size() строк, каскадно ссылающихся на ids.
+
+    Возвращает число удаленных строк; 0 — ссылок не осталось.
+    """
+    for relation in model._meta.related_objects:
+        if (
+            relation.many_to_many
+            or relation.on_delete is not models.CASCADE
+            or relation.related_model in exclude
+        ):
+            continue
+        manager = relation.related_model._base_manager
+        pks = list(manager.filter(**{
+            f'{relation.field.name}__in': ids
+        }).values_list('pk', flat=True)[:batch_size()])
+        if pks:
+            # _raw_delete выполняет один DELETE без сборщика Django,
+            # который загрузил бы строки и их собственные связи.
+            queryset = manager.filter(pk__in=pks)
+            if relation.related_model is IngredientAmount:
+                usage.remove(apps, queryset)
+            queryset._raw_delete(queryset.db)
+            return len(pks)
+    return 0
+
+
+def purge_step(deletion):
+    """Один шаг удаления; возвращает (удалено строк, завершено ли)."""
+    if deletion.kind == Deletion.RECIPE:
+        recipes = Recipe.all_objects.filter(pk=deletion.object_id)
+    else:
+        recipes = Recipe.all_objects.filter(author_id=deletion.object_id)
+    recipe_ids = list(recipes.order_by('id').values_list(
+        'id', flat=True
+    )[:RECIPES_PER_STEP])
+    if recipe_ids:
+        rows = purge_references(Recipe, recipe_ids)
+        if not rows:
+            rows = Recipe.all_objects.filter(id__in=recipe_ids).delete()[0]
+            deletion.recipes_deleted += len(recipe_ids)
+        return rows, False
+    if deletion.kind == Deletion.USER:
+        rows = purge_references(User, [deletion.object_id], {Recipe})
+        if rows:
+            return rows, False
+        return User.all_objects.filter(
+            pk=deletion.object_id
+        ).delete()[0], True
+    return 0, True
+
+
+def run_step(deletion_id):
+    with transaction.atomic():
+        deletion = Deletion.objects.select_for_update().filter(
+            pk=deletion_id
+        ).exclude(status=Deletion.DONE).first()
+        if deletion is None:
+            return
+        rows, finished = purge_step(deletion)
+        deletion.rows_deleted += rows
+        if finished:
+            deletion.status = Deletion.DONE
+            deletion.finished_at = timezone.now()
+        else:
+            deletion.status = Deletion.RUNNING
+            tasks.enqueue('deletion.purge', {'deletion_id': deletion_id})
+        deletion.save()
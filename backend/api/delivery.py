@@ -0,0 +1,69 @@
+"""Отдача файлов с диска через nginx или потоком из Django.
+
+Если запрос пришёл через nginx, настроенный с заголовком
+X-Sendfile-Type: X-Accel-Redirect, ответ содержит только заголовок
+X-Accel-Redirect, и файл отдаёт сам nginx. Без прокси файл читается
+потоком через FileResponse.
+"""
+import os
+import tempfile
+import time
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse
+from django.utils.http import content_disposition_header
+
+ACCEL_REDIRECT = 'X-Accel-Redirect'
+
+
+def export_path(name):
+    return os.path.join(settings.EXPORTS_ROOT, name)
+
+
+def get_or_create_export(name, build):
+    """Возвращает путь к файлу выгрузки, создавая его при отсутствии.
+
+    build вызывается только при промахе и должен вернуть bytes. Файл
+    записывается атомарно. Прежние версии в том же каталоге удаляются,
+    только когда они старше EXPORTS_GRACE_SECONDS: другой воркер мог
+    только что выбрать такой файл для отдачи.
+    """
+    path = export_path(name)
+    if os.path.exists(path):
+        return path
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    content = build()
+    with tempfile.NamedTemporaryFile(
+        dir=directory, suffix='.tmp', delete=False
+    ) as file:
+        file.write(content)
+    os.replace(file.name, path)
+    deadline = time.time() - getattr(settings, 'EXPORTS_GRACE_SECONDS', 300)
+    for entry in os.scandir(directory):
+        try:
+            if (
+                entry.path != path and entry.is_file()
+                and entry.stat().st_mtime < deadline
+            ):
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
+    return path
+
+
+def send_file(request, name, filename, content_type):
+    """Ответ со скачиванием выгрузки name из EXPORTS_ROOT."""
+    if request.META.get('HTTP_X_SENDFILE_TYPE') == ACCEL_REDIRECT:
+        response = HttpResponse(content_type=content_type)
+        response[ACCEL_REDIRECT] = settings.EXPORTS_URL + name
+        response['Content-Disposition'] = content_disposition_header(
+            True, filename
+        )
+        return response
+    return FileResponse(
+        open(export_path(name), 'rb'),
+        as_attachment=True,
+        filename=filename,
+        content_type=content_type,
+    )
@@ -0,0 +1,83 @@
+"""Кеширование публичных ответов API в nginx (infra/nginx.conf).
+
+nginx кеширует анонимные GET-запросы к /api/recipes/ и /api/ingredients/
+на время из заголовка X-Accel-Expires. Браузерам отдается
+Cache-Control без собственного кеширования (max-age=0), чтобы правки
+были видны сразу после сброса кеша nginx.
+
+Сброс: изменения рецептов и ингредиентов ставят задачу edge_cache.purge,
+которая запрашивает измененные адреса через служебный сервер nginx
+(EDGE_CACHE_PURGE_URL). Он всегда идет в backend и перезаписывает
+кешированный ответ. Адреса с параметрами запроса не сбрасываются и
+устаревают по TTL.
+"""
+import logging
+import urllib.error
+import urllib.request
+
+from django.conf import settings
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+from . import tasks
+
+logger = logging.getLogger(__name__)
+
+
+def is_enabled():
+    return bool(getattr(settings, 'EDGE_CACHE_PURGE_URL', ''))
+
+
+class EdgeCacheMixin:
+    """Заголовки кеширования для list и retrieve вьюсета.
+
+    edge_cache_ttl — имя настройки со временем хранения в nginx.
+    """
+    edge_cache_actions = ('list', 'retrieve')
+    edge_cache_ttl = None
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        if (
+            request.method not in ('GET', 'HEAD')
+            or getattr(self, 'action', None) not in self.edge_cache_actions
+            or response.status_code not in (200, 304)
+        ):
+            return response
+        patch_vary_headers(response, ('Authorization', 'Cookie'))
+        if request.user.is_authenticated:
+            patch_cache_control(response, private=True, no_cache=True)
+            return response
+        ttl = 0
+        if self.edge_cache_ttl:
+            ttl = getattr(settings, self.edge_cache_ttl, 0)
+        patch_cache_control(response, public=True, max_age=0, s_maxage=ttl)
+        response['X-Accel-Expires'] = str(ttl)
+        return response
+
+
+def purge_later(paths):
+    """Ставит сброс кеша nginx для адресов paths."""
+    if is_enabled():
+        tasks.enqueue('edge_cache.purge', {'paths': sorted(set(paths))})
+
+
+@tasks.task('edge_cache.purge', batch=True)
+def purge(payloads):
+    base_url = getattr(settings, 'EDGE_CACHE_PURGE_URL', '').rstrip('/')
+    if not base_url:
+        return
+    host = getattr(settings, 'EDGE_CACHE_HOST', '')
+    timeout = getattr(settings, 'EDGE_CACHE_PURGE_TIMEOUT', 5)
+    for path in sorted({
+        path for payload in payloads for path in payload['paths']
+    }):
+        request = urllib.request.Request(base_url + path)
+        if host:
+            request.add_header('Host', host)
+        try:
+            urllib.request.urlopen(request, timeout=timeout).close()
+        except urllib.error.HTTPError as error:
+            # 404 удаленного рецепта тоже перезаписывает кеш.
+            logger.info('Сброс кеша %s: %s', path, error.code)
@@ -0,0 +1,208 @@
+"""Быстрая сборка ответов для горячих GET-запросов.
+
+Классы здесь повторяют JSON-схему RecipeSerializer, CustomUserSerializer
+и SubscriptionSerializer, но строят ответ напрямую из строк .values(),
+минуя поля DRF. Совпадение с обычными сериализаторами проверяется
+тестами в api/tests.py.
+"""
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.db.models import (
+    Count, Exists, F, IntegerField, OuterRef, Subquery, Value, Window
+)
+from django.db.models.functions import Coalesce, RowNumber
+
+from . import snapshots
+from .models import Recipe, Subscription
+
+User = get_user_model()
+
+USER_VALUES = (
+    'email', 'id', 'username', 'first_name', 'last_name', 'avatar'
+)
+
+
+class MediaUrlBuilder:
+    """Строит абсолютные ссылки на файлы без повторной проверки хоста."""
+
+    def __init__(self, request=None):
+        self.prefix = None
+        if request is not None:
+            self.prefix = request.build_absolute_uri('/')[:-1]
+        self.request = request
+
+    def __call__(self, name, absolute=True):
+        if not name:
+            return None
+        url = default_storage.url(name)
+        if not absolute or self.prefix is None:
+            return url
+        if url.startswith('/') and not url.startswith('//'):
+            return self.prefix + url
+        return self.request.build_absolute_uri(url)
+
+
+def is_authenticated(request):
+    return request is not None and request.user.is_authenticated
+
+
+class FastUserSerializer:
+    """Представление пользователей в формате CustomUserSerializer."""
+    values_fields = USER_VALUES + ('is_subscribed',)
+
+    def __init__(self, request=None):
+        self.request = request
+        self.media_url = MediaUrlBuilder(request)
+
+    def values(self, queryset):
+        """queryset должен быть аннотирован флагом is_subscribed."""
+        return queryset.prefetch_related(None).values(*self.values_fields)
+
+    def to_representation(self, row):
+        return {
+            'email': row['email'],
+            'id': row['id'],
+            'username': row['username'],
+            'first_name': row['first_name'],
+            'last_name': row['last_name'],
+            'is_subscribed': bool(row['is_subscribed']),
+            'avatar': self.media_url(row['avatar']),
+        }
+
+    def serialize(self, rows):
+        return [self.to_representation(row) for row in rows]
+
+
+class FastRecipeSerializer:
+    """Представление рецептов в формате RecipeSerializer.
+
+    Блоки автора и ингредиентов берутся из снимков (см. api.snapshots)
+    тем же запросом, что и рецепты. Для рецептов без актуального снимка
+    они читаются еще двумя запросами независимо от размера страницы.
+    """
+    values_fields = (
+        'id', 'author_id', 'name', 'image', 'text', 'cooking_time',
+        'is_favorited', 'is_in_shopping_cart', 'is_subscribed',
+        'updated_at', 'author__updated_at', 'snapshot__data',
+        'snapshot__recipe_updated_at', 'snapshot__author_updated_at',
+    )
+
+    def __init__(self, request=None):
+        self.request = request
+        self.media_url = MediaUrlBuilder(request)
+
+    def values(self, queryset):
+        """queryset должен быть аннотирован флагами is_favorited и
+        is_in_shopping_cart (см. annotate_recipes)."""
+        if is_authenticated(self.request):
+            is_subscribed = Exists(Subscription.objects.filter(
+                user=self.request.user, author=OuterRef('author')
+            ))
+        else:
+            is_subscribed = Value(False)
+        return queryset.prefetch_related(None).annotate(
+            is_subscribed=is_subscribed
+        ).values(*self.values_fields)
+
+    def serialize(self, rows):
+        rows = list(rows)
+        if not rows:
+            return []
+        collected = snapshots.collect(
+            [row for row in rows if not snapshots.is_fresh(row)]
+        )
+        return [
+            self.to_representation(
+                row, collected.get(row['id']) or row['snapshot__data']
+            )
+            for row in rows
+        ]
+
+    def to_representation(self, row, data):
+        author = data['author']
+        return {
+            'id': row['id'],
+            'author': {
+                'email': author['email'],
+                'id': author['id'],
+                'username': author['username'],
+                'first_name': author['first_name'],
+                'last_name': author['last_name'],
+                'is_subscribed': bool(row['is_subscribed']),
+                'avatar': self.media_url(author['avatar']),
+            },
+            'ingredients': data['ingredients'],
+            'is_favorited': bool(row['is_favorited']),
+            'is_in_shopping_cart': bool(row['is_in_shopping_cart']),
+            'name': row['name'],
+            'image': self.media_url(row['image']),
+            'text': row['text'],
+            'cooking_time': row['cooking_time'],
+        }
+
+
+class FastSubscriptionSerializer:
+    """Представление подписок в формате SubscriptionSerializer."""
+    values_fields = USER_VALUES + ('is_subscribed', 'recipes_count')
+
+    def __init__(self, request):
+        self.request = request
+        self.media_url = MediaUrlBuilder(request)
+
+    def values(self, queryset):
+        """queryset должен быть аннотирован флагом is_subscribed."""
+        # Подзапрос вместо Count(): без GROUP BY сохраняется порядок
+        # queryset, на котором держится пагинация.
+        recipes_count = Recipe.objects.filter(
+            author=OuterRef('pk')
+        ).order_by().values('author').annotate(
+            count=Count('id')
+        ).values('count')
+        return queryset.prefetch_related(None).annotate(
+            recipes_count=Coalesce(
+                Subquery(recipes_count, output_field=IntegerField()), 0
+            )
+        ).values(*self.values_fields)
+
+    def serialize(self, rows):
+        rows = list(rows)
+        recipes = self._get_recipes([row['id'] for row in rows])
+        return [
+            {
+                'id': row['id'],
+                'username': row['username'],
+                'first_name': row['first_name'],
+                'last_name': row['last_name'],
+                'email': row['email'],
+                'is_subscribed': bool(row['is_subscribed']),
+                'avatar': self.media_url(row['avatar']),
+                'recipes_count': row['recipes_count'],
+                'recipes': recipes[row['id']],
+            }
+            for row in rows
+        ]
+
+    def _get_recipes(self, author_ids):
+        recipes_limit = self.request.query_params.get('recipes_limit')
+        queryset = Recipe.objects.filter(author_id__in=author_ids)
+        if recipes_limit:
+            queryset = queryset.annotate(row_number=Window(
+                RowNumber(),
+                partition_by=F('author_id'),
+                order_by=Recipe._meta.ordering,
+            )).filter(row_number__lte=int(recipes_limit))
+        recipes = defaultdict(list)
+        for row in queryset.values_list(
+            'author_id', 'id', 'name', 'image', 'cooking_time'
+        ):
+            # RecipeMinifiedSerializer вызывается без request,
+            # поэтому ссылки на картинки в подписках относительные.
+            recipes[row[0]].append({
+                'id': row[1],
+                'name': row[2],
+                'image': self.media_url(row[3], absolute=False),
+                'cooking_time': row[4],
+            })
+        return recipes
@@ -1,18 +1,25 @@
 import django_filters
 import logging
-from django.db.models import Q
+from django.db.models import Case, Q, When
 from .models import Recipe, Favorite, ShoppingCart, Ingredient
 
 logger = logging.getLogger(__name__)
 
 class IngredientFilter(django_filters.FilterSet):
     """Фильтр для ингредиентов."""
-    name = django_filters.CharFilter(lookup_expr='startswith')
+    name = django_filters.CharFilter(method='filter_name')
 
     class Meta:
         model = Ingredient
         fields = ('name',)
 
+    def filter_name(self, queryset, name, value):
+        """Начало названия; порядок как у api.catalogue."""
+        return queryset.filter(name__startswith=value).order_by(
+            Case(When(name=value, then=0), default=1),
+            '-recipes_count', 'name'
+        )
+
 class RecipeFilter(django_filters.FilterSet):
     """Фильтр для рецептов."""
     author = django_filters.NumberFilter(field_name='author__id')
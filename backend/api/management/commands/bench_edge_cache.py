@@ -0,0 +1,110 @@
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+DEFAULT_PATHS = [
+    '/api/recipes/',
+    '/api/recipes/?page=2',
+    '/api/recipes/?limit=20',
+    '/api/ingredients/',
+    '/api/ingredients/?name=%D1%81',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Пропускная способность анонимных запросов через кеш nginx '
+        'и в обход него. Запускается в docker-compose: '
+        'docker compose exec backend python manage.py bench_edge_cache'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--cached-url', default='http://nginx',
+            help='Адрес nginx с кешем'
+        )
+        parser.add_argument(
+            '--origin-url',
+            default=getattr(settings, 'EDGE_CACHE_PURGE_URL', '')
+            or 'http://nginx:8081',
+            help='Адрес nginx, который всегда обращается к backend'
+        )
+        parser.add_argument(
+            '--host', default=getattr(settings, 'EDGE_CACHE_HOST', '')
+            or 'localhost',
+            help='Заголовок Host запросов'
+        )
+        parser.add_argument(
+            '--requests', type=int, default=2000,
+            help='Количество запросов к каждому адресу'
+        )
+        parser.add_argument(
+            '--concurrency', type=int, default=16,
+            help='Количество параллельных клиентов'
+        )
+        parser.add_argument(
+            '--paths', nargs='+', default=DEFAULT_PATHS,
+            help='Адреса API, запрашиваемые по кругу'
+        )
+
+    def handle(self, *args, **options):
+        results = {}
+        for name, base_url in (
+            ('без кеша', options['origin_url']),
+            ('с кешем', options['cached_url']),
+        ):
+            results[name] = self._run(base_url, options)
+            rate, latencies, statuses = results[name]
+            hits = statuses['HIT'] + statuses['STALE'] + statuses['UPDATING']
+            self.stdout.write(
+                f'{name:9} {rate:8.0f} запросов/с '
+                f'p50 {self._percentile(latencies, 50):6.1f} мс '
+                f'p95 {self._percentile(latencies, 95):6.1f} мс '
+                f'попаданий {hits / sum(statuses.values()):6.1%}'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            'Ускорение: {:.1f}x'.format(
+                results['с кешем'][0] / results['без кеша'][0]
+            )
+        ))
+
+    def _run(self, base_url, options):
+        paths = options['paths']
+        urls = [
+            base_url.rstrip('/') + paths[number % len(paths)]
+            for number in range(options['requests'])
+        ]
+
+        def fetch(url):
+            request = urllib.request.Request(
+                url, headers={'Host': options['host']}
+            )
+            started = time.perf_counter()
+            try:
+                response = urllib.request.urlopen(request, timeout=30)
+            except urllib.error.HTTPError as error:
+                # Например, 404 для несуществующей страницы списка.
+                response = error
+            with response:
+                response.read()
+                status = response.headers.get('X-Cache-Status', '-')
+            return (time.perf_counter() - started) * 1000, status
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(options['concurrency']) as executor:
+            samples = list(executor.map(fetch, urls))
+        elapsed = time.perf_counter() - started
+        return (
+            len(urls) / elapsed,
+            sorted(latency for latency, _ in samples),
+            Counter(status for _, status in samples),
+        )
+
+    @staticmethod
+    def _percentile(values, percent):
+        return values[min(len(values) - 1, len(values) * percent // 100)]
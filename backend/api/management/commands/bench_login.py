@@ -0,0 +1,60 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from api.models import User
+
+PASSWORD = 'bench-Password-123'
+
+
+class Command(BaseCommand):
+    help = 'Скорость входа по паролю для каждого хешера'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--logins', type=int, default=20,
+            help='Количество входов на каждый хешер'
+        )
+        parser.add_argument(
+            '--hashers', nargs='+',
+            default=list(settings.PASSWORD_HASHER_CHOICES),
+            choices=list(settings.PASSWORD_HASHER_CHOICES),
+            help='Какие хешеры сравнивать'
+        )
+
+    def handle(self, *args, **options):
+        host = settings.ALLOWED_HOSTS[0].lstrip('.').replace('*', '')
+        client = APIClient(HTTP_HOST=host or 'localhost')
+        for name in options['hashers']:
+            hasher = settings.PASSWORD_HASHER_CHOICES[name]
+            # Пользователь создается в транзакции и откатывается в конце.
+            with override_settings(PASSWORD_HASHERS=[hasher]), \
+                    transaction.atomic():
+                user = User(
+                    email='bench-login@example.com', username='bench-login',
+                    first_name='Bench', last_name='Bench'
+                )
+                user.set_password(PASSWORD)
+                user.save()
+                data = {'email': user.email, 'password': PASSWORD}
+                client.post('/api/auth/token/login/', data)
+                with CaptureQueriesContext(connection) as queries:
+                    started = time.perf_counter()
+                    for _ in range(options['logins']):
+                        response = client.post(
+                            '/api/auth/token/login/', data
+                        )
+                    elapsed = time.perf_counter() - started
+                transaction.set_rollback(True)
+            if response.status_code != 200:
+                self.stderr.write(f'{name}: вход не удался: {response.data}')
+                continue
+            self.stdout.write(
+                f'{name:8} {elapsed / options["logins"] * 1000:8.1f} мс/вход '
+                f'{options["logins"] / elapsed:8.1f} входов/с/процесс '
+                f'{len(queries) / options["logins"]:.0f} запросов/вход'
+            )
@@ -0,0 +1,68 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client, override_settings
+
+from api.management.commands.bench_serializers import (
+    Command as SerializersCommand
+)
+
+RENDERERS = {
+    'json': 'rest_framework.renderers.JSONRenderer',
+    'orjson': 'api.renderers.FastJSONRenderer',
+}
+ENCODINGS = ('identity', 'gzip', 'br')
+
+
+class Command(BaseCommand):
+    help = 'Размер ответа и CPU на запрос /api/recipes/?limit=100'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat', type=int, default=30,
+            help='Количество запросов в каждом замере'
+        )
+
+    def handle(self, *args, **options):
+        host = settings.ALLOWED_HOSTS[0].lstrip('.').replace('*', '')
+        client = Client(HTTP_HOST=host or 'localhost')
+        self.stdout.write(
+            f'{"рендерер":<10}{"сжатие":<10}{"байт":>10}{"CPU, мс":>10}'
+        )
+        # Тестовые данные создаются в транзакции и откатываются в конце.
+        with transaction.atomic():
+            SerializersCommand._create_data(100, 10)
+            for renderer_name, renderer in RENDERERS.items():
+                rest_framework = dict(
+                    settings.REST_FRAMEWORK,
+                    DEFAULT_RENDERER_CLASSES=[renderer]
+                )
+                with override_settings(REST_FRAMEWORK=rest_framework):
+                    for encoding in ENCODINGS:
+                        size, cpu = self._measure(
+                            client, encoding, options['repeat']
+                        )
+                        self.stdout.write(
+                            f'{renderer_name:<10}{encoding:<10}'
+                            f'{size:>10}{cpu * 1000:>10.2f}'
+                        )
+            transaction.set_rollback(True)
+
+    @staticmethod
+    def _measure(client, encoding, repeat):
+        def request():
+            return client.get(
+                '/api/recipes/', {'limit': 100},
+                HTTP_ACCEPT_ENCODING=encoding
+            )
+
+        response = request()
+        started = time.process_time()
+        for _ in range(repeat):
+            request()
+        return (
+            len(response.content),
+            (time.process_time() - started) / repeat
+        )
@@ -0,0 +1,113 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api import snapshots
+from api.fast_serializers import FastRecipeSerializer
+from api.models import Ingredient, Recipe, IngredientAmount, User
+from api.serializers import RecipeSerializer
+from api.views import annotate_recipes
+
+
+class Command(BaseCommand):
+    help = 'Сравнение скорости RecipeSerializer и FastRecipeSerializer'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--recipes', type=int, default=100,
+            help='Количество рецептов на странице'
+        )
+        parser.add_argument(
+            '--ingredients', type=int, default=10,
+            help='Количество ингредиентов в рецепте'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=50,
+            help='Количество повторов каждого замера'
+        )
+
+    def handle(self, *args, **options):
+        # Тестовые данные создаются в транзакции и откатываются в конце.
+        with transaction.atomic():
+            user = self._create_data(
+                options['recipes'], options['ingredients']
+            )
+            host = settings.ALLOWED_HOSTS[0].lstrip('.').replace('*', '')
+            request = Request(APIRequestFactory().get(
+                '/api/recipes/', HTTP_HOST=host or 'localhost'
+            ))
+            request.user = user
+            ids = list(Recipe.objects.filter(
+                author=user
+            ).values_list('id', flat=True))
+
+            def queryset():
+                return annotate_recipes(
+                    Recipe.objects.filter(id__in=ids), user
+                )
+
+            def drf():
+                return RecipeSerializer(
+                    queryset(), many=True, context={'request': request}
+                ).data
+
+            def fast():
+                serializer = FastRecipeSerializer(request)
+                return serializer.serialize(serializer.values(queryset()))
+
+            drf_time = self._measure(drf, options['repeat'])
+            fast_time = self._measure(fast, options['repeat'])
+            snapshots.rebuild(ids)
+            snapshot_time = self._measure(fast, options['repeat'])
+            transaction.set_rollback(True)
+
+        self.stdout.write(
+            f'RecipeSerializer:     {drf_time * 1000:.2f} мс/страница'
+        )
+        self.stdout.write(
+            f'FastRecipeSerializer: {fast_time * 1000:.2f} мс/страница'
+        )
+        self.stdout.write(
+            f'Со снимками рецептов: {snapshot_time * 1000:.2f} мс/страница'
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Ускорение: {drf_time / fast_time:.1f}x, '
+            f'со снимками {drf_time / snapshot_time:.1f}x'
+        ))
+
+    @staticmethod
+    def _measure(func, repeat):
+        func()
+        started = time.perf_counter()
+        for _ in range(repeat):
+            func()
+        return (time.perf_counter() - started) / repeat
+
+    @staticmethod
+    def _create_data(recipes_count, ingredients_count):
+        user = User.objects.create(
+            email='bench@example.com', username='bench',
+            first_name='Bench', last_name='Bench'
+        )
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'bench-{number}', measurement_unit='г')
+            for number in range(ingredients_count)
+        )
+        recipes = Recipe.objects.bulk_create(
+            Recipe(
+                author=user, name=f'Рецепт {number}',
+                image='recipes/bench.png', text='Текст ' * 50,
+                cooking_time=10
+            )
+            for number in range(recipes_count)
+        )
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(recipe=recipe, ingredient=ingredient, amount=5)
+            for recipe in recipes
+            for ingredient in ingredients
+        )
+        return user
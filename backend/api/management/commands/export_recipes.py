@@ -0,0 +1,93 @@
+import json
+import sys
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from tqdm import tqdm
+
+from api.models import Recipe, IngredientAmount
+
+
+class Command(BaseCommand):
+    help = 'Потоковый экспорт рецептов в NDJSON файл'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default='-',
+            help='Путь к NDJSON файлу (по умолчанию stdout)'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Количество рецептов, читаемых за один запрос'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file = (
+            sys.stdout if path == '-'
+            else open(path, 'w', encoding='utf-8')
+        )
+        exported = 0
+        started = time.monotonic()
+        try:
+            with tqdm(
+                total=Recipe.objects.count(), unit='рецепт',
+                disable=path == '-'
+            ) as progress:
+                for batch in self._iter_batches(options['batch_size']):
+                    file.writelines(
+                        json.dumps(record, ensure_ascii=False) + '\n'
+                        for record in batch
+                    )
+                    exported += len(batch)
+                    progress.update(len(batch))
+        finally:
+            if file is not sys.stdout:
+                file.close()
+        elapsed = time.monotonic() - started
+        self.stderr.write(self.style.SUCCESS(
+            f'Экспортировано рецептов: {exported} за {elapsed:.1f} с '
+            f'({exported / elapsed if elapsed else 0:.0f} рецептов/с)'
+        ))
+
+    def _iter_batches(self, batch_size):
+        """Читает рецепты пачками по возрастанию id.
+
+        Keyset-пагинация держит в памяти только одну пачку рецептов
+        вместе с их ингредиентами.
+        """
+        last_id = 0
+        while True:
+            recipes = list(
+                Recipe.objects.filter(id__gt=last_id).order_by('id').values(
+                    'id', 'author__email', 'name', 'text',
+                    'cooking_time', 'image'
+                )[:batch_size]
+            )
+            if not recipes:
+                return
+            last_id = recipes[-1]['id']
+            ingredients = defaultdict(list)
+            for amount in IngredientAmount.objects.filter(
+                recipe_id__in=[recipe['id'] for recipe in recipes]
+            ).order_by('id').values(
+                'recipe_id', 'ingredient__name',
+                'ingredient__measurement_unit', 'amount'
+            ):
+                ingredients[amount['recipe_id']].append({
+                    'name': amount['ingredient__name'],
+                    'measurement_unit': amount['ingredient__measurement_unit'],
+                    'amount': amount['amount'],
+                })
+            yield [
+                {
+                    'author': recipe['author__email'],
+                    'name': recipe['name'],
+                    'text': recipe['text'],
+                    'cooking_time': recipe['cooking_time'],
+                    'image': recipe['image'],
+                    'ingredients': ingredients[recipe['id']],
+                }
+                for recipe in recipes
+            ]
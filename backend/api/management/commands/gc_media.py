@@ -0,0 +1,84 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api import storage
+from api.models import MediaFile
+
+
+class Command(BaseCommand):
+    help = 'Удаление медиафайлов, на которые не ссылается ни один объект'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Количество файлов, проверяемых одним запросом'
+        )
+        parser.add_argument(
+            '--grace-seconds', type=int, default=3600,
+            help='Не трогать файлы моложе указанного возраста'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать файлы, которые будут удалены'
+        )
+
+    def handle(self, *args, **options):
+        self.dry_run = options['dry_run']
+        deadline = time.time() - options['grace_seconds']
+        checked = removed = freed = 0
+        batch = []
+        for path in self._walk():
+            batch.append(path)
+            if len(batch) >= options['batch_size']:
+                batch_removed, batch_freed = self._sweep(batch, deadline)
+                checked += len(batch)
+                removed += batch_removed
+                freed += batch_freed
+                batch = []
+        if batch:
+            batch_removed, batch_freed = self._sweep(batch, deadline)
+            checked += len(batch)
+            removed += batch_removed
+            freed += batch_freed
+        self.stdout.write(self.style.SUCCESS(
+            f'Проверено файлов: {checked}, удалено: {removed}, '
+            f'освобождено: {freed / 1024 / 1024:.1f} МБ'
+        ))
+
+    def _walk(self):
+        """Обходит каталоги загрузок, не собирая список файлов целиком."""
+        for directory in settings.GC_MEDIA_DIRS:
+            root = os.path.join(settings.MEDIA_ROOT, directory)
+            for dirpath, _, filenames in os.walk(root):
+                for filename in filenames:
+                    yield os.path.relpath(
+                        os.path.join(dirpath, filename), settings.MEDIA_ROOT
+                    ).replace(os.sep, '/')
+
+    def _sweep(self, names, deadline):
+        referenced = storage.referenced(names)
+        removed = freed = 0
+        orphans = []
+        for name in names:
+            if name in referenced:
+                continue
+            path = os.path.join(settings.MEDIA_ROOT, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if stat.st_mtime > deadline:
+                continue
+            orphans.append(name)
+            removed += 1
+            freed += stat.st_size
+            if self.dry_run:
+                self.stdout.write(name)
+            else:
+                os.remove(path)
+        if orphans and not self.dry_run:
+            MediaFile.objects.filter(name__in=orphans).delete()
+        return removed, freed
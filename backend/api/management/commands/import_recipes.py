@@ -0,0 +1,213 @@
+import base64
+import binascii
+import hashlib
+import json
+import os
+import posixpath
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from tqdm import tqdm
+
+from api import similarity, snapshots, timeline, usage
+from api.storage import content_name, incref
+from api.models import (
+    Ingredient, ImportProgress, Recipe, IngredientAmount, User,
+    MIN_COOKING_TIME, MAX_COOKING_TIME, MIN_AMOUNT, MAX_AMOUNT
+)
+
+IMAGE_DIR = 'recipes'
+
+
+def decode_image(data, media_root):
+    """Декодирует base64-картинку и сохраняет её в MEDIA_ROOT.
+
+    Выполняется в дочернем процессе, поэтому работает с файловой
+    системой напрямую, но именует файлы так же, как
+    ContentAddressedStorage. Уже сохранённые имена файлов (например,
+    из export_recipes) принимаются, только если это нормализованный путь
+    внутри IMAGE_DIR и файл есть в MEDIA_ROOT. Для повреждённых данных и
+    прочих имён возвращает None.
+    """
+    if not data.startswith('data:'):
+        if (
+            posixpath.normpath(data) == data
+            and data.startswith(f'{IMAGE_DIR}/')
+            and os.path.isfile(os.path.join(media_root, data))
+        ):
+            return data
+        return None
+    header, _, encoded = data.partition(';base64,')
+    extension = header.rsplit('/', 1)[-1] or 'png'
+    try:
+        content = base64.b64decode(encoded, validate=True)
+    except binascii.Error:
+        return None
+    name = content_name(
+        f'{IMAGE_DIR}/image.{extension}', hashlib.sha256(content).hexdigest()
+    )
+    path = os.path.join(media_root, name)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as file:
+            file.write(content)
+    return name
+
+
+class Command(BaseCommand):
+    help = 'Пакетный импорт рецептов из NDJSON файла'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Путь к NDJSON файлу')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Количество рецептов в одной транзакции'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Количество процессов для декодирования картинок'
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Игнорировать сохранённый прогресс и начать сначала'
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'Файл {path} не найден')
+        # Прогресс хранится в базе и пишется в транзакции пачки: после
+        # падения пачка либо импортирована вместе с ним, либо нет.
+        self.source = os.path.abspath(path)
+        if options['restart']:
+            ImportProgress.objects.filter(source=self.source).delete()
+        done = ImportProgress.objects.filter(
+            source=self.source
+        ).values_list('line_number', flat=True).first() or 0
+
+        self.authors = dict(User.objects.values_list('email', 'id'))
+        self.ingredient_ids = set(
+            Ingredient.objects.values_list('id', flat=True)
+        )
+        self.ingredients = {
+            (name, unit): pk for pk, name, unit in
+            Ingredient.objects.values_list('id', 'name', 'measurement_unit')
+        }
+        self.skipped = 0
+        imported = 0
+        started = time.monotonic()
+
+        with open(path, encoding='utf-8') as file, \
+                ProcessPoolExecutor(max_workers=options['workers']) as pool, \
+                tqdm(unit='рецепт', initial=done) as progress:
+            batch = []
+            for line_number, line in enumerate(file, start=1):
+                if line_number <= done:
+                    continue
+                if line.strip():
+                    batch.append((line_number, line))
+                if len(batch) >= options['batch_size']:
+                    imported += self._import_batch(batch, pool)
+                    progress.update(len(batch))
+                    batch = []
+            if batch:
+                imported += self._import_batch(batch, pool)
+                progress.update(len(batch))
+
+        ImportProgress.objects.filter(source=self.source).delete()
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Импортировано рецептов: {imported}, пропущено: '
+            f'{self.skipped} за {elapsed:.1f} с '
+            f'({imported / elapsed if elapsed else 0:.0f} рецептов/с)'
+        ))
+
+    def _import_batch(self, batch, pool):
+        records = []
+        for line_number, line in batch:
+            record = self._parse(line_number, line)
+            if record is not None:
+                records.append(record)
+        images = pool.map(
+            decode_image,
+            [record['image'] for record in records],
+            [settings.MEDIA_ROOT] * len(records),
+            chunksize=32
+        )
+        decoded = [
+            (record, image) for record, image in zip(records, images)
+            if image is not None
+        ]
+        self.skipped += len(records) - len(decoded)
+        recipes = [
+            Recipe(
+                author_id=record['author_id'],
+                name=record['name'],
+                text=record['text'],
+                cooking_time=record['cooking_time'],
+                image=image,
+            )
+            for record, image in decoded
+        ]
+        with transaction.atomic():
+            Recipe.objects.bulk_create(recipes)
+            amounts = IngredientAmount.objects.bulk_create(
+                IngredientAmount(
+                    recipe_id=recipe.id,
+                    ingredient_id=ingredient_id,
+                    amount=amount,
+                )
+                for recipe, (record, _) in zip(recipes, decoded)
+                for ingredient_id, amount in record['ingredients']
+            )
+            usage.add(apps, [amount.ingredient_id for amount in amounts])
+            incref(recipe.image.name for recipe in recipes)
+            timeline.fan_out(recipes)
+            similarity.index_recipes([recipe.id for recipe in recipes])
+            snapshots.rebuild([recipe.id for recipe in recipes])
+            ImportProgress.objects.update_or_create(
+                source=self.source,
+                defaults={'line_number': batch[-1][0]},
+            )
+        return len(recipes)
+
+    def _parse(self, line_number, line):
+        """Проверяет запись и заменяет ссылки на id из словарей."""
+        try:
+            data = json.loads(line)
+            author_id = self.authors[data['author']]
+            cooking_time = int(data['cooking_time'])
+            if not MIN_COOKING_TIME <= cooking_time <= MAX_COOKING_TIME:
+                raise ValueError('cooking_time вне допустимого диапазона')
+            ingredients = {}
+            for item in data['ingredients']:
+                if 'name' in item:
+                    ingredient_id = self.ingredients[
+                        (item['name'], item['measurement_unit'])
+                    ]
+                elif item['id'] in self.ingredient_ids:
+                    ingredient_id = item['id']
+                else:
+                    raise KeyError(item['id'])
+                amount = int(item['amount'])
+                if not MIN_AMOUNT <= amount <= MAX_AMOUNT:
+                    raise ValueError('amount вне допустимого диапазона')
+                ingredients[ingredient_id] = amount
+            if not ingredients or not data['image']:
+                raise ValueError('нет ингредиентов или картинки')
+            return {
+                'author_id': author_id,
+                'name': data['name'][:200],
+                'text': data['text'],
+                'cooking_time': cooking_time,
+                'image': data['image'],
+                'ingredients': list(ingredients.items()),
+            }
+        except (KeyError, TypeError, ValueError) as e:
+            self.skipped += 1
+            self.stderr.write(f'Строка {line_number} пропущена: {e!r}')
+            return None
@@ -1,32 +1,68 @@
+import hashlib
 import json
 import os
 
+from django.apps import apps
 from django.core.management.base import BaseCommand
 from django.conf import settings
+from django.db.models import Exists
 
-from api.models import Ingredient
+from api import catalogue, edge_cache, units
+from api.models import Ingredient, StartupState
+
+CHECKSUM_NAME = 'ingredients'
 
 
 class Command(BaseCommand):
     help = 'Загрузка ингредиентов из JSON файла'
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Загрузить файл, даже если он не менялся'
+        )
+
     def handle(self, *args, **options):
         file_path = os.path.join(settings.BASE_DIR, 'data', 'ingredients.json')
-        
+
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                ingredients = json.load(file)
-                
-            for ingredient in ingredients:
-                Ingredient.objects.get_or_create(
-                    name=ingredient['name'],
-                    measurement_unit=ingredient['measurement_unit']
-                )
-                
+            with open(file_path, 'rb') as file:
+                content = file.read()
+            checksum = hashlib.sha256(content).hexdigest()
+            # Каталог уже загружен из этого же файла — повторная
+            # загрузка при старте контейнера не нужна. Сумма хранится
+            # в базе, поэтому ее видят все реплики.
+            if not options['force'] and StartupState.objects.filter(
+                Exists(Ingredient.objects.all()),
+                name=CHECKSUM_NAME, checksum=checksum,
+            ).exists():
+                self.stdout.write('Ингредиенты не изменились')
+                return
+            ingredients = json.loads(content)
+
+            Ingredient.objects.bulk_create(
+                (
+                    Ingredient(
+                        name=ingredient['name'],
+                        measurement_unit=ingredient['measurement_unit']
+                    )
+                    for ingredient in ingredients
+                ),
+                batch_size=1000,
+                ignore_conflicts=True,
+            )
+            units.sync_conversions(apps)
+            units.link_ingredients(apps)
+            catalogue.invalidate()
+            edge_cache.purge_later(['/api/ingredients/'])
+            StartupState.objects.update_or_create(
+                name=CHECKSUM_NAME, defaults={'checksum': checksum}
+            )
+
             self.stdout.write(
                 self.style.SUCCESS('Ингредиенты успешно загружены')
             )
-            
+
         except FileNotFoundError:
             self.stdout.write(
                 self.style.ERROR(f'Файл {file_path} не найден')
@@ -38,4 +74,4 @@ class Command(BaseCommand):
         except Exception as e:
             self.stdout.write(
                 self.style.ERROR(f'Произошла ошибка: {str(e)}')
-            ) 
\ No newline at end of file
+            )
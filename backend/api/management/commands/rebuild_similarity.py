@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand
+from tqdm import tqdm
+
+from api.models import Recipe, RecipeBucket, RecipeSignature
+from api.similarity import index_recipes
+
+
+class Command(BaseCommand):
+    help = 'Пересчёт MinHash-сигнатур и LSH-корзин всех рецептов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Количество рецептов, обрабатываемых за один раз'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        indexed = 0
+        last_id = 0
+        with tqdm(total=Recipe.objects.count(), unit='рецепт') as progress:
+            while True:
+                ids = list(Recipe.objects.filter(
+                    id__gt=last_id
+                ).order_by('id').values_list(
+                    'id', flat=True
+                )[:options['batch_size']])
+                if not ids:
+                    break
+                last_id = ids[-1]
+                # Строки пачки заменяются в одной транзакции, поэтому
+                # поиск похожих работает и во время пересчета.
+                indexed += index_recipes(ids)
+                progress.update(len(ids))
+        # Сигнатуры удаленных рецептов.
+        RecipeBucket.objects.exclude(
+            recipe__in=Recipe.objects.all()
+        ).delete()
+        RecipeSignature.objects.exclude(
+            recipe__in=Recipe.objects.all()
+        ).delete()
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано рецептов: {indexed} '
+            f'за {time.monotonic() - started:.1f} с'
+        ))
@@ -0,0 +1,98 @@
+import multiprocessing
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api import tasks, timeline
+
+
+class Command(BaseCommand):
+    help = 'Выполнение фоновых задач из очереди'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=2,
+            help='Размер пула процессов (0 — выполнять в текущем процессе)'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Сколько задач забирать и объединять за один раз'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=1,
+            help='Пауза в секундах, когда очередь пуста'
+        )
+        parser.add_argument(
+            '--burst', action='store_true',
+            help='Выполнить готовые задачи и завершиться'
+        )
+
+    def handle(self, *args, **options):
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        pool = None
+        if options['processes']:
+            # spawn вместо fork: дочерние процессы не наследуют
+            # соединения с базой и открывают собственные.
+            pool = ProcessPoolExecutor(
+                max_workers=options['processes'],
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=django.setup,
+            )
+        retention = getattr(settings, 'TASKS_RETENTION', 7 * 24 * 3600)
+        purged_at = 0
+        trim_interval = getattr(settings, 'TIMELINE_TRIM_INTERVAL', 600)
+        trimmed_at = None
+        done = failed = 0
+        try:
+            while not self.stopping:
+                if time.monotonic() - purged_at > 3600:
+                    tasks.purge(retention)
+                    purged_at = time.monotonic()
+                if (
+                    trimmed_at is None
+                    or time.monotonic() - trimmed_at > trim_interval
+                ):
+                    timeline.trim_overfull()
+                    trimmed_at = time.monotonic()
+                claimed = tasks.claim(options['batch_size'])
+                if not claimed:
+                    if options['burst']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+                calls = []
+                for group, name in tasks.plan(
+                    claimed, options['batch_size']
+                ):
+                    payloads = [item.payload for item in group]
+                    if pool is None:
+                        calls.append((group, tasks.execute(name, payloads)))
+                    else:
+                        calls.append((group, pool.submit(
+                            tasks.execute, name, payloads
+                        )))
+                for group, result in calls:
+                    error = result if pool is None else result.result()
+                    tasks.finish(group, error)
+                    if error is None:
+                        done += len(group)
+                    else:
+                        failed += len(group)
+                        self.stderr.write(
+                            f'{group[0].name}: {error.splitlines()[-1]}'
+                        )
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        self.stdout.write(self.style.SUCCESS(
+            f'Выполнено задач: {done}, с ошибкой: {failed}'
+        ))
+
+    def _stop(self, signum, frame):
+        self.stopping = True
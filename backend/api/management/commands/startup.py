@@ -0,0 +1,74 @@
+import os
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+
+from api.startup import (
+    pending_migrations, read_checksum, static_fingerprint, write_checksum
+)
+
+STATIC_FINGERPRINT_NAME = '.collectstatic.sha256'
+
+
+class Command(BaseCommand):
+    help = (
+        'Подготовка контейнера к запуску: ожидание базы, миграции, '
+        'статика и ингредиенты выполняются только при изменениях'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--db-timeout', type=float, default=60,
+            help='Максимальное время ожидания базы данных в секундах'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        self._step('Ожидание базы данных', call_command, 'wait_for_db',
+                   timeout=options['db_timeout'], stdout=self.stdout)
+        self._step('Миграции', self._migrate)
+        self._step('Статические файлы', self._collectstatic)
+        self._step('Суперпользователь', self._create_superuser)
+        self._step('Ингредиенты', call_command, 'load_ingredients',
+                   stdout=self.stdout)
+        self.stdout.write(self.style.SUCCESS(
+            f'Подготовка завершена за {time.monotonic() - started:.2f} с'
+        ))
+
+    def _step(self, title, func, *args, **kwargs):
+        started = time.monotonic()
+        func(*args, **kwargs)
+        self.stdout.write(
+            f'{title}: {(time.monotonic() - started) * 1000:.0f} мс'
+        )
+
+    def _migrate(self):
+        if not pending_migrations():
+            self.stdout.write('Новых миграций нет')
+            return
+        call_command('migrate', interactive=False, stdout=self.stdout)
+
+    def _collectstatic(self):
+        fingerprint = static_fingerprint()
+        fingerprint_path = os.path.join(
+            settings.STATIC_ROOT, STATIC_FINGERPRINT_NAME
+        )
+        if read_checksum(fingerprint_path) == fingerprint:
+            self.stdout.write('Статические файлы не изменились')
+            return
+        call_command(
+            'collectstatic', interactive=False, verbosity=0,
+            stdout=self.stdout
+        )
+        write_checksum(fingerprint_path, fingerprint)
+
+    def _create_superuser(self):
+        # createsuperuser --noinput берет данные из DJANGO_SUPERUSER_*.
+        if not os.getenv('DJANGO_SUPERUSER_EMAIL'):
+            return
+        if get_user_model().objects.filter(is_superuser=True).exists():
+            return
+        call_command('createsuperuser', interactive=False, stdout=self.stdout)
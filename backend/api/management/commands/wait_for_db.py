@@ -0,0 +1,52 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+
+
+class Command(BaseCommand):
+    help = 'Ожидание доступности базы данных с экспоненциальной задержкой'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS,
+            help='Алиас базы данных'
+        )
+        parser.add_argument(
+            '--timeout', type=float, default=60,
+            help='Максимальное время ожидания в секундах'
+        )
+        parser.add_argument(
+            '--initial-delay', type=float, default=0.1,
+            help='Задержка перед второй попыткой в секундах'
+        )
+        parser.add_argument(
+            '--max-delay', type=float, default=5,
+            help='Максимальная задержка между попытками в секундах'
+        )
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        started = time.monotonic()
+        deadline = started + options['timeout']
+        delay = options['initial_delay']
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                connection.ensure_connection()
+                break
+            except OperationalError as error:
+                connection.close()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise CommandError(
+                        f'База данных недоступна после {attempts} попыток: '
+                        f'{error}'
+                    )
+                time.sleep(min(delay, remaining))
+                delay = min(delay * 2, options['max_delay'])
+        self.stdout.write(self.style.SUCCESS(
+            f'База данных доступна через '
+            f'{time.monotonic() - started:.2f} с, попыток: {attempts}'
+        ))
@@ -0,0 +1,217 @@
+"""Промежуточные слои приложения api."""
+import gzip
+import hmac
+import random
+import re
+import tracemalloc
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.cache import patch_vary_headers
+from django.utils import timezone
+from django.utils.functional import SimpleLazyObject, empty
+
+from . import db_router
+from .models import User
+from .profiling import profiler
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = re.compile(
+    r'^(text/|application/(json|javascript|xml|.*\+json|.*\+xml))'
+)
+
+
+def parse_accept_encoding(header):
+    """Возвращает словарь «кодировка -> q» из заголовка Accept-Encoding."""
+    encodings = {}
+    for item in header.split(','):
+        name, _, params = item.strip().partition(';')
+        if not name:
+            continue
+        quality = 1.0
+        match = re.search(r'q=([0-9.]+)', params)
+        if match:
+            try:
+                quality = float(match.group(1))
+            except ValueError:
+                quality = 0.0
+        encodings[name.strip().lower()] = quality
+    return encodings
+
+
+class CompressionMiddleware:
+    """Сжатие ответов в br или gzip по заголовку Accept-Encoding.
+
+    Ответы меньше COMPRESSION_MIN_SIZE байт, потоковые ответы и
+    несжимаемые типы содержимого отдаются как есть.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', 1024)
+        self.gzip_level = getattr(settings, 'COMPRESSION_GZIP_LEVEL', 6)
+        self.brotli_quality = getattr(
+            settings, 'COMPRESSION_BROTLI_QUALITY', 4
+        )
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if (
+            response.streaming
+            or response.has_header('Content-Encoding')
+            or len(response.content) < self.min_size
+            or not COMPRESSIBLE_TYPES.match(
+                response.get('Content-Type', '')
+            )
+        ):
+            return response
+
+        encoding = self.choose_encoding(
+            request.META.get('HTTP_ACCEPT_ENCODING', '')
+        )
+        if encoding == 'br':
+            content = brotli.compress(
+                response.content, quality=self.brotli_quality
+            )
+        elif encoding == 'gzip':
+            content = gzip.compress(
+                response.content, compresslevel=self.gzip_level, mtime=0
+            )
+        else:
+            return response
+        if len(content) >= len(response.content):
+            return response
+
+        response.content = content
+        response['Content-Length'] = str(len(content))
+        response['Content-Encoding'] = encoding
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
+
+    @staticmethod
+    def choose_encoding(header):
+        accepted = parse_accept_encoding(header)
+        for encoding in ('br', 'gzip'):
+            if encoding == 'br' and brotli is None:
+                continue
+            quality = accepted.get(encoding, accepted.get('*', 0.0))
+            if quality > 0:
+                return encoding
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """Отправляет чтение безопасных запросов на реплики (см. db_router).
+
+    Должен стоять раньше слоев, читающих базу (сессии, аутентификация).
+    После записи закрепляет за основной базой и клиента (cookie), и
+    пользователя (User.primary_pinned_until): клиенты с токеном cookie
+    не хранят. Срок закрепления пользователя хранится и читается в
+    основной базе, поэтому его видят все воркеры и хосты.
+    """
+    safe_methods = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.cookie = getattr(settings, 'REPLICA_PIN_COOKIE', 'pin_primary')
+        self.pin_seconds = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+
+    @staticmethod
+    def known_user(request):
+        """Пользователь запроса или None, если он еще не определен.
+
+        Ленивого пользователя из AuthenticationMiddleware не вычисляет:
+        это само было бы чтением из базы. DRF после аутентификации
+        записывает пользователя в request, и тогда он становится известен.
+        """
+        user = request.__dict__.get('user')
+        if isinstance(user, SimpleLazyObject):
+            user = None if user._wrapped is empty else user._wrapped
+        return user
+
+    def user_pinned(self, request):
+        user = self.known_user(request)
+        if user is None:
+            return None
+        return user.is_authenticated and User._base_manager.using(
+            DEFAULT_DB_ALIAS
+        ).filter(pk=user.pk, primary_pinned_until__gt=timezone.now()).exists()
+
+    def __call__(self, request):
+        token = db_router.start_request(
+            request.method in self.safe_methods
+            and self.cookie not in request.COOKIES,
+            pinned=lambda: self.user_pinned(request)
+        )
+        try:
+            response = self.get_response(request)
+        finally:
+            wrote = db_router.finish_request(token)
+        if wrote:
+            response.set_cookie(
+                self.cookie, '1', max_age=self.pin_seconds,
+                httponly=True, samesite='Lax'
+            )
+            user = self.known_user(request)
+            if (
+                db_router.replicas()
+                and user is not None and user.is_authenticated
+            ):
+                User._base_manager.filter(pk=user.pk).update(
+                    primary_pinned_until=timezone.now() + timedelta(
+                        seconds=self.pin_seconds
+                    )
+                )
+        return response
+
+
+class ProfilingMiddleware:
+    """Профилирует часть запросов (см. api.profiling).
+
+    Без PROFILING_SAMPLE_RATE и PROFILING_TOKEN слой отключается при
+    запуске и не добавляет накладных расходов.
+    """
+
+    def __init__(self, get_response):
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 0)
+        self.token = getattr(settings, 'PROFILING_TOKEN', '')
+        if not (self.sample_rate or self.token):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.trace = getattr(settings, 'PROFILING_TRACEMALLOC', False)
+        if self.trace and not tracemalloc.is_tracing():
+            tracemalloc.start(
+                getattr(settings, 'PROFILING_TRACEMALLOC_FRAMES', 1)
+            )
+
+    def __call__(self, request):
+        if not self.should_profile(request):
+            return self.get_response(request)
+        request._profile = profiler.start(self.trace)
+        try:
+            return self.get_response(request)
+        finally:
+            profiler.finish(request._profile)
+
+    def should_profile(self, request):
+        if self.token and hmac.compare_digest(
+            request.headers.get('X-Profile', '').encode(),
+            self.token.encode()
+        ):
+            return True
+        return random.random() < self.sample_rate
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        record = getattr(request, '_profile', None)
+        if record is not None:
+            match = request.resolver_match
+            record.view = match.view_name if match else view_func.__name__
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:00
+
+from api.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY нельзя выполнять внутри транзакции.
+    atomic = False
+
+    dependencies = [
+        ('api', '0002_alter_favorite_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='recipe',
+            options={'ordering': ['-pub_date', 'id'], 'verbose_name': 'Рецепт', 'verbose_name_plural': 'Рецепты'},
+        ),
+        AddIndexConcurrently(
+            model_name='ingredientamount',
+            index=models.Index(fields=['recipe'], include=('ingredient', 'amount'), name='ingredient_amount_recipe_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-pub_date'], name='recipe_author_pub_date_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='recipe',
+            index=models.Index(fields=['-pub_date', 'id'], name='recipe_pub_date_id_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='subscription',
+            index=models.Index(fields=['author'], include=('user',), name='subscription_author_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:40
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_task'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Дата изменения'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='shopping_cart_version',
+            field=models.PositiveIntegerField(default=0, verbose_name='Версия списка покупок'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='shopping_cart_updated_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Дата изменения списка покупок'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='Дата изменения'),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_versions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeSnapshot',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='snapshot', serialize=False, to='api.recipe', verbose_name='Рецепт')),
+                ('data', models.JSONField(verbose_name='Данные')),
+                ('recipe_updated_at', models.DateTimeField(verbose_name='Версия рецепта')),
+                ('author_updated_at', models.DateTimeField(verbose_name='Версия автора')),
+            ],
+            options={
+                'verbose_name': 'Снимок рецепта',
+                'verbose_name_plural': 'Снимки рецептов',
+            },
+        ),
+    ]
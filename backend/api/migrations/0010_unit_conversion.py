@@ -0,0 +1,59 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from api.units import link_ingredients, sync_conversions
+
+
+def link_catalogue(apps, schema_editor):
+    sync_conversions(apps)
+    link_ingredients(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_recipe_snapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CanonicalIngredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=200, unique=True, verbose_name='Нормализованное название')),
+                ('name', models.CharField(max_length=200, verbose_name='Название')),
+            ],
+            options={
+                'verbose_name': 'Канонический ингредиент',
+                'verbose_name_plural': 'Канонические ингредиенты',
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='UnitConversion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('unit', models.CharField(max_length=200, unique=True, verbose_name='Единица измерения')),
+                ('base_unit', models.CharField(max_length=200, verbose_name='Базовая единица')),
+                ('factor', models.PositiveIntegerField(verbose_name='Множитель')),
+            ],
+            options={
+                'verbose_name': 'Перевод единиц',
+                'verbose_name_plural': 'Переводы единиц',
+                'ordering': ['unit'],
+            },
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='canonical',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ingredients', to='api.canonicalingredient', verbose_name='Канонический ингредиент'),
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='conversion',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ingredients', to='api.unitconversion', verbose_name='Перевод единиц'),
+        ),
+        migrations.RunPython(link_catalogue, migrations.RunPython.noop),
+    ]
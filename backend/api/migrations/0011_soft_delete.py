@@ -0,0 +1,51 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:39
+
+import api.models
+import django.contrib.auth.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_unit_conversion'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Deletion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('user', 'Пользователь'), ('recipe', 'Рецепт')], max_length=10, verbose_name='Что удаляется')),
+                ('object_id', models.BigIntegerField(verbose_name='ID объекта')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('running', 'Выполняется'), ('done', 'Завершено')], default='pending', max_length=10, verbose_name='Статус')),
+                ('recipes_total', models.PositiveIntegerField(default=0, verbose_name='Рецептов к удалению')),
+                ('recipes_deleted', models.PositiveIntegerField(default=0, verbose_name='Удалено рецептов')),
+                ('rows_deleted', models.PositiveIntegerField(default=0, verbose_name='Удалено строк')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Завершено')),
+            ],
+            options={
+                'verbose_name': 'Удаление',
+                'verbose_name_plural': 'Удаления',
+                'ordering': ['-id'],
+            },
+        ),
+        migrations.AlterModelManagers(
+            name='user',
+            managers=[
+                ('objects', api.models.ActiveUserManager()),
+                ('all_objects', django.contrib.auth.models.UserManager()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Дата удаления'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Дата удаления'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:43
+
+from django.db import migrations, models
+
+from api.usage import recount
+
+
+def count_usage(apps, schema_editor):
+    recount(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_soft_delete'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Используется в рецептах'),
+        ),
+        migrations.RunPython(count_usage, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:20
+
+from django.db import migrations
+
+from api.storage import recount
+
+
+def count_references(apps, schema_editor):
+    recount(apps)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_ingredient_usage'),
+    ]
+
+    operations = [
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
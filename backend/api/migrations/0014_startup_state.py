@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-19 08:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_mediafile_backfill'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StartupState',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='Шаг')),
+                ('checksum', models.CharField(max_length=64, verbose_name='Контрольная сумма')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'Состояние запуска',
+                'verbose_name_plural': 'Состояния запуска',
+                'ordering': ['name'],
+            },
+        ),
+    ]
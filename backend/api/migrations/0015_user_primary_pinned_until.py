@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-19 09:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_startup_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='primary_pinned_until',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Чтение с основной базы до'),
+        ),
+    ]
@@ -1,7 +1,8 @@
 from django.db import models
-from django.contrib.auth.models import AbstractUser
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.conf import settings
+from django.utils import timezone
 
 
 MIN_COOKING_TIME = 1
@@ -10,6 +11,20 @@ MIN_AMOUNT = 1
 MAX_AMOUNT = 32000
 
 
+class ActiveManager(models.Manager):
+    """Менеджер без удаленных объектов (см. api/deletion.py)."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
+class ActiveUserManager(UserManager):
+    """Менеджер пользователей без удаленных (см. api/deletion.py)."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class User(AbstractUser):
     """Модель пользователя."""
     email = models.EmailField(
@@ -36,6 +51,33 @@ class User(AbstractUser):
         null=True,
         blank=True
     )
+    updated_at = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True,
+    )
+    shopping_cart_version = models.PositiveIntegerField(
+        'Версия списка покупок',
+        default=0,
+    )
+    shopping_cart_updated_at = models.DateTimeField(
+        'Дата изменения списка покупок',
+        null=True,
+        blank=True,
+    )
+    deleted_at = models.DateTimeField(
+        'Дата удаления',
+        null=True,
+        blank=True,
+    )
+    primary_pinned_until = models.DateTimeField(
+        'Чтение с основной базы до',
+        null=True,
+        blank=True,
+        editable=False,
+    )
+
+    objects = ActiveUserManager()
+    all_objects = UserManager()
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name']
@@ -49,6 +91,51 @@ class User(AbstractUser):
         return self.email
 
 
+class CanonicalIngredient(models.Model):
+    """Модель ингредиента, общего для вариантов написания названия."""
+    key = models.CharField(
+        'Нормализованное название',
+        max_length=200,
+        unique=True,
+    )
+    name = models.CharField(
+        'Название',
+        max_length=200,
+    )
+
+    class Meta:
+        verbose_name = 'Канонический ингредиент'
+        verbose_name_plural = 'Канонические ингредиенты'
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
+class UnitConversion(models.Model):
+    """Модель перевода единицы измерения в базовую."""
+    unit = models.CharField(
+        'Единица измерения',
+        max_length=200,
+        unique=True,
+    )
+    base_unit = models.CharField(
+        'Базовая единица',
+        max_length=200,
+    )
+    factor = models.PositiveIntegerField(
+        'Множитель',
+    )
+
+    class Meta:
+        verbose_name = 'Перевод единиц'
+        verbose_name_plural = 'Переводы единиц'
+        ordering = ['unit']
+
+    def __str__(self):
+        return f'1 {self.unit} = {self.factor} {self.base_unit}'
+
+
 class Ingredient(models.Model):
     """Модель ингредиента."""
     name = models.CharField(
@@ -59,6 +146,27 @@ class Ingredient(models.Model):
         'Единица измерения',
         max_length=200,
     )
+    canonical = models.ForeignKey(
+        CanonicalIngredient,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='ingredients',
+        verbose_name='Канонический ингредиент',
+    )
+    conversion = models.ForeignKey(
+        UnitConversion,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='ingredients',
+        verbose_name='Перевод единиц',
+    )
+    recipes_count = models.PositiveIntegerField(
+        'Используется в рецептах',
+        default=0,
+        editable=False,
+    )
 
     class Meta:
         verbose_name = 'Ингредиент'
@@ -110,11 +218,33 @@ class Recipe(models.Model):
         'Дата публикации',
         auto_now_add=True,
     )
+    updated_at = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True,
+    )
+    deleted_at = models.DateTimeField(
+        'Дата удаления',
+        null=True,
+        blank=True,
+    )
+
+    objects = ActiveManager()
+    all_objects = models.Manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
-        ordering = ['-pub_date']
+        ordering = ['-pub_date', 'id']
+        indexes = [
+            models.Index(
+                fields=['author', '-pub_date'],
+                name='recipe_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['-pub_date', 'id'],
+                name='recipe_pub_date_id_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -152,6 +282,13 @@ class IngredientAmount(models.Model):
                 name='unique_ingredient_amount'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['recipe'],
+                include=['ingredient', 'amount'],
+                name='ingredient_amount_recipe_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.ingredient.name} - {self.amount} {self.ingredient.measurement_unit}'
@@ -182,6 +319,13 @@ class Subscription(models.Model):
                 name='unique_subscription'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['author'],
+                include=['user'],
+                name='subscription_author_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.user.username} подписан на {self.author.username}'
@@ -245,3 +389,329 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.user.username} добавил {self.recipe.name} в список покупок'
+
+
+class TimelineEntry(models.Model):
+    """Модель записи ленты рецептов от авторов из подписок."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Пользователь',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Рецепт',
+    )
+    pub_date = models.DateTimeField(
+        'Дата публикации рецепта',
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        ordering = ['-pub_date', '-recipe']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_timeline_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='timeline_user_pub_date_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe_id} в ленте {self.user_id}'
+
+
+class RecipeSignature(models.Model):
+    """Модель MinHash-сигнатуры набора ингредиентов рецепта."""
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='signature',
+        verbose_name='Рецепт',
+    )
+    signature = models.BinaryField(
+        'Сигнатура',
+    )
+
+    class Meta:
+        verbose_name = 'Сигнатура рецепта'
+        verbose_name_plural = 'Сигнатуры рецептов'
+
+    def __str__(self):
+        return f'Сигнатура рецепта {self.recipe_id}'
+
+
+class RecipeBucket(models.Model):
+    """Модель LSH-корзины, в которую попадает рецепт."""
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='buckets',
+        verbose_name='Рецепт',
+    )
+    key = models.BigIntegerField(
+        'Ключ корзины',
+        db_index=True,
+    )
+
+    class Meta:
+        verbose_name = 'Корзина LSH'
+        verbose_name_plural = 'Корзины LSH'
+        ordering = ['id']
+
+    def __str__(self):
+        return f'{self.recipe_id} в корзине {self.key}'
+
+
+class RecipeSnapshot(models.Model):
+    """Модель сохраненных блоков автора и ингредиентов рецепта."""
+    recipe = models.OneToOneField(
+        Recipe,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='snapshot',
+        verbose_name='Рецепт',
+    )
+    data = models.JSONField(
+        'Данные',
+    )
+    recipe_updated_at = models.DateTimeField(
+        'Версия рецепта',
+    )
+    author_updated_at = models.DateTimeField(
+        'Версия автора',
+    )
+
+    class Meta:
+        verbose_name = 'Снимок рецепта'
+        verbose_name_plural = 'Снимки рецептов'
+
+    def __str__(self):
+        return f'Снимок рецепта {self.recipe_id}'
+
+
+class MediaFile(models.Model):
+    """Модель учёта ссылок на файл в хранилище медиа."""
+    name = models.CharField(
+        'Имя файла',
+        max_length=255,
+        unique=True,
+    )
+    ref_count = models.IntegerField(
+        'Количество ссылок',
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = 'Медиафайл'
+        verbose_name_plural = 'Медиафайлы'
+        ordering = ['id']
+
+    def __str__(self):
+        return f'{self.name} ({self.ref_count})'
+
+
+class Task(models.Model):
+    """Модель фоновой задачи (см. api/tasks.py)."""
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, 'Ожидает'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Выполнена'),
+        (FAILED, 'Ошибка'),
+    )
+
+    name = models.CharField(
+        'Задача',
+        max_length=200,
+    )
+    payload = models.JSONField(
+        'Параметры',
+        default=dict,
+    )
+    idempotency_key = models.CharField(
+        'Ключ идемпотентности',
+        max_length=255,
+        unique=True,
+        null=True,
+        blank=True,
+    )
+    status = models.CharField(
+        'Статус',
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+    )
+    attempts = models.PositiveSmallIntegerField(
+        'Попыток',
+        default=0,
+    )
+    run_after = models.DateTimeField(
+        'Выполнить после',
+        default=timezone.now,
+    )
+    locked_until = models.DateTimeField(
+        'Занята до',
+        null=True,
+        blank=True,
+    )
+    last_error = models.TextField(
+        'Последняя ошибка',
+        blank=True,
+    )
+    created_at = models.DateTimeField(
+        'Создана',
+        auto_now_add=True,
+    )
+    updated_at = models.DateTimeField(
+        'Изменена',
+        auto_now=True,
+    )
+
+    class Meta:
+        verbose_name = 'Фоновая задача'
+        verbose_name_plural = 'Фоновые задачи'
+        ordering = ['run_after', 'id']
+        indexes = [
+            models.Index(
+                fields=['run_after', 'id'],
+                condition=models.Q(status='pending'),
+                name='task_pending_idx'
+            ),
+            models.Index(
+                fields=['locked_until'],
+                condition=models.Q(status='running'),
+                name='task_running_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.name} #{self.id} ({self.status})'
+
+
+class Deletion(models.Model):
+    """Модель фонового удаления пользователя или рецепта."""
+    USER = 'user'
+    RECIPE = 'recipe'
+    KIND_CHOICES = (
+        (USER, 'Пользователь'),
+        (RECIPE, 'Рецепт'),
+    )
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    STATUS_CHOICES = (
+        (PENDING, 'В очереди'),
+        (RUNNING, 'Выполняется'),
+        (DONE, 'Завершено'),
+    )
+
+    kind = models.CharField(
+        'Что удаляется',
+        max_length=10,
+        choices=KIND_CHOICES,
+    )
+    object_id = models.BigIntegerField(
+        'ID объекта',
+    )
+    status = models.CharField(
+        'Статус',
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=PENDING,
+    )
+    recipes_total = models.PositiveIntegerField(
+        'Рецептов к удалению',
+        default=0,
+    )
+    recipes_deleted = models.PositiveIntegerField(
+        'Удалено рецептов',
+        default=0,
+    )
+    rows_deleted = models.PositiveIntegerField(
+        'Удалено строк',
+        default=0,
+    )
+    created_at = models.DateTimeField(
+        'Создано',
+        auto_now_add=True,
+    )
+    finished_at = models.DateTimeField(
+        'Завершено',
+        null=True,
+        blank=True,
+    )
+
+    class Meta:
+        verbose_name = 'Удаление'
+        verbose_name_plural = 'Удаления'
+        ordering = ['-id']
+
+    def __str__(self):
+        return (
+            f'{self.get_kind_display()} {self.object_id}: '
+            f'{self.recipes_deleted}/{self.recipes_total}'
+        )
+
+
+class StartupState(models.Model):
+    """Контрольная сумма шага запуска, общая для всех реплик."""
+    name = models.CharField(
+        'Шаг',
+        max_length=100,
+        unique=True,
+    )
+    checksum = models.CharField(
+        'Контрольная сумма',
+        max_length=64,
+    )
+    updated_at = models.DateTimeField(
+        'Обновлено',
+        auto_now=True,
+    )
+
+    class Meta:
+        verbose_name = 'Состояние запуска'
+        verbose_name_plural = 'Состояния запуска'
+        ordering = ['name']
+
+    def __str__(self):
+        return self.name
+
+
+class ImportProgress(models.Model):
+    """Прогресс пакетного импорта рецептов из файла."""
+    source = models.CharField(
+        'Файл',
+        max_length=500,
+        unique=True,
+    )
+    line_number = models.PositiveIntegerField(
+        'Обработано строк',
+        default=0,
+    )
+    updated_at = models.DateTimeField(
+        'Обновлено',
+        auto_now=True,
+    )
+
+    class Meta:
+        verbose_name = 'Прогресс импорта'
+        verbose_name_plural = 'Прогресс импорта'
+        ordering = ['source']
+
+    def __str__(self):
+        return f'{self.source}: {self.line_number}'
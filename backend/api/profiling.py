@@ -0,0 +1,161 @@
+"""Профилирование запросов в работающем воркере.
+
+Включается настройками и по умолчанию выключено: без них
+ProfilingMiddleware убирается из цепочки при запуске.
+
+- PROFILING_SAMPLE_RATE — доля запросов, для которых собираются стеки.
+  Запрос с заголовком X-Profile, равным PROFILING_TOKEN, профилируется
+  всегда.
+- Стеки снимает фоновый поток раз в PROFILING_INTERVAL секунд через
+  sys._current_frames() и копит их по представлениям в формате
+  «свернутых» стеков (flamegraph.pl, speedscope).
+- При PROFILING_TRACEMALLOC для отобранных запросов сравниваются
+  снимки tracemalloc до и после запроса, а самые крупные выделения
+  памяти суммируются по представлениям. Снимки охватывают весь процесс
+  (tracemalloc не различает потоки), поэтому точны только в воркерах,
+  которые обрабатывают по одному запросу за раз (sync). В воркерах с
+  потоками или gevent к запросу примешиваются выделения соседних.
+
+Данные хранятся в памяти процесса: каждый воркер gunicorn копит и
+отдает свои. Стеки снимаются с потоков, поэтому в воркерах gevent
+вместо отдельных запросов видна только петля событий.
+"""
+import sys
+import threading
+import tracemalloc
+from collections import Counter, defaultdict
+
+from django.conf import settings
+
+OTHER_STACKS = '[other]'
+
+
+def fold(frame):
+    """Стек кадра в виде «модуль:функция;…» от внешнего вызова."""
+    names = []
+    while frame is not None:
+        names.append('{}:{}'.format(
+            frame.f_globals.get('__name__', '?'), frame.f_code.co_name
+        ))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class Record:
+    """Профиль одного запроса."""
+
+    def __init__(self, trace):
+        self.view = None
+        self.samples = Counter()
+        self.snapshot = tracemalloc.take_snapshot() if trace else None
+
+
+class Profiler:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = {}
+        self.thread = None
+        self.stopped = threading.Event()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = Counter()
+            self.stacks = defaultdict(Counter)
+            self.allocations = defaultdict(Counter)
+            self.allocation_counts = defaultdict(Counter)
+
+    def start(self, trace=False):
+        """Начинает профилирование запроса в текущем потоке."""
+        self.ensure_sampler()
+        record = Record(trace)
+        self.active[threading.get_ident()] = record
+        return record
+
+    def finish(self, record):
+        self.active.pop(threading.get_ident(), None)
+        view = record.view or '[unresolved]'
+        if record.snapshot is not None:
+            self.add_allocations(view, record.snapshot)
+        max_stacks = getattr(settings, 'PROFILING_MAX_STACKS', 5000)
+        with self.lock:
+            self.requests[view] += 1
+            stacks = self.stacks[view]
+            for stack, count in record.samples.items():
+                if stack not in stacks and len(stacks) >= max_stacks:
+                    stack = OTHER_STACKS
+                stacks[stack] += count
+
+    def add_allocations(self, view, before):
+        """Добавляет к view разницу снимков памяти всего процесса."""
+        after = tracemalloc.take_snapshot().filter_traces([
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ])
+        top = getattr(settings, 'PROFILING_TOP_ALLOCATIONS', 20)
+        stats = after.compare_to(before, 'lineno')
+        with self.lock:
+            for stat in stats[:top]:
+                if stat.size_diff <= 0:
+                    continue
+                location = str(stat.traceback[0])
+                self.allocations[view][location] += stat.size_diff
+                self.allocation_counts[view][location] += stat.count_diff
+
+    def ensure_sampler(self):
+        if self.thread is None or not self.thread.is_alive():
+            with self.lock:
+                if self.thread is None or not self.thread.is_alive():
+                    self.thread = threading.Thread(
+                        target=self.run, name='profiling-sampler',
+                        daemon=True
+                    )
+                    self.thread.start()
+
+    def run(self):
+        interval = getattr(settings, 'PROFILING_INTERVAL', 0.005)
+        while not self.stopped.wait(interval):
+            self.sample()
+
+    def sample(self):
+        """Снимает стеки всех профилируемых потоков."""
+        if not self.active:
+            return
+        frames = sys._current_frames()
+        for ident, record in list(self.active.items()):
+            frame = frames.get(ident)
+            if frame is not None:
+                record.samples[fold(frame)] += 1
+
+    def folded(self, view):
+        """Стеки представления в формате «стек количество»."""
+        with self.lock:
+            stacks = sorted(self.stacks.get(view, {}).items())
+        return ''.join(f'{stack} {count}\n' for stack, count in stacks)
+
+    def summary(self):
+        with self.lock:
+            return {
+                view: {
+                    'requests': count,
+                    'samples': sum(self.stacks[view].values()),
+                }
+                for view, count in self.requests.items()
+            }
+
+    def top_allocations(self, limit):
+        with self.lock:
+            return {
+                view: [
+                    {
+                        'location': location,
+                        'size': size,
+                        'count': self.allocation_counts[view][location],
+                    }
+                    for location, size in sizes.most_common(limit)
+                ]
+                for view, sizes in self.allocations.items()
+            }
+
+
+profiler = Profiler()
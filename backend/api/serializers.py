@@ -1,5 +1,7 @@
 from rest_framework import serializers
+from django.apps import apps
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from drf_extra_fields.fields import Base64ImageField
@@ -10,6 +12,7 @@ from .models import (
     Ingredient, Recipe, IngredientAmount,
     Subscription, Favorite, ShoppingCart
 )
+from . import tasks, usage
 
 User = get_user_model()
 
@@ -50,24 +53,114 @@ class CustomUserCreateSerializer(UserCreateSerializer):
         return user
 
 
-class CustomUserSerializer(UserSerializer):
+def parse_sparse_fields(request):
+    """Разбор параметров ?fields= и ?expand= запроса.
+
+    Возвращает пару (fields, expand): fields — словарь «поле -> множество
+    вложенных полей» или None, если параметр fields не передан.
+    """
+    if request is None:
+        return None, set()
+    expand = {
+        name.strip()
+        for name in request.query_params.get('expand', '').split(',')
+        if name.strip()
+    }
+    raw_fields = request.query_params.get('fields')
+    if not raw_fields:
+        return None, expand
+    fields = {}
+    for path in raw_fields.split(','):
+        name, _, subfield = path.strip().partition('.')
+        if not name:
+            continue
+        subfields = fields.setdefault(name, set())
+        if subfield:
+            subfields.add(subfield)
+    return fields, expand
+
+
+class SparseFieldsMixin:
+    """Оставляет в ответе только поля, запрошенные через ?fields=.
+
+    Вложенные объекты из compact_fields без ?expand= заменяются
+    компактным представлением. Поля из optional_fields выводятся, только
+    если запрошены в ?fields= или ?expand=.
+    """
+    selected_fields = None
+    compact_fields = {}
+    optional_fields = ()
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selected, expand = self._get_selection()
+        for name in self.optional_fields:
+            if name not in expand and name not in (selected or ()):
+                del fields[name]
+        if selected is None:
+            return fields
+        for name in list(fields):
+            if name not in selected:
+                del fields[name]
+            elif selected[name]:
+                field = fields[name]
+                getattr(field, 'child', field).selected_fields = {
+                    subfield: set() for subfield in selected[name]
+                }
+            elif name in self.compact_fields and name not in expand:
+                fields[name] = self.compact_fields[name]()
+        return fields
+
+    def _get_selection(self):
+        if self.selected_fields is not None:
+            return self.selected_fields, set()
+        root = self.root
+        is_root = self is root or (
+            isinstance(root, serializers.ListSerializer)
+            and self.parent is root
+        )
+        if not is_root:
+            return None, set()
+        return parse_sparse_fields(self.context.get('request'))
+
+
+class CustomUserSerializer(SparseFieldsMixin, UserSerializer):
     """Сериализатор пользователя."""
     is_subscribed = serializers.SerializerMethodField()
     avatar = serializers.ImageField(read_only=True)
+    recipes_count = serializers.SerializerMethodField()
+    followers_count = serializers.SerializerMethodField()
+    optional_fields = ('recipes_count', 'followers_count')
 
     class Meta:
         model = User
         fields = (
             'email', 'id', 'username', 'first_name',
-            'last_name', 'is_subscribed', 'avatar'
+            'last_name', 'is_subscribed', 'avatar',
+            'recipes_count', 'followers_count'
         )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
+        # На себя подписаться нельзя, запрос не нужен.
+        if request.user.pk == obj.pk:
+            return False
         return obj.following.filter(user=request.user).exists()
 
+    def get_recipes_count(self, obj):
+        if hasattr(obj, 'recipes_count'):
+            return obj.recipes_count
+        return obj.recipes.count()
+
+    def get_followers_count(self, obj):
+        if hasattr(obj, 'followers_count'):
+            return obj.followers_count
+        return obj.following.count()
+
 
 class IngredientSerializer(serializers.ModelSerializer):
     """Сериализатор ингредиента."""
@@ -89,8 +182,23 @@ class IngredientAmountSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
-class RecipeSerializer(serializers.ModelSerializer):
+class IngredientAmountCompactSerializer(serializers.ModelSerializer):
+    """Компактный сериализатор количества ингредиента."""
+    id = serializers.ReadOnlyField(source='ingredient_id')
+
+    class Meta:
+        model = IngredientAmount
+        fields = ('id', 'amount')
+
+
+class RecipeSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     """Сериализатор рецепта."""
+    compact_fields = {
+        'author': lambda: serializers.PrimaryKeyRelatedField(read_only=True),
+        'ingredients': lambda: IngredientAmountCompactSerializer(
+            source='ingredient_amounts', many=True, read_only=True
+        ),
+    }
     author = CustomUserSerializer(read_only=True)
     ingredients = IngredientAmountSerializer(
         source='ingredient_amounts',
@@ -110,12 +218,16 @@ class RecipeSerializer(serializers.ModelSerializer):
         )
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
         return obj.favorites.filter(user=request.user).exists()
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         if request is None or request.user.is_anonymous:
             return False
@@ -174,12 +286,17 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
                 )
         return value
 
+    # Рецепт и его ингредиенты пишутся в одной транзакции: задачи,
+    # поставленные сигналами (снимок, лента), станут видны воркеру
+    # только вместе с ингредиентами.
+    @transaction.atomic
     def create(self, validated_data):
         ingredients_data = validated_data.pop('ingredients')
         recipe = Recipe.objects.create(**validated_data)
         self._create_ingredients(recipe, ingredients_data)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         if self.context['request'].method == 'PATCH' and 'ingredients' not in validated_data:
             raise serializers.ValidationError(
@@ -188,6 +305,7 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             
         if 'ingredients' in validated_data:
             ingredients_data = validated_data.pop('ingredients')
+            usage.remove(apps, instance.ingredient_amounts.all())
             instance.ingredients.clear()
             self._create_ingredients(instance, ingredients_data)
         return super().update(instance, validated_data)
@@ -204,6 +322,12 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
                 )
             )
         IngredientAmount.objects.bulk_create(ingredients_to_create)
+        usage.add(apps, [
+            amount.ingredient_id for amount in ingredients_to_create
+        ])
+        tasks.enqueue(
+            'similarity.index_recipes', {'recipe_ids': [recipe.id]}
+        )
 
     def to_representation(self, instance):
         return RecipeSerializer(instance, context=self.context).data
@@ -285,26 +409,33 @@ class TokenCreateSerializer(serializers.Serializer):
     def validate(self, data):
         email = data.get('email')
         password = data.get('password')
-        
+
         if not email or not password:
             raise serializers.ValidationError(
                 {'detail': 'Необходимо указать email и пароль'}
             )
-            
-        user = User.objects.filter(email=email).first()
-        
+
+        # Пользователь и его токен читаются одним запросом (LEFT JOIN).
+        user = User.objects.select_related(
+            'auth_token'
+        ).filter(email=email).first()
+
         if not user:
             raise serializers.ValidationError(
                 {'detail': 'Пользователь с таким email не найден'}
             )
-            
+
+        # При устаревшем хешере или стоимости хеш пересчитывается здесь же.
         if not user.check_password(password):
             raise serializers.ValidationError(
                 {'detail': 'Неверный пароль'}
             )
-            
+
         self.user = user
-        token, _ = Token.objects.get_or_create(user=user)
+        try:
+            token = user.auth_token
+        except Token.DoesNotExist:
+            token, _ = Token.objects.get_or_create(user=user)
         return {'auth_token': token.key}
 
 
@@ -0,0 +1,145 @@
+"""Обработчики сигналов моделей api."""
+from django.apps import apps
+from django.db.models import F
+from django.db.models.signals import (
+    post_delete, post_init, post_save, pre_delete
+)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import catalogue, edge_cache, tasks, units, usage
+from .models import (
+    CanonicalIngredient, Ingredient, IngredientAmount, Recipe, ShoppingCart,
+    UnitConversion, User
+)
+from .storage import decref, incref
+
+# Поля пользователя, которые попадают в снимки его рецептов
+SNAPSHOT_USER_FIELDS = {
+    'email', 'username', 'first_name', 'last_name', 'avatar'
+}
+
+FILE_FIELDS = {
+    Recipe: 'image',
+    User: 'avatar',
+}
+
+
+@receiver(post_init, sender=Recipe)
+@receiver(post_init, sender=User)
+def remember_file_name(sender, instance, **kwargs):
+    """Запоминает имя файла, чтобы заметить его замену при сохранении."""
+    field = FILE_FIELDS[sender]
+    if field in instance.__dict__:
+        instance._original_file_name = getattr(instance, field).name
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=User)
+def update_file_references(sender, instance, created, update_fields,
+                           **kwargs):
+    field = FILE_FIELDS[sender]
+    if update_fields is not None and field not in update_fields:
+        return
+    if not created and not hasattr(instance, '_original_file_name'):
+        return
+    name = getattr(instance, field).name
+    original = None if created else instance._original_file_name
+    if name != original:
+        incref([name])
+        decref([original])
+    instance._original_file_name = name
+
+
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=User)
+def release_file_reference(sender, instance, **kwargs):
+    decref([getattr(instance, FILE_FIELDS[sender]).name])
+
+
+@receiver(post_save, sender=IngredientAmount)
+def count_ingredient_usage(sender, instance, created, **kwargs):
+    """Учитывает ингредиент, добавленный в рецепт без bulk_create."""
+    if created:
+        usage.add(apps, [instance.ingredient_id])
+
+
+@receiver(pre_delete, sender=Recipe)
+def forget_ingredient_usage(sender, instance, **kwargs):
+    """Уменьшает счетчики ингредиентов, строки которых удалит каскад."""
+    usage.remove(apps, instance.ingredient_amounts.all())
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def invalidate_catalogue(sender, instance, **kwargs):
+    catalogue.invalidate()
+    edge_cache.purge_later(
+        ['/api/ingredients/', f'/api/ingredients/{instance.id}/']
+    )
+
+
+@receiver(post_save, sender=CanonicalIngredient)
+@receiver(post_save, sender=UnitConversion)
+@receiver(pre_delete, sender=CanonicalIngredient)
+@receiver(pre_delete, sender=UnitConversion)
+def bump_regrouped_shopping_carts(sender, instance, **kwargs):
+    """Название или множитель меняют группировку списка покупок.
+
+    При удалении срабатывает до того, как связи ингредиентов обнулятся.
+    """
+    if kwargs.get('created'):
+        return
+    units.bump_shopping_carts(apps, instance.ingredients.values('id'))
+
+
+@receiver(post_save, sender=Ingredient)
+def link_ingredient(sender, instance, **kwargs):
+    """Связывает новый или переименованный ингредиент с каноническим."""
+    units.link_ingredients(apps, [instance.id])
+
+
+@receiver(post_save, sender=Ingredient)
+def touch_recipes(sender, instance, created, **kwargs):
+    """Меняет версию рецептов, в которых показывается ингредиент."""
+    if not created:
+        Recipe.objects.filter(ingredients=instance).update(
+            updated_at=timezone.now()
+        )
+        tasks.enqueue('snapshots.rebuild', {'ingredient_ids': [instance.id]})
+
+
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+def bump_shopping_cart_version(sender, instance, **kwargs):
+    User.objects.filter(pk=instance.user_id).update(
+        shopping_cart_version=F('shopping_cart_version') + 1,
+        shopping_cart_updated_at=timezone.now(),
+    )
+
+
+@receiver(post_save, sender=Recipe)
+def rebuild_recipe_snapshot(sender, instance, **kwargs):
+    # Сериализатор рецепта пишет ингредиенты в той же транзакции,
+    # поэтому воркер увидит задачу только вместе с ними.
+    tasks.enqueue('snapshots.rebuild', {'recipe_ids': [instance.id]})
+
+
+@receiver(post_save, sender=User)
+def rebuild_author_snapshots(sender, instance, created, update_fields,
+                             **kwargs):
+    if created or (
+        update_fields is not None
+        and not SNAPSHOT_USER_FIELDS & set(update_fields)
+    ):
+        return
+    if Recipe.objects.filter(author=instance).exists():
+        tasks.enqueue('snapshots.rebuild', {'author_ids': [instance.id]})
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def purge_recipe_pages(sender, instance, **kwargs):
+    edge_cache.purge_later(
+        ['/api/recipes/', f'/api/recipes/{instance.id}/']
+    )
@@ -0,0 +1,118 @@
+"""Поиск похожих рецептов по MinHash-сигнатурам наборов ингредиентов.
+
+Сигнатура рецепта — NUM_PERM минимумов хеш-функций вида
+(a * x + b) mod P по id его ингредиентов. Сигнатура режется на BANDS
+полос по ROWS значений, и каждая полоса даёт ключ LSH-корзины. Кандидаты
+в похожие — рецепты, совпавшие с исходным хотя бы в одной корзине, так
+что поиск никогда не сравнивает рецепт со всеми остальными.
+"""
+import numpy as np
+from django.db import transaction
+from django.db.models import Count
+
+from .models import IngredientAmount, RecipeBucket, RecipeSignature
+
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+PRIME = (1 << 31) - 1
+SEED = 20240601
+MAX_CANDIDATES = 1000
+
+_random = np.random.RandomState(SEED)
+HASH_A = _random.randint(1, PRIME, size=NUM_PERM, dtype=np.int64)
+HASH_B = _random.randint(0, PRIME, size=NUM_PERM, dtype=np.int64)
+BAND_MULTIPLIER = np.uint64(0x100000001B3)
+BAND_OFFSETS = (
+    np.arange(BANDS, dtype=np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+)
+
+
+def compute_signatures(recipe_ids, ingredient_ids):
+    """Считает сигнатуры для пар (recipe_id, ingredient_id).
+
+    Пары должны быть отсортированы по recipe_id. Возвращает массив
+    id рецептов и матрицу сигнатур формы (рецепты, NUM_PERM).
+    """
+    recipe_ids = np.asarray(recipe_ids, dtype=np.int64)
+    ingredient_ids = np.asarray(ingredient_ids, dtype=np.int64)
+    if not len(recipe_ids):
+        return recipe_ids, np.empty((0, NUM_PERM), dtype=np.int64)
+    hashes = (ingredient_ids[:, None] * HASH_A + HASH_B) % PRIME
+    starts = np.flatnonzero(np.r_[True, recipe_ids[1:] != recipe_ids[:-1]])
+    return recipe_ids[starts], np.minimum.reduceat(hashes, starts, axis=0)
+
+
+def band_keys(signatures):
+    """Ключи LSH-корзин формы (рецепты, BANDS) для матрицы сигнатур."""
+    bands = signatures.astype(np.uint64).reshape(-1, BANDS, ROWS)
+    keys = np.zeros(bands.shape[:2], dtype=np.uint64)
+    with np.errstate(over='ignore'):
+        for row in range(ROWS):
+            keys = keys * BAND_MULTIPLIER + bands[:, :, row]
+        keys = keys ^ BAND_OFFSETS
+    return keys.view(np.int64)
+
+
+def index_recipes(recipe_ids):
+    """Пересчитывает сигнатуры и корзины для указанных рецептов.
+
+    Возвращает число рецептов, получивших сигнатуру.
+    """
+    pairs = IngredientAmount.objects.filter(
+        recipe_id__in=recipe_ids
+    ).order_by('recipe_id').values_list('recipe_id', 'ingredient_id')
+    pairs = np.array(list(pairs), dtype=np.int64).reshape(-1, 2)
+    ids, signatures = compute_signatures(pairs[:, 0], pairs[:, 1])
+    with transaction.atomic():
+        RecipeSignature.objects.filter(recipe_id__in=recipe_ids).delete()
+        RecipeBucket.objects.filter(recipe_id__in=recipe_ids).delete()
+        save_signatures(ids, signatures)
+    return len(ids)
+
+
+def save_signatures(ids, signatures):
+    RecipeSignature.objects.bulk_create(
+        RecipeSignature(recipe_id=int(recipe_id), signature=row.tobytes())
+        for recipe_id, row in zip(ids, signatures)
+    )
+    RecipeBucket.objects.bulk_create(
+        RecipeBucket(recipe_id=int(recipe_id), key=int(key))
+        for recipe_id, keys in zip(ids, band_keys(signatures))
+        for key in keys
+    )
+
+
+def find_similar(recipe_id, limit=10):
+    """Возвращает список (recipe_id, сходство) по убыванию сходства.
+
+    Рецепт без сигнатуры (задача индексации еще не выполнена) похожих
+    не имеет: чтение в индекс не пишет.
+    """
+    source = RecipeSignature.objects.filter(recipe_id=recipe_id).first()
+    if source is None:
+        return []
+    keys = RecipeBucket.objects.filter(
+        recipe_id=recipe_id
+    ).values_list('key', flat=True)
+    # Сначала рецепты, совпавшие в большем числе корзин: у них выше
+    # ожидаемое сходство, и отсечка MAX_CANDIDATES их не теряет.
+    candidate_ids = list(RecipeBucket.objects.filter(
+        key__in=keys
+    ).exclude(recipe_id=recipe_id).values('recipe_id').annotate(
+        matches=Count('id')
+    ).order_by('-matches', 'recipe_id').values_list(
+        'recipe_id', flat=True
+    )[:MAX_CANDIDATES])
+    candidates = RecipeSignature.objects.filter(
+        recipe_id__in=candidate_ids
+    ).values_list('recipe_id', 'signature')
+    source = np.frombuffer(source.signature, dtype=np.int64)
+    scored = [
+        (candidate_id, float(np.mean(
+            np.frombuffer(signature, dtype=np.int64) == source
+        )))
+        for candidate_id, signature in candidates
+    ]
+    scored.sort(key=lambda item: (-item[1], item[0]))
+    return scored[:limit]
@@ -0,0 +1,99 @@
+"""Сохраненные снимки общих для всех пользователей частей рецепта.
+
+Блоки автора и ингредиентов рецепта собираются из других таблиц, поэтому
+они хранятся в RecipeSnapshot вместе с версиями рецепта и автора
+(updated_at на момент сборки). Снимок используется, только пока версии
+совпадают с текущими: замена ингредиентов и их переименование меняют
+версию рецепта, правка профиля — версию автора. Устаревшие снимки
+пересобирает фоновая задача snapshots.rebuild, а до тех пор блоки
+читаются из таблиц как раньше.
+
+Ссылки на файлы зависят от хоста запроса, поэтому в снимке хранятся
+имена файлов. Флаги пользователя добавляются при чтении.
+"""
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+
+from .models import IngredientAmount, Recipe, RecipeSnapshot
+
+User = get_user_model()
+
+BATCH_SIZE = 500
+AUTHOR_FIELDS = (
+    'email', 'id', 'username', 'first_name', 'last_name', 'avatar'
+)
+
+
+def collect(rows):
+    """Блоки для строк рецептов с ключами id и author_id.
+
+    Возвращает словарь «id рецепта -> {'author', 'ingredients'}».
+    Читает авторов и ингредиенты двумя запросами.
+    """
+    if not rows:
+        return {}
+    authors = {
+        author['id']: author for author in User.objects.filter(
+            id__in={row['author_id'] for row in rows}
+        ).values(*AUTHOR_FIELDS)
+    }
+    ingredients = defaultdict(list)
+    for row in IngredientAmount.objects.filter(
+        recipe_id__in=[row['id'] for row in rows]
+    ).order_by('id').values_list(
+        'recipe_id', 'ingredient_id', 'ingredient__name',
+        'ingredient__measurement_unit', 'amount'
+    ):
+        ingredients[row[0]].append({
+            'id': row[1],
+            'name': row[2],
+            'measurement_unit': row[3],
+            'amount': row[4],
+        })
+    return {
+        row['id']: {
+            'author': authors[row['author_id']],
+            'ingredients': ingredients[row['id']],
+        }
+        for row in rows
+    }
+
+
+def rebuild(recipe_ids):
+    """Пересобирает снимки указанных рецептов."""
+    recipe_ids = list(recipe_ids)
+    for start in range(0, len(recipe_ids), BATCH_SIZE):
+        rebuild_batch(recipe_ids[start:start + BATCH_SIZE])
+
+
+def rebuild_batch(recipe_ids):
+    # Версии читаются раньше данных: при изменении между запросами
+    # снимок окажется устаревшим, но не будет выдан за актуальный.
+    rows = list(Recipe.objects.filter(id__in=recipe_ids).values(
+        'id', 'author_id', 'updated_at', 'author__updated_at'
+    ))
+    data = collect(rows)
+    RecipeSnapshot.objects.bulk_create(
+        [
+            RecipeSnapshot(
+                recipe_id=row['id'],
+                data=data[row['id']],
+                recipe_updated_at=row['updated_at'],
+                author_updated_at=row['author__updated_at'],
+            )
+            for row in rows
+        ],
+        update_conflicts=True,
+        unique_fields=['recipe'],
+        update_fields=['data', 'recipe_updated_at', 'author_updated_at'],
+    )
+
+
+def is_fresh(row):
+    """Актуален ли снимок для строки из FastRecipeSerializer.values()."""
+    return (
+        row['snapshot__data'] is not None
+        and row['snapshot__recipe_updated_at'] == row['updated_at']
+        and row['snapshot__author_updated_at'] == row['author__updated_at']
+    )
@@ -0,0 +1,48 @@
+"""Проверки, позволяющие пропускать неизменившиеся шаги запуска.
+
+Используются командой `manage.py startup` и проверкой готовности
+(readiness) сервиса.
+"""
+import hashlib
+import os
+
+from django.contrib.staticfiles.finders import get_finders
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.migrations.executor import MigrationExecutor
+
+
+def pending_migrations(database=DEFAULT_DB_ALIAS):
+    """План непримененных миграций: одно чтение django_migrations."""
+    executor = MigrationExecutor(connections[database])
+    return executor.migration_plan(executor.loader.graph.leaf_nodes())
+
+
+def static_fingerprint():
+    """Хеш путей, размеров и времени изменения исходной статики.
+
+    Совпадение с сохраненным значением означает, что collectstatic
+    нечего копировать.
+    """
+    entries = []
+    for finder in get_finders():
+        for path, storage in finder.list([]):
+            stat = os.stat(storage.path(path))
+            entries.append(f'{path}|{stat.st_size}|{stat.st_mtime_ns}\n')
+    digest = hashlib.sha256()
+    for entry in sorted(entries):
+        digest.update(entry.encode())
+    return digest.hexdigest()
+
+
+def read_checksum(path):
+    try:
+        with open(path, encoding='utf-8') as file:
+            return file.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def write_checksum(path, checksum):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(checksum)
@@ -0,0 +1,132 @@
+"""Хранилище медиафайлов с адресацией по содержимому.
+
+Имя файла строится из SHA-256 его содержимого, поэтому одинаковые
+загрузки хранятся на диске один раз. Сколько объектов ссылается на
+файл, учитывает модель MediaFile (см. api/signals.py), а файлы без
+ссылок удаляет команда gc_media. Перед удалением файла ссылки на него
+еще раз ищутся в таблицах рецептов и пользователей (referenced()).
+"""
+import hashlib
+import os
+from collections import Counter
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db.models import F
+
+CHUNK_SIZE = 64 * 1024
+
+
+def content_name(name, digest):
+    """Имя вида recipes/ab/abcdef...png для файла с хешем digest."""
+    directory = os.path.dirname(name)
+    extension = os.path.splitext(name)[1].lower()
+    return os.path.join(directory, digest[:2], digest + extension)
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Файловое хранилище, именующее файлы по хешу содержимого."""
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        digest = hashlib.sha256()
+        for chunk in content.chunks(CHUNK_SIZE):
+            digest.update(
+                chunk if isinstance(chunk, bytes) else chunk.encode()
+            )
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        name = content_name(name, digest.hexdigest())
+        if self.exists(name):
+            # Свежая дата изменения защищает файл от gc_media, пока
+            # объект, который на него ссылается, ещё не сохранён.
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length)
+
+
+def incref(names):
+    """Увеличивает счётчики ссылок на файлы."""
+    from .models import MediaFile
+
+    counts = Counter(name for name in names if name)
+    if not counts:
+        return
+    MediaFile.objects.bulk_create(
+        (MediaFile(name=name, ref_count=0) for name in counts),
+        ignore_conflicts=True,
+    )
+    by_count = {}
+    for name, count in counts.items():
+        by_count.setdefault(count, []).append(name)
+    for count, group in by_count.items():
+        MediaFile.objects.filter(name__in=group).update(
+            ref_count=F('ref_count') + count
+        )
+
+
+def decref(names):
+    """Уменьшает счётчики и удаляет файлы, на которые больше нет ссылок.
+
+    Файлы удаляет фоновая задача media.delete_files. Она ставится в
+    очередь в той же транзакции и при откате не выполняется.
+    """
+    from .models import MediaFile
+    from .tasks import enqueue
+
+    counts = Counter(name for name in names if name)
+    for name, count in counts.items():
+        MediaFile.objects.filter(name=name).update(
+            ref_count=F('ref_count') - count
+        )
+    orphans = list(MediaFile.objects.filter(
+        name__in=counts, ref_count__lte=0
+    ).values_list('name', flat=True))
+    if not orphans:
+        return
+    MediaFile.objects.filter(name__in=orphans, ref_count__lte=0).delete()
+    enqueue('media.delete_files', {'names': orphans})
+
+
+def referenced(names):
+    """Имена из names, на которые ссылаются рецепты или пользователи.
+
+    Учитываются и скрытые строки, которые ждут удаления в api.deletion.
+    """
+    from .models import Recipe, User
+
+    names = list(names)
+    found = set(Recipe._base_manager.filter(
+        image__in=names
+    ).values_list('image', flat=True))
+    found.update(User._base_manager.filter(
+        avatar__in=names
+    ).values_list('avatar', flat=True))
+    return found
+
+
+def recount(apps, batch_size=1000):
+    """Заново заполняет MediaFile по текущим ссылкам из таблиц.
+
+    Принимает реестр моделей, чтобы ее могла вызвать миграция данных.
+    """
+    MediaFile = apps.get_model('api', 'MediaFile')
+    counts = Counter()
+    for model, field in (('Recipe', 'image'), ('User', 'avatar')):
+        counts.update(
+            apps.get_model('api', model)._base_manager.exclude(
+                **{f'{field}__isnull': True}
+            ).exclude(**{field: ''}).values_list(
+                field, flat=True
+            ).iterator()
+        )
+    MediaFile.objects.all().delete()
+    MediaFile.objects.bulk_create(
+        (MediaFile(name=name, ref_count=count)
+         for name, count in counts.items()),
+        batch_size=batch_size,
+    )
+    return len(counts)
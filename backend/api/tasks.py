@@ -0,0 +1,208 @@
+"""Фоновые задачи без внешнего брокера.
+
+Задачи хранятся в таблице Task и ставятся в очередь в той же транзакции,
+что и изменения, которые их порождают: при откате запроса задача тоже
+исчезает. Выполняет их команда `manage.py run_tasks`.
+
+Обработчик регистрируется декоратором @task. Обработчик с batch=True
+получает список параметров нескольких задач сразу. Обработчики должны
+быть идемпотентными: после ошибки или падения воркера задача
+выполняется повторно.
+"""
+import traceback
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import MediaFile, Recipe, Task
+
+REGISTRY = {}
+
+
+class TaskSpec:
+    def __init__(self, name, func, max_attempts, batch):
+        self.name = name
+        self.func = func
+        self.max_attempts = max_attempts
+        self.batch = batch
+
+
+def task(name, max_attempts=3, batch=False):
+    """Регистрирует обработчик задачи с именем name."""
+    def decorator(func):
+        REGISTRY[name] = TaskSpec(name, func, max_attempts, batch)
+        return func
+    return decorator
+
+
+def enqueue(name, payload=None, key=None, delay=0):
+    """Ставит задачу в очередь.
+
+    Задача с уже известным ключом идемпотентности повторно не создается,
+    возвращается существующая.
+    """
+    if name not in REGISTRY:
+        raise KeyError(f'Неизвестная задача: {name}')
+    fields = {
+        'name': name,
+        'payload': payload or {},
+        'run_after': timezone.now() + timedelta(seconds=delay),
+    }
+    if key is None:
+        return Task.objects.create(**fields)
+    return Task.objects.get_or_create(idempotency_key=key, defaults=fields)[0]
+
+
+def claim(limit):
+    """Забирает до limit готовых к выполнению задач.
+
+    Задачи зависших воркеров возвращаются в работу по истечении
+    TASKS_VISIBILITY_TIMEOUT. В PostgreSQL несколько воркеров не берут
+    одни и те же строки благодаря SKIP LOCKED.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        ids = list(Task.objects.select_for_update(skip_locked=True).filter(
+            Q(status=Task.PENDING, run_after__lte=now)
+            | Q(status=Task.RUNNING, locked_until__lt=now)
+        ).order_by('run_after', 'id').values_list('id', flat=True)[:limit])
+        Task.objects.filter(id__in=ids).update(
+            status=Task.RUNNING,
+            attempts=F('attempts') + 1,
+            locked_until=now + timedelta(
+                seconds=getattr(settings, 'TASKS_VISIBILITY_TIMEOUT', 300)
+            ),
+        )
+    return list(Task.objects.filter(id__in=ids))
+
+
+def plan(tasks, batch_size):
+    """Группирует задачи в вызовы: (задачи, имя обработчика)."""
+    by_name = defaultdict(list)
+    for item in tasks:
+        by_name[item.name].append(item)
+    for name, group in by_name.items():
+        spec = REGISTRY.get(name)
+        if spec is not None and spec.batch:
+            for start in range(0, len(group), batch_size):
+                yield group[start:start + batch_size], name
+        else:
+            for item in group:
+                yield [item], name
+
+
+def execute(name, payloads):
+    """Выполняет обработчик; возвращает текст ошибки или None.
+
+    Вызывается и в дочерних процессах пула, поэтому принимает и
+    возвращает только простые значения.
+    """
+    close_old_connections()
+    try:
+        spec = REGISTRY.get(name)
+        if spec is None:
+            raise KeyError(f'Неизвестная задача: {name}')
+        if spec.batch:
+            spec.func(payloads)
+        else:
+            for payload in payloads:
+                spec.func(payload)
+    except Exception:
+        return traceback.format_exc()
+    finally:
+        close_old_connections()
+    return None
+
+
+def finish(tasks, error):
+    """Отмечает выполнение задач или планирует повтор с задержкой."""
+    ids = [item.id for item in tasks]
+    if error is None:
+        Task.objects.filter(id__in=ids).update(
+            status=Task.DONE, locked_until=None, last_error=''
+        )
+        return
+    spec = REGISTRY.get(tasks[0].name)
+    max_attempts = spec.max_attempts if spec is not None else 1
+    retry_delay = getattr(settings, 'TASKS_RETRY_DELAY', 10)
+    for item in tasks:
+        fields = {'locked_until': None, 'last_error': error}
+        if item.attempts >= max_attempts:
+            fields['status'] = Task.FAILED
+        else:
+            fields['status'] = Task.PENDING
+            fields['run_after'] = timezone.now() + timedelta(
+                seconds=retry_delay * 2 ** (item.attempts - 1)
+            )
+        Task.objects.filter(id=item.id).update(**fields)
+
+
+def purge(older_than):
+    """Удаляет выполненные задачи старше older_than секунд."""
+    return Task.objects.filter(
+        status=Task.DONE,
+        updated_at__lt=timezone.now() - timedelta(seconds=older_than),
+    ).delete()[0]
+
+
+@task('timeline.fan_out', batch=True)
+def fan_out(payloads):
+    from . import timeline
+
+    timeline.fan_out(Recipe.objects.filter(
+        id__in={recipe_id for payload in payloads
+                for recipe_id in payload['recipe_ids']}
+    ).only('id', 'author_id', 'pub_date'))
+
+
+@task('similarity.index_recipes', batch=True)
+def index_recipes(payloads):
+    from . import similarity
+
+    similarity.index_recipes(list({
+        recipe_id for payload in payloads
+        for recipe_id in payload['recipe_ids']
+    }))
+
+
+@task('snapshots.rebuild', batch=True)
+def rebuild_snapshots(payloads):
+    from . import snapshots
+
+    ids = defaultdict(set)
+    for payload in payloads:
+        for key, values in payload.items():
+            ids[key].update(values)
+    snapshots.rebuild(Recipe.objects.filter(
+        Q(id__in=ids['recipe_ids'])
+        | Q(author_id__in=ids['author_ids'])
+        | Q(ingredients__in=ids['ingredient_ids'])
+    ).order_by('id').values_list('id', flat=True).distinct())
+
+
+@task('deletion.purge', max_attempts=10)
+def purge_deletion(payload):
+    from . import deletion
+
+    deletion.run_step(payload['deletion_id'])
+
+
+@task('media.delete_files', batch=True)
+def delete_files(payloads):
+    from django.core.files.storage import default_storage
+
+    from .storage import referenced
+
+    names = {name for payload in payloads for name in payload['names']}
+    # Файл мог снова понадобиться, пока задача ждала в очереди, или
+    # счетчик ссылок мог разойтись с таблицами.
+    names -= set(MediaFile.objects.filter(
+        name__in=names
+    ).values_list('name', flat=True))
+    names -= referenced(names)
+    for name in names:
+        default_storage.delete(name)
@@ -1,3 +1,2070 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import tracemalloc
+import warnings
+from io import BytesIO, StringIO
+from unittest import skipUnless
+from unittest.mock import patch
 
-# Create your tests here.
+from django.apps import apps
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import CommandError, call_command
+from django.core.paginator import UnorderedObjectListWarning
+from django.db import OperationalError, connection, router, transaction
+from django.http import HttpResponse
+from django.test import (
+    RequestFactory, TestCase, TransactionTestCase, override_settings
+)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from .fast_serializers import (
+    FastRecipeSerializer, FastSubscriptionSerializer, FastUserSerializer
+)
+from .middleware import (
+    CompressionMiddleware, ProfilingMiddleware, ReplicaRoutingMiddleware
+)
+from .profiling import profiler
+from .models import (
+    Ingredient, Recipe, IngredientAmount,
+    Subscription, Favorite, ShoppingCart, TimelineEntry, MediaFile, Task,
+    User, Deletion, UnitConversion, RecipeBucket, RecipeSignature,
+    ImportProgress
+)
+from .renderers import FastJSONParser, FastJSONRenderer
+from .serializers import (
+    CustomUserSerializer, RecipeSerializer, SubscriptionSerializer
+)
+from .views import (
+    ReadinessView, RecipeViewSet, annotate_recipes, annotate_subscription
+)
+from . import (
+    catalogue, deletion, edge_cache, similarity, snapshots, storage, tasks,
+    timeline, units, usage, warmup
+)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'EXPLAIN-тесты для PostgreSQL')
+class IndexUsageTest(TestCase):
+    """Проверка, что горячие запросы идут по индексам."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            email='author@example.com', username='author',
+            first_name='A', last_name='A'
+        )
+        cls.user = User.objects.create(
+            email='user@example.com', username='user',
+            first_name='U', last_name='U'
+        )
+        ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Рецепт', image='recipes/test.png',
+            text='Текст', cooking_time=10
+        )
+        IngredientAmount.objects.create(
+            recipe=cls.recipe, ingredient=ingredient, amount=5
+        )
+        Subscription.objects.create(user=cls.user, author=cls.author)
+        Favorite.objects.create(user=cls.user, recipe=cls.recipe)
+        ShoppingCart.objects.create(user=cls.user, recipe=cls.recipe)
+
+    def setUp(self):
+        # На пустых таблицах планировщик всегда выбирает seq scan.
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assertUsesIndex(self, queryset, index_name=None):
+        plan = queryset.explain()
+        self.assertNotIn('Seq Scan', plan)
+        if index_name is not None:
+            self.assertIn(index_name, plan)
+
+    def test_author_feed(self):
+        self.assertUsesIndex(
+            Recipe.objects.filter(author=self.author)[:6],
+            'recipe_author_pub_date_idx'
+        )
+
+    def test_default_ordering(self):
+        self.assertUsesIndex(
+            Recipe.objects.all()[:6], 'recipe_pub_date_id_idx'
+        )
+
+    def test_shopping_cart_recipes(self):
+        self.assertUsesIndex(
+            ShoppingCart.objects.filter(user=self.user).values('recipe')
+        )
+
+    def test_is_favorited_lookup(self):
+        self.assertUsesIndex(
+            Favorite.objects.filter(user=self.user, recipe=self.recipe)
+        )
+
+    def test_followers_lookup(self):
+        self.assertUsesIndex(
+            Subscription.objects.filter(author=self.author).values('user')
+        )
+
+    def test_ingredient_amounts_aggregation(self):
+        self.assertUsesIndex(
+            IngredientAmount.objects.filter(
+                recipe=self.recipe
+            ).values('ingredient', 'amount')
+        )
+
+
+class RecipeBatchTest(TestCase):
+    """Проверка получения нескольких рецептов одним запросом."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            email='user@example.com', username='user',
+            first_name='U', last_name='U'
+        )
+        ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г'
+        )
+        cls.recipes = []
+        for number in range(10):
+            recipe = Recipe.objects.create(
+                author=cls.user, name=f'Рецепт {number}',
+                image='recipes/test.png', text='Текст', cooking_time=10
+            )
+            IngredientAmount.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=5
+            )
+            cls.recipes.append(recipe)
+        Favorite.objects.create(user=cls.user, recipe=cls.recipes[3])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_keeps_request_order_and_reports_missing(self):
+        ids = [self.recipes[3].id, 999999, self.recipes[0].id]
+        response = self.client.get(
+            '/api/recipes/batch/', {'ids': ','.join(map(str, ids))}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [recipe['id'] for recipe in response.data['results']],
+            [self.recipes[3].id, self.recipes[0].id]
+        )
+        self.assertEqual(response.data['missing'], [999999])
+        self.assertTrue(response.data['results'][0]['is_favorited'])
+        self.assertFalse(response.data['results'][1]['is_favorited'])
+
+    def test_constant_number_of_queries(self):
+        ids = ','.join(str(recipe.id) for recipe in self.recipes)
+        with self.assertNumQueries(3):
+            self.client.get('/api/recipes/batch/', {'ids': ids})
+
+    def test_invalid_ids(self):
+        response = self.client.get('/api/recipes/batch/', {'ids': '1,a'})
+        self.assertEqual(response.status_code, 400)
+
+
+class SparseFieldsTest(TestCase):
+    """Проверка выборочных полей в ответах ?fields= и ?expand=."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            email='user@example.com', username='user',
+            first_name='Имя', last_name='Фамилия'
+        )
+        ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г'
+        )
+        for number in range(5):
+            recipe = Recipe.objects.create(
+                author=cls.user, name=f'Рецепт {number}',
+                image='recipes/test.png', text='Текст', cooking_time=10
+            )
+            IngredientAmount.objects.create(
+                recipe=recipe, ingredient=ingredient, amount=5
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_recipe_card_fields(self):
+        with self.assertNumQueries(3):
+            response = self.client.get('/api/recipes/', {
+                'fields': 'name,cooking_time,author.first_name'
+            })
+        self.assertEqual(response.data['results'][0], {
+            'name': 'Рецепт 4',
+            'cooking_time': 10,
+            'author': {'first_name': 'Имя'},
+        })
+
+    def test_compact_relations_without_expand(self):
+        with self.assertNumQueries(3):
+            response = self.client.get(
+                '/api/recipes/', {'fields': 'id,author,ingredients'}
+            )
+        recipe = response.data['results'][0]
+        self.assertEqual(recipe['author'], self.user.id)
+        self.assertEqual(list(recipe['ingredients'][0]), ['id', 'amount'])
+
+    def test_expand_relation(self):
+        response = self.client.get('/api/recipes/', {
+            'fields': 'id,author', 'expand': 'author'
+        })
+        author = response.data['results'][0]['author']
+        self.assertEqual(author['username'], 'user')
+        self.assertFalse(author['is_subscribed'])
+
+    def test_full_representation_by_default(self):
+        response = self.client.get('/api/recipes/')
+        self.assertEqual(
+            set(response.data['results'][0]),
+            {
+                'id', 'author', 'ingredients', 'is_favorited',
+                'is_in_shopping_cart', 'name', 'image', 'text',
+                'cooking_time',
+            }
+        )
+
+    def test_user_fields(self):
+        response = self.client.get(
+            f'/api/users/{self.user.id}/', {'fields': 'id,username'}
+        )
+        self.assertEqual(
+            response.data, {'id': self.user.id, 'username': 'user'}
+        )
+
+
+class FastSerializersTest(TestCase):
+    """Быстрые сериализаторы отдают тот же JSON, что и DRF."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            email='user@example.com', username='user',
+            first_name='U', last_name='U', avatar='avatars/user.png'
+        )
+        cls.author = User.objects.create(
+            email='author@example.com', username='author',
+            first_name='A', last_name='A'
+        )
+        salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+        milk = Ingredient.objects.create(
+            name='молоко', measurement_unit='мл'
+        )
+        for number in range(4):
+            recipe = Recipe.objects.create(
+                author=cls.author if number % 2 else cls.user,
+                name=f'Рецепт {number}', image=f'recipes/{number}.png',
+                text='Текст', cooking_time=number + 1
+            )
+            IngredientAmount.objects.create(
+                recipe=recipe, ingredient=milk, amount=number + 10
+            )
+            IngredientAmount.objects.create(
+                recipe=recipe, ingredient=salt, amount=number + 1
+            )
+        Subscription.objects.create(user=cls.user, author=cls.author)
+        Favorite.objects.create(user=cls.user, recipe=recipe)
+        ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+
+    def get_request(self, user, **params):
+        request = Request(APIRequestFactory().get('/api/', params))
+        request.user = user
+        return request
+
+    def assertSameJSON(self, expected, actual):
+        renderer = JSONRenderer()
+        self.assertEqual(renderer.render(expected), renderer.render(actual))
+
+    def test_recipes(self):
+        for user in (self.user, AnonymousUser()):
+            request = self.get_request(user)
+            queryset = annotate_recipes(Recipe.objects.all(), user)
+            fast = FastRecipeSerializer(request)
+            self.assertSameJSON(
+                RecipeSerializer(
+                    queryset, many=True, context={'request': request}
+                ).data,
+                fast.serialize(fast.values(queryset))
+            )
+
+    def test_users(self):
+        request = self.get_request(self.user)
+        queryset = annotate_subscription(User.objects.all(), self.user)
+        fast = FastUserSerializer(request)
+        self.assertSameJSON(
+            CustomUserSerializer(
+                queryset, many=True, context={'request': request}
+            ).data,
+            fast.serialize(fast.values(queryset))
+        )
+
+    def test_subscriptions(self):
+        for params in ({}, {'recipes_limit': 1}):
+            request = self.get_request(self.author, **params)
+            queryset = annotate_subscription(
+                User.objects.filter(following__user=self.user), self.author
+            )
+            fast = FastSubscriptionSerializer(request)
+            self.assertSameJSON(
+                SubscriptionSerializer(
+                    queryset, many=True, context={'request': request}
+                ).data,
+                fast.serialize(fast.values(queryset))
+            )
+
+    def test_subscriptions_page_ordered(self):
+        authors = [
+            User.objects.create(
+                email=f'author{number}@example.com',
+                username=f'author{number}', first_name='A', last_name='A'
+            )
+            for number in range(3)
+        ]
+        for author in reversed(authors):
+            Subscription.objects.create(user=self.user, author=author)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', UnorderedObjectListWarning)
+            response = client.get('/api/users/subscriptions/')
+        self.assertEqual(
+            [author['id'] for author in response.data['results']],
+            [self.author.id] + [author.id for author in authors]
+        )
+
+
+class RecipeSnapshotTest(TestCase):
+    """Снимки рецептов совпадают с живыми данными и не устаревают."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            email='user@example.com', username='user',
+            first_name='U', last_name='U'
+        )
+        cls.author = User.objects.create(
+            email='author@example.com', username='author',
+            first_name='A', last_name='A', avatar='avatars/author.png'
+        )
+        cls.salt = Ingredient.objects.create(
+            name='соль', measurement_unit='г'
+        )
+        for number in range(3):
+            recipe = Recipe.objects.create(
+                author=cls.author, name=f'Рецепт {number}',
+                image='recipes/test.png', text='Текст', cooking_time=10
+            )
+            IngredientAmount.objects.create(
+                recipe=recipe, ingredient=cls.salt, amount=number + 1
+            )
+        Subscription.objects.create(user=cls.user, author=cls.author)
+        Favorite.objects.create(user=cls.user, recipe=recipe)
+
+    def setUp(self):
+        self.request = Request(APIRequestFactory().get('/api/'))
+        self.request.user = self.user
+
+    def serialize(self):
+        fast = FastRecipeSerializer(self.request)
+        return fast.serialize(fast.values(
+            annotate_recipes(Recipe.objects.all(), self.user)
+        ))
+
+    def run_tasks(self):
+        call_command('run_tasks', processes=0, burst=True, stdout=StringIO())
+
+    def test_same_json_in_one_query(self):
+        live = self.serialize()
+        self.run_tasks()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.serialize(), live)
+        self.assertEqual(
+            RecipeSerializer(
+                annotate_recipes(Recipe.objects.all(), self.user),
+                many=True, context={'request': self.request}
+            ).data,
+            live
+        )
+        self.assertTrue(live[0]['author']['is_subscribed'])
+
+    def test_changes_make_snapshots_stale(self):
+        self.run_tasks()
+        self.author.first_name = 'Новое'
+        self.author.save()
+        self.salt.name = 'морская соль'
+        self.salt.save()
+        with self.assertNumQueries(3):
+            recipes = self.serialize()
+        self.assertEqual(recipes[0]['author']['first_name'], 'Новое')
+        self.assertEqual(
+            recipes[0]['ingredients'][0]['name'], 'морская соль'
+        )
+        self.run_tasks()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.serialize(), recipes)
+
+    def test_last_login_keeps_snapshots(self):
+        snapshots.rebuild(Recipe.objects.values_list('id', flat=True))
+        Task.objects.all().delete()
+        self.author.save(update_fields=['last_login'])
+        self.assertFalse(Task.objects.exists())
+        with self.assertNumQueries(1):
+            self.serialize()
+
+    def test_rebuild_queued_with_ingredients(self):
+        Task.objects.all().delete()
+        client = APIClient()
+        client.force_authenticate(self.author)
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        with self.settings(MEDIA_ROOT=media_root.name), patch.object(
+            IngredientAmount.objects, 'bulk_create',
+            side_effect=OperationalError('сбой')
+        ), self.assertRaises(OperationalError):
+            client.post('/api/recipes/', {
+                'ingredients': [{'id': self.salt.id, 'amount': 5}],
+                'image': IngredientUsageTest.IMAGE, 'name': 'Новый',
+                'text': 'Текст', 'cooking_time': 10,
+            }, format='json')
+        self.assertEqual(Recipe.objects.count(), 3)
+        self.assertFalse(Task.objects.exists())
+
+
+class RenderersTest(TestCase):
+    """Проверка быстрых JSON-рендерера и парсера."""
+
+    def test_same_output_as_drf(self):
+        data = {'name': 'Рецепт\u2028', 'ingredients': [1, 2], 'ok': True}
+        self.assertEqual(
+            FastJSONRenderer().render(data), JSONRenderer().render(data)
+        )
+
+    def test_parse(self):
+        self.assertEqual(
+            FastJSONParser().parse(BytesIO('{"a": "б"}'.encode())),
+            {'a': 'б'}
+        )
+
+
+@override_settings(COMPRESSION_MIN_SIZE=100)
+class CompressionTest(TestCase):
+    """Проверка согласования сжатия ответов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            email='user@example.com', username='user',
+            first_name='U', last_name='U'
+        )
+        for number in range(10):
+            Recipe.objects.create(
+                author=cls.user, name=f'Рецепт {number}',
+                image='recipes/test.png', text='Текст ' * 20,
+                cooking_time=10
+            )
+
+    def test_gzip(self):
+        response = self.client.get(
+            '/api/recipes/', HTTP_ACCEPT_ENCODING='gzip, deflate'
+        )
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_identity_and_small_responses(self):
+        response = self.client.get(
+            '/api/recipes/', HTTP_ACCEPT_ENCODING='identity'
+        )
+        self.assertFalse(response.has_header('Content-Encoding'))
+        response = self.client.get(
+            '/api/recipes/', {'limit': 1, 'fields': 'id'},
+            HTTP_ACCEPT_ENCODING='gzip'
+        )
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_choose_encoding(self):
+        choose = CompressionMiddleware.choose_encoding
+        self.assertEqual(choose('gzip;q=1.0, br;q=0'), 'gzip')
+        self.assertIsNone(choose('br;q=0, gzip;q=0'))
+        self.assertIsNone(choose(''))
+
+
+@override_settings(TIMELINE_MAX_LENGTH=3, TIMELINE_FANOUT_LIMIT=1)
+class TimelineTest(TestCase):
+    """Проверка ленты рецептов от авторов из подписок."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.author, cls.celebrity, cls.fan = (
+            User.objects.create(
+                email=f'{name}@example.com', username=name,
+                first_name=name, last_name=name
+            )
+            for name in ('user', 'author', 'celebrity', 'fan')
+        )
+        Subscription.objects.create(user=cls.fan, author=cls.celebrity)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_recipe(self, author):
+        recipe = Recipe.objects.create(
+            author=author, name='Рецепт', image='recipes/test.png',
+            text='Текст', cooking_time=10
+        )
+        timeline.fan_out([recipe])
+        return recipe
+
+    def test_fan_out_and_trim(self):
+        self.client.post(f'/api/users/{self.author.id}/subscribe/')
+        recipes = [self.create_recipe(self.author) for _ in range(5)]
+        entries = TimelineEntry.objects.filter(user=self.user)
+        self.assertEqual(entries.count(), 5)
+        call_command(
+            'run_tasks', processes=0, burst=True, stdout=StringIO()
+        )
+        self.assertEqual(
+            list(entries.values_list('recipe_id', flat=True)),
+            [recipe.id for recipe in reversed(recipes[2:])]
+        )
+
+    def test_trim_skips_short_timelines(self):
+        self.client.post(f'/api/users/{self.author.id}/subscribe/')
+        self.create_recipe(self.author)
+        self.assertEqual(timeline.trim_overfull(), 0)
+        self.assertEqual(
+            TimelineEntry.objects.filter(user=self.user).count(), 1
+        )
+
+    def test_backfill_and_remove(self):
+        recipe = self.create_recipe(self.author)
+        self.client.post(f'/api/users/{self.author.id}/subscribe/')
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.user, recipe=recipe
+        ).exists())
+        self.client.delete(f'/api/users/{self.author.id}/subscribe/')
+        self.assertFalse(TimelineEntry.objects.filter(
+            user=self.user
+        ).exists())
+
+    def test_cursor_pagination_merges_celebrity_recipes(self):
+        self.client.post(f'/api/users/{self.author.id}/subscribe/')
+        self.client.post(f'/api/users/{self.celebrity.id}/subscribe/')
+        recipes = [
+            self.create_recipe(author)
+            for author in (self.author, self.celebrity, self.author)
+        ]
+        self.assertFalse(TimelineEntry.objects.filter(
+            recipe=recipes[1]
+        ).exists())
+        response = self.client.get('/api/recipes/timeline/', {'limit': 2})
+        ids = [recipe['id'] for recipe in response.data['results']]
+        response = self.client.get(response.data['next'])
+        ids += [recipe['id'] for recipe in response.data['results']]
+        self.assertIsNone(response.data['next'])
+        self.assertEqual(ids, [recipe.id for recipe in reversed(recipes)])
+
+
+class SimilarRecipesTest(TestCase):
+    """Проверка поиска похожих рецептов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create(
+            email='user@example.com', username='user',
+            first_name='U', last_name='U'
+        )
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {number}', measurement_unit='г'
+            )
+            for number in range(40)
+        ]
+        cls.recipes = []
+        for first in (0, 1, 20):
+            recipe = Recipe.objects.create(
+                author=user, name=f'Рецепт {first}',
+                image='recipes/test.png', text='Текст', cooking_time=10
+            )
+            IngredientAmount.objects.bulk_create(
+                IngredientAmount(
+                    recipe=recipe, ingredient=ingredient, amount=1
+                )
+                for ingredient in ingredients[first:first + 10]
+            )
+            cls.recipes.append(recipe)
+        similarity.index_recipes([recipe.id for recipe in cls.recipes])
+
+    def test_compute_signatures(self):
+        ids, signatures = similarity.compute_signatures(
+            [1, 1, 2], [5, 7, 5]
+        )
+        self.assertEqual(list(ids), [1, 2])
+        self.assertEqual(signatures.shape, (2, similarity.NUM_PERM))
+        self.assertTrue((signatures[0] <= signatures[1]).all())
+
+    def test_similar_endpoint(self):
+        response = self.client.get(
+            f'/api/recipes/{self.recipes[0].id}/similar/'
+        )
+        self.assertEqual(response.status_code, 200)
+        ids = [recipe['id'] for recipe in response.data]
+        self.assertEqual(ids, [self.recipes[1].id])
+        self.assertGreater(response.data[0]['similarity'], 0.5)
+
+    def test_candidates_ordered_by_matching_buckets(self):
+        with patch.object(similarity, 'MAX_CANDIDATES', 1):
+            similar = similarity.find_similar(self.recipes[0].id)
+        self.assertEqual([item[0] for item in similar], [self.recipes[1].id])
+
+    def test_rebuild_replaces_index_of_active_recipes(self):
+        Recipe.all_objects.filter(pk=self.recipes[2].pk).update(
+            deleted_at=timezone.now()
+        )
+        RecipeBucket.objects.filter(recipe=self.recipes[1]).delete()
+        # tqdm пишет прогресс прямо в sys.stderr.
+        with patch('sys.stderr', StringIO()):
+            call_command(
+                'rebuild_similarity', batch_size=1, stdout=StringIO()
+            )
+        self.assertEqual(
+            set(RecipeSignature.objects.values_list('recipe_id', flat=True)),
+            {self.recipes[0].id, self.recipes[1].id}
+        )
+        self.assertEqual(
+            [item[0] for item in similarity.find_similar(
+                self.recipes[0].id
+            )],
+            [self.recipes[1].id]
+        )
+
+    def test_find_similar_does_not_index(self):
+        RecipeSignature.objects.filter(recipe=self.recipes[0]).delete()
+        self.assertEqual(similarity.find_similar(self.recipes[0].id), [])
+        self.assertFalse(RecipeSignature.objects.filter(
+            recipe=self.recipes[0]
+        ).exists())
+
+    def test_similar_endpoint_invalid_pk(self):
+        response = self.client.get('/api/recipes/abc/similar/')
+        self.assertEqual(response.status_code, 404)
+
+
+class ContentAddressedStorageTest(TestCase):
+    """Проверка дедупликации медиафайлов и сборки мусора."""
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = self.settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create(
+            email='user@example.com', username='user',
+            first_name='U', last_name='U'
+        )
+
+    def create_recipe(self, content):
+        recipe = Recipe(
+            author=self.user, name='Рецепт', text='Текст', cooking_time=10
+        )
+        recipe.image.save('photo.png', ContentFile(content), save=False)
+        recipe.save()
+        return recipe
+
+    def test_identical_uploads_stored_once(self):
+        first = self.create_recipe(b'same bytes')
+        second = self.create_recipe(b'same bytes')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(
+            MediaFile.objects.get(name=first.image.name).ref_count, 2
+        )
+        first.delete()
+        call_command('run_tasks', processes=0, burst=True, stdout=StringIO())
+        self.assertTrue(default_storage.exists(second.image.name))
+        second.delete()
+        call_command('run_tasks', processes=0, burst=True, stdout=StringIO())
+        self.assertFalse(default_storage.exists(second.image.name))
+
+    def test_recount_seeds_existing_references(self):
+        first = self.create_recipe(b'shared')
+        self.create_recipe(b'shared')
+        MediaFile.objects.all().delete()
+        storage.recount(apps)
+        self.assertEqual(
+            MediaFile.objects.get(name=first.image.name).ref_count, 2
+        )
+
+    def test_delete_task_rechecks_references(self):
+        first = self.create_recipe(b'undercounted')
+        second = self.create_recipe(b'undercounted')
+        MediaFile.objects.update(ref_count=1)
+        first.delete()
+        self.assertTrue(Task.objects.filter(name='media.delete_files'))
+        call_command('run_tasks', processes=0, burst=True, stdout=StringIO())
+        self.assertTrue(default_storage.exists(second.image.name))
+
+    def test_gc_media_removes_orphans(self):
+        recipe = self.create_recipe(b'kept')
+        orphan = default_storage.save('avatars/orphan.png', ContentFile(b'x'))
+        call_command('gc_media', grace_seconds=0, stdout=StringIO())
+        self.assertFalse(default_storage.exists(orphan))
+        self.assertTrue(default_storage.exists(recipe.image.name))
+
+
+class RecipeImportExportTest(TestCase):
+    """Проверка команд export_recipes и import_recipes."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            email='author@example.com', username='author',
+            first_name='A', last_name='A'
+        )
+        cls.salt = Ingredient.objects.create(
+            name='соль', measurement_unit='г'
+        )
+        cls.sugar = Ingredient.objects.create(
+            name='сахар', measurement_unit='г'
+        )
+
+    def setUp(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        settings_override = self.settings(MEDIA_ROOT=root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.path = os.path.join(root.name, 'recipes.ndjson')
+        os.makedirs(os.path.join(root.name, 'recipes'))
+        with open(os.path.join(root.name, 'recipes', 'test.png'), 'wb'):
+            pass
+
+    def record(self, name, **fields):
+        record = {
+            'author': 'author@example.com', 'name': name, 'text': 'Текст',
+            'cooking_time': 10, 'image': 'recipes/test.png',
+            'ingredients': [{'id': self.salt.id, 'amount': 5}],
+        }
+        record.update(fields)
+        return json.dumps(record, ensure_ascii=False)
+
+    def write(self, *lines):
+        with open(self.path, 'w', encoding='utf-8') as file:
+            file.write('\n'.join(lines) + '\n')
+
+    def import_recipes(self, *args):
+        stderr = StringIO()
+        # tqdm пишет прогресс прямо в sys.stderr.
+        with patch('sys.stderr', StringIO()):
+            call_command(
+                'import_recipes', self.path, '--workers=1',
+                '--batch-size=2', *args, stdout=StringIO(), stderr=stderr
+            )
+        return stderr.getvalue()
+
+    def test_round_trip(self):
+        recipe = Recipe(
+            author=self.author, name='Рецепт', text='Текст', cooking_time=7
+        )
+        recipe.image.save('photo.png', ContentFile(b'photo'), save=False)
+        recipe.save()
+        IngredientAmount.objects.create(
+            recipe=recipe, ingredient=self.sugar, amount=3
+        )
+        with patch('sys.stderr', StringIO()):
+            call_command(
+                'export_recipes', self.path,
+                stdout=StringIO(), stderr=StringIO()
+            )
+        image = recipe.image.name
+        Recipe.objects.all().delete()
+        self.import_recipes()
+        imported = Recipe.objects.get()
+        self.assertEqual(
+            (imported.author, imported.name, imported.cooking_time,
+             imported.image.name),
+            (self.author, 'Рецепт', 7, image)
+        )
+        self.assertEqual(
+            list(imported.ingredient_amounts.values_list(
+                'ingredient', 'amount'
+            )),
+            [(self.sugar.id, 3)]
+        )
+        self.assertEqual(MediaFile.objects.get(name=image).ref_count, 1)
+
+    def test_resolves_ingredients_and_decodes_images(self):
+        self.write(self.record(
+            'Рецепт',
+            image=IngredientUsageTest.IMAGE,
+            ingredients=[
+                {'name': 'сахар', 'measurement_unit': 'г', 'amount': 2},
+                {'id': self.salt.id, 'amount': 1},
+            ],
+        ))
+        self.import_recipes()
+        recipe = Recipe.objects.get()
+        self.assertEqual(
+            set(recipe.ingredients.values_list('name', flat=True)),
+            {'сахар', 'соль'}
+        )
+        self.assertTrue(recipe.image.name.startswith('recipes/'))
+        self.assertTrue(default_storage.exists(recipe.image.name))
+
+    def test_skips_bad_lines(self):
+        self.write(
+            self.record('Хороший'),
+            self.record('Чужой', author='nobody@example.com'),
+            '{"name": ',
+            self.record('Без ингредиента', ingredients=[
+                {'name': 'перец', 'measurement_unit': 'г', 'amount': 1}
+            ]),
+        )
+        stderr = self.import_recipes()
+        self.assertEqual(
+            list(Recipe.objects.values_list('name', flat=True)), ['Хороший']
+        )
+        for line_number in (2, 3, 4):
+            self.assertIn(f'Строка {line_number} пропущена', stderr)
+
+    def test_rejects_unknown_image_names(self):
+        self.write(
+            self.record('Хороший'),
+            self.record('Снаружи', image='../../x'),
+            self.record('Обход', image='recipes/../recipes.ndjson'),
+            self.record('Чужая папка', image='avatars/test.png'),
+            self.record('Нет файла', image='recipes/missing.png'),
+        )
+        self.import_recipes()
+        self.assertEqual(
+            list(Recipe.objects.values_list('name', flat=True)), ['Хороший']
+        )
+
+    def test_resumes_from_checkpoint(self):
+        self.write(*(self.record(f'Рецепт {number}') for number in range(3)))
+        ImportProgress.objects.create(source=self.path, line_number=2)
+        self.import_recipes()
+        self.assertEqual(
+            list(Recipe.objects.values_list('name', flat=True)),
+            ['Рецепт 2']
+        )
+        self.assertFalse(ImportProgress.objects.exists())
+        ImportProgress.objects.create(source=self.path, line_number=2)
+        self.import_recipes('--restart')
+        self.assertEqual(Recipe.objects.count(), 4)
+
+    def test_checkpoint_rolled_back_with_batch(self):
+        self.write(*(self.record(f'Рецепт {number}') for number in range(3)))
+        with patch.object(
+            snapshots, 'rebuild', side_effect=[None, RuntimeError]
+        ), self.assertRaises(RuntimeError):
+            self.import_recipes()
+        self.assertEqual(
+            ImportProgress.objects.get(source=self.path).line_number, 2
+        )
+        self.import_recipes()
+        self.assertEqual(
+            sorted(Recipe.objects.values_list('name', flat=True)),
+            ['Рецепт 0', 'Рецепт 1', 'Рецепт 2']
+        )
+
+
+class ShoppingCartDownloadTest(TestCase):
+    """Проверка кеширования и отдачи списка покупок."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            email='user@example.com', username='user',
+            first_name='U', last_name='U'
+        )
+        cls.salt = Ingredient.objects.create(
+            name='соль', measurement_unit='г'
+        )
+        cls.recipes = []
+        for number in range(2):
+            recipe = Recipe.objects.create(
+                author=cls.user, name=f'Рецепт {number}',
+                image='recipes/test.png', text='Текст', cooking_time=10
+            )
+            IngredientAmount.objects.create(
+                recipe=recipe, ingredient=cls.salt, amount=5
+            )
+            cls.recipes.append(recipe)
+        ShoppingCart.objects.create(user=cls.user, recipe=cls.recipes[0])
+
+    def setUp(self):
+        exports_root = tempfile.TemporaryDirectory()
+        self.addCleanup(exports_root.cleanup)
+        settings_override = self.settings(EXPORTS_ROOT=exports_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.url = '/api/recipes/download_shopping_cart/'
+
+    def download(self):
+        response = self.client.get(self.url)
+        return b''.join(response.streaming_content).decode()
+
+    def test_streams_without_proxy(self):
+        self.assertEqual(self.download(), 'Список покупок:\nсоль (г) — 5\n')
+
+    def test_cached_until_cart_changes(self):
+        self.download()
+        with self.assertNumQueries(1):
+            self.download()
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipes[1])
+        self.assertIn('соль (г) — 10', self.download())
+
+    def test_old_versions_removed_after_grace_period(self):
+        self.download()
+        directory = os.path.join(
+            settings.EXPORTS_ROOT, 'shopping_cart', str(self.user.id)
+        )
+        previous = os.path.join(directory, os.listdir(directory)[0])
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipes[1])
+        self.download()
+        self.assertTrue(os.path.exists(previous))
+        os.utime(previous, (0, 0))
+        ShoppingCart.objects.filter(recipe=self.recipes[1]).delete()
+        self.download()
+        self.assertFalse(os.path.exists(previous))
+        self.assertEqual(len(os.listdir(directory)), 2)
+
+    def test_accel_redirect(self):
+        response = self.client.get(
+            self.url, HTTP_X_SENDFILE_TYPE='X-Accel-Redirect'
+        )
+        self.assertTrue(response['X-Accel-Redirect'].startswith(
+            f'/protected/exports/shopping_cart/{self.user.id}/'
+        ))
+        self.assertEqual(response.content, b'')
+
+
+class AdminTest(TestCase):
+    """Проверка, что число запросов в админке не зависит от числа строк."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            email='admin@example.com', username='admin', password='admin',
+            first_name='A', last_name='A'
+        )
+        cls.ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {number}', measurement_unit='г')
+            for number in range(10)
+        )
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def create_rows(self, count):
+        start = Recipe.objects.count()
+        for number in range(start, start + count):
+            user = User.objects.create(
+                email=f'user{number}@example.com', username=f'user{number}',
+                first_name='U', last_name='U'
+            )
+            recipe = Recipe.objects.create(
+                author=user, name=f'Рецепт {number}',
+                image='recipes/test.png', text='Текст', cooking_time=10
+            )
+            IngredientAmount.objects.create(
+                recipe=recipe, ingredient=self.ingredients[number % 10],
+                amount=5
+            )
+            Favorite.objects.create(user=user, recipe=recipe)
+            ShoppingCart.objects.create(user=user, recipe=recipe)
+            Subscription.objects.create(user=self.admin, author=user)
+        return recipe
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+    def test_changelists_without_n_plus_one(self):
+        urls = [
+            f'/admin/api/{model}/' for model in (
+                'user', 'ingredient', 'recipe', 'ingredientamount',
+                'subscription', 'favorite', 'shoppingcart',
+                'timelineentry', 'recipesignature', 'recipebucket',
+                'mediafile',
+            )
+        ]
+        self.create_rows(2)
+        for url in urls:
+            self.client.get(url)
+        few = [self.count_queries(url) for url in urls]
+        self.create_rows(8)
+        self.assertEqual([self.count_queries(url) for url in urls], few)
+
+    def test_recipe_favorites_count(self):
+        recipe = self.create_rows(1)
+        Favorite.objects.create(user=self.admin, recipe=recipe)
+        response = self.client.get('/admin/api/recipe/')
+        self.assertEqual(
+            response.context['cl'].result_list[0].favorites_count, 2
+        )
+
+    def test_recipe_inline_without_n_plus_one(self):
+        recipe = self.create_rows(1)
+        url = f'/admin/api/recipe/{recipe.id}/change/'
+        self.client.get(url)
+        one = self.count_queries(url)
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in self.ingredients
+            if ingredient.id != recipe.ingredients.get().id
+        )
+        self.assertEqual(self.count_queries(url), one)
+
+    def test_ingredient_amount_edit_rebuilds_recipe(self):
+        recipe = self.create_rows(1)
+        amount = IngredientAmount.objects.get(recipe=recipe)
+        Task.objects.all().delete()
+        response = self.client.post(
+            f'/admin/api/ingredientamount/{amount.id}/change/', {
+                'recipe': recipe.id, 'ingredient': amount.ingredient_id,
+                'amount': 7,
+            }
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(
+            sorted(Task.objects.values_list('name', 'payload')),
+            [
+                ('similarity.index_recipes', {'recipe_ids': [recipe.id]}),
+                ('snapshots.rebuild', {'recipe_ids': [recipe.id]}),
+            ]
+        )
+
+    def test_delete_confirmation_skips_cascade(self):
+        recipe = self.create_rows(1)
+        urls = [
+            f'/admin/api/recipe/{recipe.id}/delete/',
+            f'/admin/api/user/{recipe.author_id}/delete/',
+        ]
+        few = [self.count_queries(url) for url in urls]
+        IngredientAmount.objects.bulk_create(
+            IngredientAmount(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in self.ingredients
+            if ingredient.id != recipe.ingredients.get().id
+        )
+        self.create_rows(3)
+        Recipe.objects.exclude(pk=recipe.pk).update(author=recipe.author)
+        self.assertEqual([self.count_queries(url) for url in urls], few)
+        response = self.client.post(urls[0], {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Recipe.all_objects.filter(pk=recipe.pk).exists())
+        self.assertFalse(Recipe.objects.filter(pk=recipe.pk).exists())
+
+
+class StartupTest(TestCase):
+    """Проверка команд запуска и проверок состояния."""
+
+    def test_wait_for_db_retries(self):
+        errors = [OperationalError('down'), OperationalError('down')]
+
+        def ensure_connection():
+            if errors:
+                raise errors.pop()
+
+        with patch.object(
+            connection, 'ensure_connection', side_effect=ensure_connection
+        ), patch('time.sleep') as sleep:
+            call_command('wait_for_db', initial_delay=0.5, stdout=StringIO())
+        self.assertEqual(
+            [call.args[0] for call in sleep.call_args_list], [0.5, 1.0]
+        )
+
+    def test_wait_for_db_timeout(self):
+        with patch.object(
+            connection, 'ensure_connection',
+            side_effect=OperationalError('down')
+        ), patch('time.sleep'), self.assertRaises(CommandError):
+            call_command('wait_for_db', timeout=0, stdout=StringIO())
+
+    def test_load_ingredients_skipped_when_unchanged(self):
+        base_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(base_dir.cleanup)
+        os.makedirs(os.path.join(base_dir.name, 'data'))
+        with open(
+            os.path.join(base_dir.name, 'data', 'ingredients.json'), 'w'
+        ) as file:
+            json.dump([
+                {'name': 'соль', 'measurement_unit': 'г'},
+                {'name': 'молоко', 'measurement_unit': 'мл'},
+            ], file)
+        with self.settings(BASE_DIR=base_dir.name):
+            call_command('load_ingredients', stdout=StringIO())
+            count = Ingredient.objects.count()
+            self.assertEqual(count, 2)
+            output = StringIO()
+            with self.assertNumQueries(1):
+                call_command('load_ingredients', stdout=output)
+            self.assertIn('не изменились', output.getvalue())
+            Ingredient.objects.all().delete()
+            call_command('load_ingredients', stdout=StringIO())
+            self.assertEqual(Ingredient.objects.count(), count)
+
+    def test_health(self):
+        self.assertEqual(self.client.get('/api/health/live/').json(), {
+            'status': 'ok'
+        })
+        with patch('api.startup.pending_migrations', return_value=[]):
+            response = self.client.get('/api/health/ready/')
+        self.assertEqual(response.status_code, 200)
+        with patch.object(ReadinessView, 'migrated', False), patch(
+            'api.startup.pending_migrations',
+            side_effect=OperationalError('host=db password=secret')
+        ), self.assertLogs('api.views', 'ERROR'):
+            response = self.client.get('/api/health/ready/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json(), {'status': 'unavailable'})
+
+
+class IngredientCatalogueTest(TestCase):
+    """Проверка списка ингредиентов из памяти процесса."""
+
+    @classmethod
+    def setUpTestData(cls):
+        for name in ('соль', 'сахар', 'соус', 'мука'):
+            Ingredient.objects.create(name=name, measurement_unit='г')
+
+    def setUp(self):
+        catalogue.invalidate()
+        self.addCleanup(catalogue.invalidate)
+
+    def test_matches_database(self):
+        for name in ('', 'с', 'со', 'соль', 'х'):
+            expected = list(Ingredient.objects.filter(
+                name__startswith=name
+            ).values('id', 'name', 'measurement_unit'))
+            self.client.get('/api/ingredients/', {'name': name})
+            with self.assertNumQueries(0):
+                response = self.client.get(
+                    '/api/ingredients/', {'name': name}
+                )
+            self.assertEqual(response.json(), expected)
+
+    def test_invalidated_on_change(self):
+        self.client.get('/api/ingredients/')
+        Ingredient.objects.create(name='сода', measurement_unit='г')
+        response = self.client.get('/api/ingredients/', {'name': 'сод'})
+        self.assertEqual(
+            [row['name'] for row in response.json()], ['сода']
+        )
+
+    def test_warm_up(self):
+        timings = warmup.warm_up()
+        self.assertEqual(timings['ingredients'][0], 4)
+        self.assertGreater(timings['serializers'][0], 10)
+        with self.assertNumQueries(0):
+            self.client.get('/api/ingredients/')
+
+
+class IngredientUsageTest(TestCase):
+    """Проверка счетчиков использования и ранжирования подсказок."""
+
+    IMAGE = (
+        'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAA'
+        'fFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=='
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            email='author@example.com', username='author',
+            first_name='A', last_name='A'
+        )
+        cls.ingredients = {
+            name: Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('соль', 'соль крупная', 'соус', 'сода', 'сахар')
+        }
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = self.settings(MEDIA_ROOT=media_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        catalogue.invalidate()
+        self.addCleanup(catalogue.invalidate)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def counts(self):
+        return dict(Ingredient.objects.filter(
+            recipes_count__gt=0
+        ).values_list('name', 'recipes_count'))
+
+    def recipe_data(self, *names):
+        return {
+            'ingredients': [
+                {'id': self.ingredients[name].id, 'amount': 5}
+                for name in names
+            ],
+            'image': self.IMAGE, 'name': 'Рецепт', 'text': 'Текст',
+            'cooking_time': 10,
+        }
+
+    def test_counts_follow_recipe_writes(self):
+        first = self.client.post(
+            '/api/recipes/', self.recipe_data('соус', 'сода'), format='json'
+        ).data['id']
+        second = self.client.post(
+            '/api/recipes/', self.recipe_data('соус'), format='json'
+        ).data['id']
+        self.assertEqual(self.counts(), {'соус': 2, 'сода': 1})
+        response = self.client.patch(
+            f'/api/recipes/{first}/', self.recipe_data('соль', 'соус'),
+            format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.counts(), {'соус': 2, 'соль': 1})
+        Recipe.objects.get(pk=second).delete()
+        self.assertEqual(self.counts(), {'соус': 1, 'соль': 1})
+        self.client.delete(f'/api/recipes/{first}/')
+        call_command(
+            'run_tasks', processes=0, burst=True,
+            stdout=StringIO(), stderr=StringIO()
+        )
+        self.assertEqual(self.counts(), {})
+
+    def test_recount(self):
+        self.client.post(
+            '/api/recipes/', self.recipe_data('соль'), format='json'
+        )
+        Ingredient.objects.update(recipes_count=7)
+        usage.recount(apps)
+        self.assertEqual(self.counts(), {'соль': 1})
+
+    @override_settings(INGREDIENT_AUTOCOMPLETE_LIMIT=2)
+    def test_ranked_by_exact_match_then_usage(self):
+        for name, count in (
+            ('соль крупная', 3), ('соус', 2), ('сода', 5), ('сахар', 10)
+        ):
+            Ingredient.objects.filter(name=name).update(recipes_count=count)
+        for prefix, expected in (
+            ('с', ['сахар', 'сода']),
+            ('со', ['сода', 'соль крупная']),
+            ('соль', ['соль', 'соль крупная']),
+            ('соу', ['соус']),
+        ):
+            response = self.client.get('/api/ingredients/', {'name': prefix})
+            self.assertEqual(
+                [row['name'] for row in response.json()], expected
+            )
+        self.assertEqual(len(self.client.get('/api/ingredients/').json()), 5)
+        # Запрос с лишними параметрами обслуживает IngredientFilter.
+        response = self.client.get(
+            '/api/ingredients/', {'name': 'соль', 'page': 1}
+        )
+        self.assertEqual(
+            [row['name'] for row in response.json()],
+            ['соль', 'соль крупная']
+        )
+
+
+@override_settings(REPLICA_DATABASES=['replica'])
+class ReplicaRoutingTest(TransactionTestCase):
+    """Проверка выбора базы для чтения в рамках запроса.
+
+    TransactionTestCase, потому что внутри транзакции TestCase чтение
+    всегда идет в основную базу.
+    """
+
+    def route(self, method='get', write=False, cookies=None, atomic=False,
+              user=None):
+        aliases = []
+
+        def view(request):
+            # До аутентификации пользователь еще не известен.
+            aliases.append(router.db_for_read(Recipe))
+            if user is not None:
+                request.user = user
+            if write:
+                aliases.append(router.db_for_write(Recipe))
+            if atomic:
+                with transaction.atomic():
+                    aliases.append(router.db_for_read(Recipe))
+            else:
+                aliases.append(router.db_for_read(Recipe))
+            return HttpResponse()
+
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES.update(cookies or {})
+        response = ReplicaRoutingMiddleware(view)(request)
+        return aliases, response
+
+    def test_safe_request_reads_replica(self):
+        aliases, response = self.route()
+        self.assertEqual(aliases, ['replica', 'replica'])
+        self.assertNotIn('pin_primary', response.cookies)
+
+    def test_read_your_writes(self):
+        aliases, response = self.route(write=True)
+        self.assertEqual(aliases, ['replica', 'default', 'default'])
+        self.assertEqual(response.cookies['pin_primary']['max-age'], 5)
+
+    def test_pinned_client_reads_primary(self):
+        aliases, _ = self.route(cookies={'pin_primary': '1'})
+        self.assertEqual(aliases, ['default', 'default'])
+
+    def test_pinned_user_reads_primary_without_cookie(self):
+        user = User.objects.create(
+            email='pin@example.com', username='pin',
+            first_name='Pin', last_name='User'
+        )
+        other = User.objects.create(
+            email='other@example.com', username='other',
+            first_name='Other', last_name='User'
+        )
+        self.route(method='post', write=True, user=user)
+        # Другой воркер: свой процесс и свой локальный кеш.
+        cache.clear()
+        self.assertEqual(
+            self.route(user=user)[0], ['replica', 'default']
+        )
+        self.assertEqual(
+            self.route(user=other)[0], ['replica', 'replica']
+        )
+        self.assertEqual(
+            self.route(user=AnonymousUser())[0], ['replica', 'replica']
+        )
+        User.objects.filter(pk=user.pk).update(
+            primary_pinned_until=timezone.now()
+        )
+        self.assertEqual(
+            self.route(user=user)[0], ['replica', 'replica']
+        )
+
+    def test_unsafe_method_and_transaction_read_primary(self):
+        self.assertEqual(
+            self.route(method='post')[0], ['default', 'default']
+        )
+        self.assertEqual(self.route(atomic=True)[0], ['replica', 'default'])
+
+    def test_outside_request_reads_primary(self):
+        self.assertEqual(router.db_for_read(Recipe), 'default')
+
+
+class TaskQueueTest(TestCase):
+    """Проверка очереди фоновых задач."""
+
+    def setUp(self):
+        self.calls = []
+        self.failures = 0
+        tasks.task('test.batch', batch=True)(self.calls.append)
+        tasks.task('test.flaky', max_attempts=2)(self.flaky)
+        self.addCleanup(tasks.REGISTRY.pop, 'test.batch')
+        self.addCleanup(tasks.REGISTRY.pop, 'test.flaky')
+
+    def flaky(self, payload):
+        if self.failures < payload['failures']:
+            self.failures += 1
+            raise RuntimeError('сбой')
+
+    def run_tasks(self):
+        call_command(
+            'run_tasks', processes=0, burst=True, batch_size=2,
+            stdout=StringIO(), stderr=StringIO()
+        )
+
+    def test_batching_and_idempotency(self):
+        for number in range(3):
+            tasks.enqueue('test.batch', {'number': number})
+        tasks.enqueue('test.batch', {'number': 3}, key='once')
+        tasks.enqueue('test.batch', {'number': 4}, key='once')
+        self.run_tasks()
+        self.assertEqual(
+            [[payload['number'] for payload in call] for call in self.calls],
+            [[0, 1], [2, 3]]
+        )
+        self.assertEqual(
+            set(Task.objects.values_list('status', flat=True)), {Task.DONE}
+        )
+
+    def test_retry_with_backoff(self):
+        task = tasks.enqueue('test.flaky', {'failures': 1})
+        self.run_tasks()
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), (Task.PENDING, 1))
+        self.assertIn('сбой', task.last_error)
+        Task.objects.update(run_after=task.created_at)
+        self.run_tasks()
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), (Task.DONE, 2))
+
+    def test_fails_after_max_attempts(self):
+        task = tasks.enqueue('test.flaky', {'failures': 5})
+        for _ in range(2):
+            Task.objects.update(run_after=task.created_at)
+            self.run_tasks()
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), (Task.FAILED, 2))
+
+    def test_recipe_side_effects_deferred(self):
+        user = User.objects.create(
+            email='author@example.com', username='author',
+            first_name='A', last_name='A'
+        )
+        follower = User.objects.create(
+            email='follower@example.com', username='follower',
+            first_name='F', last_name='F'
+        )
+        Subscription.objects.create(user=follower, author=user)
+        salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+        client = APIClient()
+        client.force_authenticate(user)
+        image = (
+            'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAA'
+            'fFcSJAAAADUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=='
+        )
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        with self.settings(MEDIA_ROOT=media_root.name):
+            response = client.post('/api/recipes/', {
+                'ingredients': [{'id': salt.id, 'amount': 5}],
+                'image': image, 'name': 'Рецепт', 'text': 'Текст',
+                'cooking_time': 10,
+            }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            sorted(Task.objects.values_list('name', flat=True)),
+            [
+                'similarity.index_recipes', 'snapshots.rebuild',
+                'timeline.fan_out'
+            ]
+        )
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.run_tasks()
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=follower, recipe_id=response.data['id']
+        ).exists())
+
+
+class LoginTest(TestCase):
+    """Проверка быстрого входа по паролю."""
+
+    url = '/api/auth/token/login/'
+
+    def setUp(self):
+        self.user = User.objects.create(
+            email='user@example.com', username='user',
+            first_name='U', last_name='U'
+        )
+        self.user.set_password('secret-Password-1')
+        self.user.save()
+        self.data = {'email': 'user@example.com',
+                     'password': 'secret-Password-1'}
+
+    def test_token_reused_in_one_query(self):
+        token = self.client.post(self.url, self.data).json()['auth_token']
+        # Пользователь с токеном и обновление last_login.
+        with self.assertNumQueries(2):
+            response = self.client.post(self.url, self.data)
+        self.assertEqual(response.json(), {'auth_token': token})
+        self.user.refresh_from_db()
+        self.assertIsNotNone(self.user.last_login)
+
+    def test_wrong_password(self):
+        response = self.client.post(
+            self.url, {**self.data, 'password': 'wrong'}
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_repeated_login_checks_password(self):
+        self.client.post(self.url, self.data)
+        with patch.object(
+            User, 'check_password', return_value=False
+        ) as check_password:
+            response = self.client.post(self.url, self.data)
+        self.assertEqual(response.status_code, 400)
+        check_password.assert_called_once()
+
+    def test_rehash_on_login(self):
+        with self.settings(PASSWORD_HASHERS=[
+            'api.hashers.TunedArgon2PasswordHasher',
+            'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+        ], ARGON2_MEMORY_COST=1024):
+            self.user.password = make_password(
+                self.data['password'], hasher='pbkdf2_sha256'
+            )
+            self.user.save()
+            response = self.client.post(self.url, self.data)
+            self.assertEqual(response.status_code, 200)
+            self.user.refresh_from_db()
+            self.assertTrue(self.user.password.startswith('argon2$'))
+            self.assertTrue(self.user.check_password(self.data['password']))
+
+
+class ShoppingListUnitsTest(TestCase):
+    """Список покупок сводит варианты ингредиентов и единиц."""
+
+    @classmethod
+    def setUpTestData(cls):
+        units.sync_conversions(apps)
+        cls.user = User.objects.create(
+            email='user@example.com', username='user',
+            first_name='U', last_name='U'
+        )
+        amounts = [
+            ('Сахар', 'г', 500),
+            ('сахар', 'кг', 2),
+            ('  Сахар ', 'ст. л.', 1),
+            ('Молоко', 'л', 1),
+            ('молоко', 'мл', 200),
+            ('Яйцо', 'шт.', 3),
+            ('Ваниль', 'щепотка', 1),
+        ]
+        for number, (name, unit, amount) in enumerate(amounts):
+            recipe = Recipe.objects.create(
+                author=cls.user, name=f'Рецепт {number}',
+                image='recipes/test.png', text='Текст', cooking_time=10
+            )
+            IngredientAmount.objects.create(
+                recipe=recipe, amount=amount,
+                ingredient=Ingredient.objects.create(
+                    name=name, measurement_unit=unit
+                ),
+            )
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+
+    def test_normalization(self):
+        self.assertEqual(units.normalize_name(' Ёж,  Сушёный '), 'еж сушеный')
+        self.assertEqual(units.normalize_unit('ст.л.'), 'ст. л')
+        self.assertEqual(units.normalize_unit('шт.'), 'шт')
+
+    def test_single_query_aggregation(self):
+        request = Request(APIRequestFactory().get('/'))
+        request.user = self.user
+        view = RecipeViewSet()
+        with self.assertNumQueries(1):
+            rows = list(view._get_ingredients_for_shopping_cart(request))
+        self.assertEqual(
+            [(row['name'], row['unit'], row['amount']) for row in rows],
+            [
+                ('Ваниль', 'щепотка', 1),
+                ('Молоко', 'мл', 1200),
+                ('Сахар', 'г', 2500),
+                ('Сахар', 'мл', 15),
+                ('Яйцо', 'шт.', 3),
+            ]
+        )
+
+    def test_regrouping_changes_cart_version(self):
+        exports_root = tempfile.TemporaryDirectory()
+        self.addCleanup(exports_root.cleanup)
+        settings_override = self.settings(EXPORTS_ROOT=exports_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        url = '/api/recipes/download_shopping_cart/'
+        etag = client.get(url)['ETag']
+        conversion = UnitConversion.objects.get(unit='ст. л')
+        conversion.factor = 20
+        conversion.save()
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            'Сахар (мл) — 20', b''.join(response.streaming_content).decode()
+        )
+        etag = response['ETag']
+        Ingredient.objects.filter(name='Молоко').update(conversion=None)
+        units.link_ingredients(apps)
+        self.assertEqual(
+            client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200
+        )
+
+    def test_loader_links_existing_catalogue(self):
+        Ingredient.objects.update(canonical=None, conversion=None)
+        self.assertEqual(units.link_ingredients(apps), 7)
+        self.assertEqual(units.link_ingredients(apps), 0)
+        self.assertEqual(
+            Ingredient.objects.filter(name='сахар').get().canonical.name,
+            'Сахар'
+        )
+
+
+class UserEndpointsTest(TestCase):
+    """Проверка, что списки и профили пользователей не делают N+1."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = User.objects.create(
+            email='viewer@example.com', username='viewer',
+            first_name='V', last_name='V'
+        )
+        cls.token = Token.objects.create(user=cls.viewer)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def create_users(self, count):
+        start = User.objects.count()
+        users = User.objects.bulk_create(
+            User(
+                email=f'user{number}@example.com', username=f'user{number}',
+                first_name='U', last_name='U'
+            )
+            for number in range(start, start + count)
+        )
+        for user in users[::2]:
+            Subscription.objects.create(user=self.viewer, author=user)
+            Recipe.objects.create(
+                author=user, name='Рецепт', image='recipes/test.png',
+                text='Текст', cooking_time=10
+            )
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+    def test_list_constant_queries(self):
+        urls = [
+            '/api/users/?limit=100',
+            '/api/users/?limit=100&fields=id,is_subscribed',
+            '/api/users/?limit=100&expand=recipes_count,followers_count',
+        ]
+        self.create_users(10)
+        few = [self.count_queries(url) for url in urls]
+        self.create_users(90)
+        self.assertEqual([self.count_queries(url) for url in urls], few)
+
+    def test_counts_are_optional(self):
+        self.create_users(2)
+        author = Subscription.objects.first().author
+        response = self.client.get(f'/api/users/{author.id}/')
+        self.assertNotIn('recipes_count', response.data)
+        self.assertTrue(response.data['is_subscribed'])
+        response = self.client.get(
+            f'/api/users/{author.id}/',
+            {'expand': 'recipes_count,followers_count'}
+        )
+        self.assertEqual(response.data['recipes_count'], 1)
+        self.assertEqual(response.data['followers_count'], 1)
+
+    def test_me_uses_authenticated_user(self):
+        # Единственный запрос — проверка токена.
+        with self.assertNumQueries(1):
+            response = self.client.get('/api/users/me/')
+        self.assertEqual(response.data['email'], self.viewer.email)
+        self.assertFalse(response.data['is_subscribed'])
+
+
+class ConditionalGetTest(TestCase):
+    """Проверка ответов 304 по ETag и Last-Modified."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            email='user@example.com', username='user',
+            first_name='U', last_name='U'
+        )
+        cls.token = Token.objects.create(user=cls.user)
+        cls.salt = Ingredient.objects.create(
+            name='соль', measurement_unit='г'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.user, name='Рецепт', image='recipes/test.png',
+            text='Текст', cooking_time=10
+        )
+        IngredientAmount.objects.create(
+            recipe=cls.recipe, ingredient=cls.salt, amount=5
+        )
+
+    def setUp(self):
+        exports_root = tempfile.TemporaryDirectory()
+        self.addCleanup(exports_root.cleanup)
+        settings_override = self.settings(EXPORTS_ROOT=exports_root.name)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.url = f'/api/recipes/{self.recipe.id}/'
+
+    def revalidate(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_recipe_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Authorization', response['Vary'])
+        # Проверка токена и один запрос версии, без сериализации.
+        with self.assertNumQueries(2):
+            cached = self.revalidate(self.url, response)
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached.content, b'')
+
+    def test_recipe_changes_invalidate(self):
+        response = self.client.get(self.url)
+        Favorite.objects.create(user=self.user, recipe=self.recipe)
+        response = self.revalidate(self.url, response)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['is_favorited'])
+        self.salt.name = 'морская соль'
+        self.salt.save()
+        response = self.revalidate(self.url, response)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response.data['ingredients'][0]['name'], 'морская соль'
+        )
+        other = self.client.get(self.url, {'fields': 'id,name'})
+        self.assertNotEqual(other['ETag'], response['ETag'])
+
+    def test_if_modified_since_for_anonymous(self):
+        client = APIClient()
+        response = client.get(self.url)
+        self.assertEqual(client.get(
+            self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        ).status_code, 304)
+        self.recipe.updated_at = self.recipe.updated_at.replace(
+            year=self.recipe.updated_at.year + 1
+        )
+        Recipe.objects.filter(pk=self.recipe.pk).update(
+            updated_at=self.recipe.updated_at
+        )
+        self.assertEqual(client.get(
+            self.url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        ).status_code, 200)
+        # Флаги пользователя без отметки времени: только ETag.
+        self.assertFalse(self.client.get(self.url).has_header(
+            'Last-Modified'
+        ))
+
+    def test_me_not_modified(self):
+        url = '/api/users/me/'
+        response = self.client.get(url)
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                self.revalidate(url, response).status_code, 304
+            )
+        self.user.first_name = 'Новое'
+        self.user.save()
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+    def test_shopping_cart_not_modified(self):
+        url = '/api/recipes/download_shopping_cart/'
+        self.assertEqual(self.client.get(url).status_code, 400)
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipe)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.revalidate(url, response).status_code, 304)
+        ShoppingCart.objects.all().delete()
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipe)
+        response = self.revalidate(url, response)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('соль (г) — 5', b''.join(
+            response.streaming_content
+        ).decode())
+
+
+class ProfilingTest(TestCase):
+    """Проверка профилирования запросов и отчетов для staff."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create(
+            email='admin@example.com', username='admin',
+            first_name='A', last_name='A', is_staff=True
+        )
+
+    def setUp(self):
+        profiler.reset()
+        self.addCleanup(profiler.reset)
+
+    def test_disabled_by_default(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            ProfilingMiddleware(lambda request: HttpResponse())
+
+    def test_collects_folded_stacks(self):
+        def view(request):
+            profiler.sample()
+            return HttpResponse()
+
+        with self.settings(PROFILING_TOKEN='secret'):
+            middleware = ProfilingMiddleware(view)
+        middleware(RequestFactory().get('/', HTTP_X_PROFILE='wrong'))
+        self.assertEqual(profiler.summary(), {})
+        middleware(RequestFactory().get('/', HTTP_X_PROFILE='secret'))
+        self.assertEqual(
+            profiler.summary(),
+            {'[unresolved]': {'requests': 1, 'samples': 1}}
+        )
+        stack, count = profiler.folded('[unresolved]').rsplit(' ', 1)
+        self.assertTrue(stack.endswith(
+            'api.middleware:__call__;api.tests:view;api.profiling:sample'
+        ))
+        self.assertEqual(count, '1\n')
+
+    def test_staff_reports(self):
+        already_tracing = tracemalloc.is_tracing()
+        with self.settings(
+            PROFILING_TOKEN='secret', PROFILING_TRACEMALLOC=True
+        ):
+            client = APIClient()
+            client.get('/api/recipes/', HTTP_X_PROFILE='secret')
+        if not already_tracing:
+            tracemalloc.stop()
+        self.assertEqual(
+            client.get('/api/debug/profile/').status_code, 401
+        )
+        client.force_authenticate(self.admin)
+        response = client.get('/api/debug/profile/')
+        self.assertEqual(
+            response.data['views']['api:recipe-list']['requests'], 1
+        )
+        response = client.get('/api/debug/allocations/')
+        self.assertTrue(response.data['views']['api:recipe-list'])
+        client.delete('/api/debug/profile/')
+        self.assertEqual(profiler.summary(), {})
+
+
+class EdgeCacheTest(TestCase):
+    """Заголовки для кеша nginx и его сброс после изменений."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            email='user@example.com', username='user',
+            first_name='U', last_name='U'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.user, name='Рецепт', image='recipes/test.png',
+            text='Текст', cooking_time=10
+        )
+
+    def test_anonymous_responses_are_public(self):
+        client = APIClient()
+        for url, ttl in (
+            ('/api/recipes/', '10'),
+            (f'/api/recipes/{self.recipe.id}/', '10'),
+            ('/api/ingredients/', '300'),
+        ):
+            with self.settings(
+                EDGE_CACHE_RECIPES_TTL=10, EDGE_CACHE_INGREDIENTS_TTL=300
+            ):
+                response = client.get(url)
+            self.assertEqual(response['X-Accel-Expires'], ttl)
+            self.assertEqual(
+                set(response['Cache-Control'].split(', ')),
+                {'public', 'max-age=0', f's-maxage={ttl}'}
+            )
+            self.assertIn('Authorization', response['Vary'])
+            self.assertIn('Cookie', response['Vary'])
+        response = client.get(f'/api/recipes/{self.recipe.id}/get-link/')
+        self.assertFalse(response.has_header('X-Accel-Expires'))
+
+    def test_authenticated_responses_are_private(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/recipes/')
+        self.assertFalse(response.has_header('X-Accel-Expires'))
+        self.assertIn('private', response['Cache-Control'])
+
+    @override_settings(
+        EDGE_CACHE_PURGE_URL='http://nginx:8081',
+        EDGE_CACHE_HOST='foodgram.example.com'
+    )
+    def test_purge_after_recipe_change(self):
+        Task.objects.all().delete()
+        self.recipe.name = 'Новое название'
+        self.recipe.save()
+        task = Task.objects.get(name='edge_cache.purge')
+        self.assertEqual(task.payload['paths'], [
+            '/api/recipes/', f'/api/recipes/{self.recipe.id}/'
+        ])
+        with patch('urllib.request.urlopen') as urlopen:
+            edge_cache.purge([task.payload])
+        requests = [call.args[0] for call in urlopen.call_args_list]
+        self.assertEqual(
+            [request.full_url for request in requests],
+            [
+                'http://nginx:8081/api/recipes/',
+                f'http://nginx:8081/api/recipes/{self.recipe.id}/',
+            ]
+        )
+        self.assertEqual(
+            requests[0].get_header('Host'), 'foodgram.example.com'
+        )
+
+    def test_no_purge_without_nginx(self):
+        Task.objects.all().delete()
+        self.recipe.save()
+        self.assertFalse(
+            Task.objects.filter(name='edge_cache.purge').exists()
+        )
+
+
+class DeletionTest(TestCase):
+    """Проверка фонового удаления пользователей и рецептов."""
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        settings_override = self.settings(
+            MEDIA_ROOT=media_root.name, EXPORTS_ROOT=media_root.name
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.author = User.objects.create(
+            email='author@example.com', username='author',
+            first_name='A', last_name='A',
+            password=make_password('secret-Password-1')
+        )
+        self.reader = User.objects.create(
+            email='reader@example.com', username='reader',
+            first_name='R', last_name='R'
+        )
+        self.salt = Ingredient.objects.create(
+            name='соль', measurement_unit='г'
+        )
+        self.recipes = []
+        for number in range(3):
+            recipe = Recipe(
+                author=self.author, name=f'Рецепт {number}',
+                text='Текст', cooking_time=10
+            )
+            recipe.image.save(
+                'photo.png', ContentFile(f'image {number}'.encode()),
+                save=False
+            )
+            recipe.save()
+            IngredientAmount.objects.create(
+                recipe=recipe, ingredient=self.salt, amount=5
+            )
+            Favorite.objects.create(user=self.reader, recipe=recipe)
+            ShoppingCart.objects.create(user=self.reader, recipe=recipe)
+            self.recipes.append(recipe)
+        Subscription.objects.create(user=self.reader, author=self.author)
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def run_tasks(self):
+        call_command(
+            'run_tasks', processes=0, burst=True,
+            stdout=StringIO(), stderr=StringIO()
+        )
+
+    def test_recipe_hidden_then_purged(self):
+        recipe = self.recipes[0]
+        response = self.client.delete(f'/api/recipes/{recipe.id}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(
+            self.client.get(f'/api/recipes/{recipe.id}/').status_code, 404
+        )
+        self.assertTrue(Recipe.all_objects.filter(pk=recipe.pk).exists())
+        self.client.force_authenticate(self.reader)
+        response = self.client.get('/api/recipes/download_shopping_cart/')
+        self.assertIn(
+            'соль (г) — 10', b''.join(response.streaming_content).decode()
+        )
+        self.run_tasks()
+        self.assertFalse(Recipe.all_objects.filter(pk=recipe.pk).exists())
+        self.assertFalse(IngredientAmount.objects.filter(
+            recipe_id=recipe.pk
+        ).exists())
+        self.assertEqual(Favorite.objects.count(), 2)
+        self.assertEqual(ShoppingCart.objects.count(), 2)
+        self.assertFalse(default_storage.exists(recipe.image.name))
+        self.assertFalse(MediaFile.objects.filter(
+            name=recipe.image.name
+        ).exists())
+        self.assertTrue(default_storage.exists(self.recipes[1].image.name))
+        progress = Deletion.objects.get()
+        self.assertEqual(progress.status, Deletion.DONE)
+        self.assertEqual(progress.recipes_deleted, 1)
+
+    def test_user_purged_in_batches(self):
+        token = Token.objects.create(user=self.author)
+        response = self.client.delete(
+            f'/api/users/{self.author.id}/',
+            {'current_password': 'secret-Password-1'}, format='json'
+        )
+        self.assertEqual(response.status_code, 204)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.assertEqual(client.get('/api/users/me/').status_code, 401)
+        client = APIClient()
+        self.assertEqual(
+            client.get(f'/api/users/{self.author.id}/').status_code, 404
+        )
+        self.assertEqual(client.get('/api/recipes/').data['count'], 0)
+        with self.settings(DELETION_BATCH_SIZE=2):
+            self.run_tasks()
+        self.assertFalse(User.all_objects.filter(pk=self.author.pk).exists())
+        self.assertFalse(Recipe.all_objects.exists())
+        self.assertFalse(Subscription.objects.exists())
+        self.assertFalse(Favorite.objects.exists())
+        self.assertFalse(MediaFile.objects.exists())
+        progress = Deletion.objects.get()
+        self.assertEqual(
+            (progress.status, progress.recipes_total,
+             progress.recipes_deleted),
+            (Deletion.DONE, 3, 3)
+        )
+        # Ингредиенты, избранное и покупки рецептов, рецепты, подписка и
+        # сам пользователь.
+        self.assertEqual(progress.rows_deleted, 3 * 3 + 3 + 1 + 1)
+        self.assertGreater(
+            Task.objects.filter(name='deletion.purge').count(), 2
+        )
+
+    def test_hidden_recipes_not_counted(self):
+        deletion.delete_recipe(self.recipes[0])
+        self.client.force_authenticate(self.reader)
+        response = self.client.get('/api/users/subscriptions/')
+        author = response.data['results'][0]
+        self.assertEqual(author['recipes_count'], 2)
+        self.assertEqual(len(author['recipes']), 2)
+
+    def test_email_and_username_freed(self):
+        deletion.delete_user(self.author)
+        response = APIClient().post('/api/users/', {
+            'email': 'author@example.com', 'username': 'author',
+            'first_name': 'A', 'last_name': 'A',
+            'password': 'secret-Password-2',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def test_interrupted_step_resumes(self):
+        progress = deletion.delete_user(self.author)
+        with patch.object(
+            deletion, 'purge_references', side_effect=RuntimeError('сбой')
+        ):
+            self.run_tasks()
+        progress.refresh_from_db()
+        self.assertEqual(progress.status, Deletion.PENDING)
+        self.assertEqual(IngredientAmount.objects.count(), 3)
+        Task.objects.update(run_after=progress.created_at)
+        self.run_tasks()
+        progress.refresh_from_db()
+        self.assertEqual(progress.status, Deletion.DONE)
+        self.assertFalse(User.all_objects.filter(pk=self.author.pk).exists())
@@ -0,0 +1,179 @@
+"""Лента рецептов от авторов, на которых подписан пользователь.
+
+Новые рецепты раскладываются по лентам подписчиков при публикации
+(fan-out-on-write). Рецепты авторов, у которых больше
+TIMELINE_FANOUT_LIMIT подписчиков, в ленты не пишутся и подмешиваются
+при чтении (fan-out-on-read).
+
+Раскладка ленты не обрезает: воркер очереди (`manage.py run_tasks`) раз
+в TIMELINE_TRIM_INTERVAL секунд вызывает trim_overfull(), и до этого
+ленты могут ненадолго превышать TIMELINE_MAX_LENGTH.
+"""
+import base64
+import binascii
+import heapq
+from datetime import datetime
+
+from django.conf import settings
+from django.db.models import Count, Exists, F, OuterRef, Q, Window
+from django.db.models.functions import RowNumber
+
+from .models import Recipe, Subscription, TimelineEntry
+
+FANOUT_BATCH_SIZE = 1000
+
+
+def max_length():
+    return getattr(settings, 'TIMELINE_MAX_LENGTH', 1000)
+
+
+def fanout_limit():
+    return getattr(settings, 'TIMELINE_FANOUT_LIMIT', 10000)
+
+
+def is_celebrity(author_id):
+    """Слишком много подписчиков для раскладки рецептов по лентам."""
+    return Subscription.objects.filter(
+        author_id=author_id
+    )[:fanout_limit() + 1].count() > fanout_limit()
+
+
+def fan_out(recipes):
+    """Добавляет новые рецепты в ленты подписчиков их авторов."""
+    by_author = {}
+    for recipe in recipes:
+        by_author.setdefault(recipe.author_id, []).append(recipe)
+    for author_id, author_recipes in by_author.items():
+        if is_celebrity(author_id):
+            continue
+        followers = list(Subscription.objects.filter(
+            author_id=author_id
+        ).values_list('user_id', flat=True))
+        if not followers:
+            continue
+        TimelineEntry.objects.bulk_create(
+            (
+                TimelineEntry(
+                    user_id=user_id,
+                    recipe_id=recipe.id,
+                    pub_date=recipe.pub_date,
+                )
+                for user_id in followers
+                for recipe in author_recipes
+            ),
+            batch_size=FANOUT_BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+
+
+def backfill(user, author):
+    """Заполняет ленту последними рецептами нового автора из подписок."""
+    if is_celebrity(author.id):
+        return
+    TimelineEntry.objects.bulk_create(
+        (
+            TimelineEntry(user=user, recipe_id=recipe_id, pub_date=pub_date)
+            for recipe_id, pub_date in Recipe.objects.filter(
+                author=author
+            ).order_by('-pub_date', '-id').values_list(
+                'id', 'pub_date'
+            )[:max_length()]
+        ),
+        ignore_conflicts=True,
+    )
+    trim([user.id])
+
+
+def remove(user, author):
+    """Убирает из ленты рецепты автора после отписки."""
+    TimelineEntry.objects.filter(user=user, recipe__author=author).delete()
+
+
+def trim(user_ids):
+    """Оставляет в лентах не больше TIMELINE_MAX_LENGTH записей."""
+    stale = list(TimelineEntry.objects.filter(
+        user_id__in=user_ids
+    ).annotate(position=Window(
+        RowNumber(),
+        partition_by=F('user_id'),
+        order_by=TimelineEntry._meta.ordering,
+    )).filter(position__gt=max_length()).values_list('id', flat=True))
+    if stale:
+        TimelineEntry.objects.filter(id__in=stale).delete()
+
+
+def trim_overfull(batch_size=FANOUT_BATCH_SIZE):
+    """Обрезает только ленты длиннее TIMELINE_MAX_LENGTH.
+
+    Возвращает число обрезанных лент.
+    """
+    overfull = list(TimelineEntry.objects.order_by().values(
+        'user_id'
+    ).annotate(count=Count('id')).filter(
+        count__gt=max_length()
+    ).values_list('user_id', flat=True))
+    for start in range(0, len(overfull), batch_size):
+        trim(overfull[start:start + batch_size])
+    return len(overfull)
+
+
+def encode_cursor(pub_date, recipe_id):
+    value = f'{pub_date.isoformat()}|{recipe_id}'
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Возвращает (pub_date, recipe_id) или вызывает ValueError."""
+    try:
+        value = base64.urlsafe_b64decode(cursor.encode()).decode()
+    except (UnicodeError, binascii.Error):
+        raise ValueError('Некорректный курсор')
+    pub_date, _, recipe_id = value.partition('|')
+    return datetime.fromisoformat(pub_date), int(recipe_id)
+
+
+def get_page(user, cursor=None, limit=10):
+    """Возвращает id рецептов страницы ленты и курсор следующей.
+
+    Записи ленты и рецепты популярных авторов читаются по индексам
+    (user, -pub_date) и (author, -pub_date) и сливаются по дате.
+    """
+    entries = TimelineEntry.objects.filter(user=user)
+    # Как в is_celebrity, подписчики считаются не дальше
+    # TIMELINE_FANOUT_LIMIT + 1: есть ли подписчик с этим смещением.
+    celebrities = Subscription.objects.filter(user=user).filter(Exists(
+        Subscription.objects.filter(
+            author=OuterRef('author')
+        ).order_by()[fanout_limit():fanout_limit() + 1]
+    )).values('author')
+    celebrity_recipes = Recipe.objects.filter(author__in=celebrities)
+    if cursor is not None:
+        pub_date, recipe_id = cursor
+        entries = entries.filter(
+            Q(pub_date__lt=pub_date)
+            | Q(pub_date=pub_date, recipe_id__lt=recipe_id)
+        )
+        celebrity_recipes = celebrity_recipes.filter(
+            Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, id__lt=recipe_id)
+        )
+    merged = heapq.merge(
+        entries.order_by('-pub_date', '-recipe_id').values_list(
+            'pub_date', 'recipe_id'
+        )[:limit + 1],
+        celebrity_recipes.order_by('-pub_date', '-id').values_list(
+            'pub_date', 'id'
+        )[:limit + 1],
+        reverse=True,
+    )
+    page = []
+    for item in merged:
+        if page and page[-1] == item:
+            continue
+        page.append(item)
+        if len(page) > limit:
+            break
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = encode_cursor(*page[-1])
+    return [recipe_id for _, recipe_id in page], next_cursor
@@ -0,0 +1,131 @@
+"""Канонические ингредиенты и перевод единиц измерения.
+
+Ингредиенты, названия которых совпадают после нормализации (регистр,
+«ё», пробелы и знаки препинания), ссылаются на один
+CanonicalIngredient. Единица измерения ссылается на строку
+UnitConversion с базовой единицей и целым множителем, поэтому список
+покупок суммирует «сахар, кг» и «сахар, г» одним SQL-запросом.
+
+Группировка входит в версию списка покупок пользователя, поэтому
+изменение связей или множителей меняет версии списков, в которых есть
+затронутые ингредиенты (bump_shopping_carts).
+
+Функции принимают реестр моделей (django.apps.apps или apps миграции),
+чтобы ими могла пользоваться и миграция данных.
+"""
+import re
+
+from django.db.models import F
+from django.utils import timezone
+
+# Единица -> (базовая единица, множитель). Объем не переводится в
+# массу: без плотности продукта это было бы неверно.
+UNIT_CONVERSIONS = {
+    'г': ('г', 1),
+    'кг': ('г', 1000),
+    'мл': ('мл', 1),
+    'л': ('мл', 1000),
+    'ч. л': ('мл', 5),
+    'ст. л': ('мл', 15),
+    'стакан': ('мл', 250),
+    'шт': ('шт.', 1),
+}
+
+BATCH_SIZE = 1000
+
+
+def normalize_name(name):
+    name = name.lower().replace('ё', 'е')
+    name = re.sub(r'[^\w\s%-]', ' ', name)
+    return ' '.join(name.split())
+
+
+def normalize_unit(unit):
+    return ' '.join(unit.lower().replace('.', '. ').split()).rstrip('.')
+
+
+def sync_conversions(apps):
+    """Записывает UNIT_CONVERSIONS в таблицу UnitConversion."""
+    UnitConversion = apps.get_model('api', 'UnitConversion')
+    stored = {
+        unit: (base_unit, factor) for unit, base_unit, factor in
+        UnitConversion.objects.values_list('unit', 'base_unit', 'factor')
+    }
+    UnitConversion.objects.bulk_create(
+        [
+            UnitConversion(unit=unit, base_unit=base_unit, factor=factor)
+            for unit, (base_unit, factor) in UNIT_CONVERSIONS.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['unit'],
+        update_fields=['base_unit', 'factor'],
+    )
+    changed = [
+        unit for unit, conversion in UNIT_CONVERSIONS.items()
+        if unit in stored and stored[unit] != conversion
+    ]
+    if changed:
+        Ingredient = apps.get_model('api', 'Ingredient')
+        bump_shopping_carts(apps, Ingredient.objects.filter(
+            conversion__unit__in=changed
+        ).values('id'))
+
+
+def link_ingredients(apps, ingredient_ids=None):
+    """Связывает ингредиенты с каноническими и с переводом единиц.
+
+    Без ingredient_ids обрабатывает весь справочник.
+    """
+    Ingredient = apps.get_model('api', 'Ingredient')
+    CanonicalIngredient = apps.get_model('api', 'CanonicalIngredient')
+    UnitConversion = apps.get_model('api', 'UnitConversion')
+    queryset = Ingredient.objects.order_by('id')
+    if ingredient_ids is not None:
+        queryset = queryset.filter(id__in=ingredient_ids)
+    rows = list(queryset.values_list(
+        'id', 'name', 'measurement_unit', 'canonical_id', 'conversion_id'
+    ))
+    names = {}
+    for _, name, *_ in rows:
+        names.setdefault(normalize_name(name), name)
+    CanonicalIngredient.objects.bulk_create(
+        [
+            CanonicalIngredient(key=key, name=name)
+            for key, name in names.items()
+        ],
+        batch_size=BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+    canonical = dict(CanonicalIngredient.objects.filter(
+        key__in=names
+    ).values_list('key', 'id'))
+    conversions = dict(UnitConversion.objects.values_list('unit', 'id'))
+    changed = []
+    for pk, name, unit, canonical_id, conversion_id in rows:
+        linked = (
+            canonical[normalize_name(name)],
+            conversions.get(normalize_unit(unit)),
+        )
+        if linked != (canonical_id, conversion_id):
+            changed.append(Ingredient(
+                id=pk, canonical_id=linked[0], conversion_id=linked[1]
+            ))
+    Ingredient.objects.bulk_update(
+        changed, ['canonical', 'conversion'], batch_size=BATCH_SIZE
+    )
+    for start in range(0, len(changed), BATCH_SIZE):
+        bump_shopping_carts(apps, [
+            ingredient.id for ingredient in changed[start:start + BATCH_SIZE]
+        ])
+    return len(changed)
+
+
+def bump_shopping_carts(apps, ingredient_ids):
+    """Меняет версию списков покупок с рецептами из этих ингредиентов."""
+    User = apps.get_model('api', 'User')
+    User._base_manager.filter(
+        shopping_cart__recipe__ingredients__in=ingredient_ids
+    ).update(
+        shopping_cart_version=F('shopping_cart_version') + 1,
+        shopping_cart_updated_at=timezone.now(),
+    )
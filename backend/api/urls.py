@@ -3,7 +3,8 @@ from rest_framework.routers import DefaultRouter
 from rest_framework.authtoken import views
 
 from .views import (
-    CustomUserViewSet, IngredientViewSet, RecipeViewSet
+    AllocationsView, CustomUserViewSet, IngredientViewSet, LivenessView,
+    ProfileView, ReadinessView, RecipeViewSet, TokenCreateView
 )
 
 app_name = 'api'
@@ -14,9 +15,15 @@ router.register('ingredients', IngredientViewSet)
 router.register('recipes', RecipeViewSet)
 
 urlpatterns = [
+    path('health/live/', LivenessView.as_view(), name='health-live'),
+    path('health/ready/', ReadinessView.as_view(), name='health-ready'),
+    path('debug/profile/', ProfileView.as_view(), name='debug-profile'),
+    path('debug/allocations/', AllocationsView.as_view(),
+         name='debug-allocations'),
     path('users/me/avatar/',
          CustomUserViewSet.as_view({'put': 'set_avatar', 'delete': 'delete_avatar'})),
     path('', include(router.urls)),
+    path('auth/token/login/', TokenCreateView.as_view(), name='login'),
     path('auth/', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
 ]
\ No newline at end of file
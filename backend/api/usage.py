@@ -0,0 +1,66 @@
+"""Сколько рецептов использует каждый ингредиент.
+
+Счетчик Ingredient.recipes_count ранжирует подсказки в каталоге
+(api.catalogue). Ингредиент входит в рецепт не больше одного раза,
+поэтому счетчик равен числу строк IngredientAmount с этим ингредиентом.
+
+Отдельно сохраненную строку IngredientAmount учитывает сигнал, а
+пачки строк (bulk_create, очистка списка ингредиентов рецепта, удаление
+в api.deletion) учитывают сами эти места: add() и remove() сдвигают
+счетчик одним UPDATE на каждое значение сдвига. Сигнал на удаление
+строк не вешается: с ним Django удалял бы их по одной.
+
+recount() пересчитывает счетчик по таблице; его использует и миграция
+данных, поэтому функции принимают реестр моделей.
+"""
+from collections import Counter, defaultdict
+
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+
+def adjust(apps, deltas):
+    """Сдвигает счетчики на значения словаря «id ингредиента -> сдвиг»."""
+    Ingredient = apps.get_model('api', 'Ingredient')
+    ids_by_delta = defaultdict(list)
+    for ingredient_id, delta in deltas.items():
+        if delta:
+            ids_by_delta[delta].append(ingredient_id)
+    for delta, ids in ids_by_delta.items():
+        # Не ниже нуля, даже если счетчик разошелся с таблицей:
+        # удаление рецепта не должно падать из-за него.
+        Ingredient.objects.filter(id__in=ids).update(
+            recipes_count=Greatest(F('recipes_count') + delta, 0)
+        )
+
+
+def add(apps, ingredient_ids):
+    """Учитывает новые строки IngredientAmount с этими ингредиентами."""
+    adjust(apps, Counter(ingredient_ids))
+
+
+def remove(apps, queryset):
+    """Учитывает удаление строк IngredientAmount из queryset.
+
+    Вызывается до удаления, пока строки еще есть.
+    """
+    adjust(apps, {
+        ingredient_id: -count for ingredient_id, count in Counter(
+            queryset.values_list('ingredient_id', flat=True)
+        ).items()
+    })
+
+
+def recount(apps, ingredient_ids=None):
+    """Пересчитывает счетчики; без ingredient_ids — для всех."""
+    Ingredient = apps.get_model('api', 'Ingredient')
+    IngredientAmount = apps.get_model('api', 'IngredientAmount')
+    queryset = Ingredient.objects.all()
+    if ingredient_ids is not None:
+        queryset = queryset.filter(id__in=ingredient_ids)
+    counts = IngredientAmount.objects.filter(
+        ingredient=OuterRef('pk')
+    ).order_by().values('ingredient').annotate(
+        count=Count('id')
+    ).values('count')
+    return queryset.update(recipes_count=Coalesce(Subquery(counts), 0))
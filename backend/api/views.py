@@ -1,18 +1,27 @@
+import logging
+import os
+import tracemalloc
+
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from django.shortcuts import render
-from rest_framework.permissions import IsAuthenticated, AllowAny, IsAuthenticatedOrReadOnly, SAFE_METHODS
+from rest_framework.permissions import IsAuthenticated, AllowAny, IsAuthenticatedOrReadOnly, IsAdminUser, SAFE_METHODS
 from rest_framework.exceptions import NotFound, PermissionDenied, AuthenticationFailed, ValidationError
-from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import HttpResponse, FileResponse
+from django.contrib.auth import get_user_model, user_logged_in
+from django.db.models import (
+    Count, Exists, F, IntegerField, Max, OuterRef, Prefetch, Subquery, Sum,
+    Value
+)
+from django.db.models.functions import Coalesce
+from django.db import DatabaseError, connection
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
 from djoser.views import UserViewSet
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from io import BytesIO
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.filters import SearchFilter
+from rest_framework.utils.urls import replace_query_param
 
 from .models import (
     Ingredient, Recipe, IngredientAmount,
@@ -25,25 +34,213 @@ from .serializers import (
     TokenCreateSerializer, TokenGetResponseSerializer,
     SetAvatarSerializer, SetAvatarResponseSerializer,
     RecipeGetShortLinkSerializer, FavoriteSerializer,
-    ShoppingCartSerializer, RecipeUpdateSerializer
+    ShoppingCartSerializer, RecipeUpdateSerializer, parse_sparse_fields
+)
+from .fast_serializers import (
+    FastRecipeSerializer, FastSubscriptionSerializer, FastUserSerializer
 )
 from .filters import (RecipeFilter, IngredientFilter)
 from .pagination import CustomPageNumberPagination
+from . import (
+    catalogue, deletion, delivery, similarity, startup, tasks, timeline
+)
+from .conditional import conditional
+from .edge_cache import EdgeCacheMixin
+from .profiling import profiler
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
+
+BATCH_MAX_IDS = 300
+SIMILAR_MAX_LIMIT = 50
+RECIPE_COLUMNS = {'name', 'image', 'text', 'cooking_time'}
+USER_COLUMNS = {'email', 'username', 'first_name', 'last_name', 'avatar'}
+USER_COUNTS = {'recipes_count', 'followers_count'}
+
+
+def annotate_subscription(queryset, user):
+    """Добавляет к пользователям флаг подписки текущего пользователя."""
+    if not user.is_authenticated:
+        return queryset.annotate(is_subscribed=Value(False))
+    return queryset.annotate(is_subscribed=Exists(
+        Subscription.objects.filter(user=user, author=OuterRef('pk'))
+    ))
+
+
+def annotate_user_counts(queryset, names):
+    """Добавляет к пользователям запрошенные счетчики рецептов и
+    подписчиков. Подзапросы вместо Count() не размножают строки при
+    нескольких счетчиках."""
+    counts = {
+        'recipes_count': Recipe.objects.filter(author=OuterRef('pk')),
+        'followers_count': Subscription.objects.filter(
+            author=OuterRef('pk'), user__deleted_at__isnull=True
+        ),
+    }
+    return queryset.annotate(**{
+        name: Coalesce(Subquery(
+            counts[name].values('author').annotate(
+                count=Count('id')
+            ).values('count'),
+            output_field=IntegerField()
+        ), 0)
+        for name in names if name in counts
+    })
+
+
+def annotate_recipes(queryset, user, fields=None, expand=()):
+    """Готовит рецепты к сериализации за постоянное число запросов.
+
+    При заданном ?fields= загружаются только нужные колонки, а
+    подзапросы и prefetch для незапрошенных полей пропускаются.
+    """
+    def wanted(name):
+        return fields is None or name in fields
+
+    def expanded(name):
+        return fields is None or name in expand or bool(fields[name])
+
+    if fields is not None:
+        queryset = queryset.only(
+            'id', 'author', *(RECIPE_COLUMNS & set(fields))
+        )
+    if wanted('author') and expanded('author'):
+        author_fields = fields and fields['author']
+        authors = User.objects.all()
+        if author_fields:
+            authors = authors.only('id', *(USER_COLUMNS & author_fields))
+        if not author_fields or 'is_subscribed' in author_fields:
+            authors = annotate_subscription(authors, user)
+        queryset = queryset.prefetch_related(Prefetch('author', authors))
+    if wanted('ingredients'):
+        amounts = IngredientAmount.objects.all()
+        ingredient_fields = fields and fields['ingredients']
+        if not expanded('ingredients'):
+            amounts = amounts.only('id', 'recipe', 'ingredient', 'amount')
+        elif not ingredient_fields or ingredient_fields - {'id', 'amount'}:
+            amounts = amounts.select_related('ingredient')
+        queryset = queryset.prefetch_related(
+            Prefetch('ingredient_amounts', amounts)
+        )
+    if wanted('is_favorited'):
+        queryset = queryset.annotate(is_favorited=Exists(
+            Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+        ) if user.is_authenticated else Value(False))
+    if wanted('is_in_shopping_cart'):
+        queryset = queryset.annotate(is_in_shopping_cart=Exists(
+            ShoppingCart.objects.filter(user=user, recipe=OuterRef('pk'))
+        ) if user.is_authenticated else Value(False))
+    return queryset
+
+
+def requests_user_counts(request):
+    """Запрошены ли счетчики пользователей, у которых нет своей версии."""
+    return any(
+        name in request.query_params.get(param, '')
+        for param in ('fields', 'expand') for name in USER_COUNTS
+    )
+
+
+def me_validators(view, request, **kwargs):
+    if requests_user_counts(request):
+        return None
+    user = request.user
+    return (user.pk, user.updated_at), user.updated_at
+
+
+def recipe_validators(view, request, pk=None, **kwargs):
+    """Версия рецепта: изменения рецепта, автора и флаги пользователя.
+
+    Флаги избранного, списка покупок и подписки не имеют отметки
+    времени, поэтому для авторизованных отдается только ETag.
+    """
+    if requests_user_counts(request):
+        return None
+    user = request.user
+    try:
+        queryset = Recipe.objects.filter(pk=pk)
+    except ValueError:
+        return None
+    if user.is_authenticated:
+        queryset = queryset.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk')
+            )),
+            is_subscribed=Exists(Subscription.objects.filter(
+                user=user, author=OuterRef('author')
+            )),
+        )
+        names = ('is_favorited', 'is_in_shopping_cart', 'is_subscribed')
+    else:
+        names = ()
+    row = queryset.values('updated_at', 'author__updated_at', *names).first()
+    if row is None:
+        return None
+    last_modified = max(row['updated_at'], row['author__updated_at'])
+    return (
+        (user.pk, last_modified, *(row[name] for name in names)),
+        None if user.is_authenticated else last_modified
+    )
+
+
+def shopping_cart_validators(view, request, **kwargs):
+    version = view.get_shopping_cart_version(request)
+    if version is None:
+        return None
+    return (request.user.pk, version['version']), version['last_modified']
+
+
+class FastListMixin:
+    """Отдача списков через быстрые сериализаторы из fast_serializers."""
+
+    def fast_list(self, serializer, queryset):
+        page = self.paginate_queryset(serializer.values(queryset))
+        if page is not None:
+            return self.get_paginated_response(serializer.serialize(page))
+        return Response(serializer.serialize(serializer.values(queryset)))
 
 
-class CustomUserViewSet(UserViewSet):
+class CustomUserViewSet(FastListMixin, UserViewSet):
     """Представление для работы с пользователями."""
     pagination_class = CustomPageNumberPagination
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action not in ('list', 'retrieve'):
+            return queryset
+        fields, expand = parse_sparse_fields(self.request)
+        if fields is not None:
+            queryset = queryset.only('id', *(USER_COLUMNS & set(fields)))
+        if fields is None or 'is_subscribed' in fields:
+            queryset = annotate_subscription(queryset, self.request.user)
+        return annotate_user_counts(queryset, expand | set(fields or ()))
+
+    def list(self, request, *args, **kwargs):
+        fields, expand = parse_sparse_fields(request)
+        if fields is not None or expand & USER_COUNTS:
+            return super().list(request, *args, **kwargs)
+        return self.fast_list(
+            FastUserSerializer(request),
+            self.filter_queryset(self.get_queryset())
+        )
+
+    def perform_destroy(self, instance):
+        deletion.delete_user(instance)
+
     @action(
         detail=False,
         methods=['get'],
         permission_classes=[IsAuthenticated]
     )
+    @conditional(me_validators)
     def me(self, request):
-        """Получение информации о текущем пользователе."""
+        """Получение информации о текущем пользователе.
+
+        Пользователь уже загружен аутентификацией, повторно не читается.
+        """
         serializer = self.get_serializer(request.user)
         return Response(serializer.data)
 
@@ -71,17 +268,10 @@ class CustomUserViewSet(UserViewSet):
     def subscriptions(self, request):
         """Получение списка подписок."""
         user = request.user
-        authors = User.objects.filter(following__user=user)
-        page = self.paginate_queryset(authors)
-        if page is not None:
-            serializer = SubscriptionSerializer(
-                page, many=True, context={'request': request}
-            )
-            return self.get_paginated_response(serializer.data)
-        serializer = SubscriptionSerializer(
-            authors, many=True, context={'request': request}
+        authors = annotate_subscription(
+            User.objects.filter(following__user=user), user
         )
-        return Response(serializer.data)
+        return self.fast_list(FastSubscriptionSerializer(request), authors)
 
     @action(
         detail=True,
@@ -98,12 +288,14 @@ class CustomUserViewSet(UserViewSet):
             if Subscription.objects.filter(user=user, author=author).exists():
                 raise ValidationError({'detail': 'Вы уже подписаны на этого пользователя'})
             Subscription.objects.create(user=user, author=author)
+            timeline.backfill(user, author)
             serializer = SubscriptionSerializer(author, context={'request': request})
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         subscription = Subscription.objects.filter(user=user, author=author)
         if not subscription.exists():
             raise ValidationError({'detail': 'Вы не были подписаны на этого пользователя'})
         subscription.delete()
+        timeline.remove(user, author)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -122,8 +314,7 @@ class CustomUserViewSet(UserViewSet):
         user = request.user
         serializer = SetAvatarSerializer(data=request.data)
         if serializer.is_valid():
-            if user.avatar:
-                user.avatar.delete()
+            # Старый файл освобождается через счётчик ссылок в api.signals.
             user.avatar = serializer.validated_data['avatar']
             user.save()
             return Response(
@@ -150,13 +341,12 @@ class CustomUserViewSet(UserViewSet):
             )
         user = request.user
         if user.avatar:
-            user.avatar.delete()
             user.avatar = None
             user.save()
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(EdgeCacheMixin, viewsets.ReadOnlyModelViewSet):
     """Вьюсет для ингредиентов."""
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
@@ -164,21 +354,62 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
     pagination_class = None
+    edge_cache_ttl = 'EDGE_CACHE_INGREDIENTS_TTL'
+
+    def list(self, request, *args, **kwargs):
+        # Каталог без лишних параметров отдается из памяти процесса;
+        # подсказки по name ранжирует и ограничивает api.catalogue.
+        if set(request.query_params) - {'name'}:
+            return super().list(request, *args, **kwargs)
+        return Response(
+            catalogue.get().search(request.query_params.get('name', ''))
+        )
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(EdgeCacheMixin, FastListMixin, viewsets.ModelViewSet):
     """Представление для работы с рецептами."""
     queryset = Recipe.objects.all()
     permission_classes = (IsAuthenticatedOrReadOnly,)
     pagination_class = CustomPageNumberPagination
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    edge_cache_ttl = 'EDGE_CACHE_RECIPES_TTL'
 
     def get_queryset(self):
         """Получение queryset с учетом фильтров."""
         queryset = super().get_queryset()
+        if self.request.method in SAFE_METHODS:
+            queryset = annotate_recipes(
+                queryset, self.request.user,
+                *parse_sparse_fields(self.request)
+            )
         return queryset
 
+    def list(self, request, *args, **kwargs):
+        if parse_sparse_fields(request)[0] is not None:
+            return super().list(request, *args, **kwargs)
+        return self.fast_list(
+            FastRecipeSerializer(request),
+            self.filter_queryset(self.get_queryset())
+        )
+
+    @conditional(recipe_validators)
+    def retrieve(self, request, *args, **kwargs):
+        if parse_sparse_fields(request)[0] is not None:
+            return super().retrieve(request, *args, **kwargs)
+        serializer = FastRecipeSerializer(request)
+        try:
+            data = serializer.serialize(serializer.values(
+                self.filter_queryset(self.get_queryset()).filter(
+                    pk=kwargs['pk']
+                )
+            ))
+        except ValueError:
+            data = None
+        if not data:
+            raise NotFound("Рецепт не найден")
+        return Response(data[0])
+
     def get_serializer_class(self):
         if self.request.method in ['POST']:
             return RecipeCreateSerializer
@@ -187,7 +418,11 @@ class RecipeViewSet(viewsets.ModelViewSet):
         return RecipeSerializer
 
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        recipe = serializer.save(author=self.request.user)
+        tasks.enqueue(
+            'timeline.fan_out', {'recipe_ids': [recipe.id]},
+            key=f'timeline.fan_out:{recipe.id}'
+        )
 
     def get_object(self):
         try:
@@ -211,6 +446,105 @@ class RecipeViewSet(viewsets.ModelViewSet):
         except Exception:
             raise NotFound("Рецепт не найден")
 
+    def perform_destroy(self, instance):
+        deletion.delete_recipe(instance)
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[AllowAny]
+    )
+    def batch(self, request):
+        """Получение нескольких рецептов по списку id."""
+        try:
+            raw_ids = request.query_params.get('ids', '').split(',')
+            ids = list(dict.fromkeys(
+                int(pk) for pk in raw_ids if pk.strip()
+            ))
+        except ValueError:
+            raise ValidationError({'ids': 'Ожидается список id через запятую'})
+        if not ids:
+            raise ValidationError({'ids': 'Не указаны id рецептов'})
+        if len(ids) > BATCH_MAX_IDS:
+            raise ValidationError(
+                {'ids': f'Можно запросить не более {BATCH_MAX_IDS} рецептов'}
+            )
+        queryset = self.get_queryset().filter(id__in=ids)
+        if parse_sparse_fields(request)[0] is None:
+            serializer = FastRecipeSerializer(request)
+            recipes = {
+                recipe['id']: recipe for recipe in
+                serializer.serialize(serializer.values(queryset))
+            }
+            results = [recipes[pk] for pk in ids if pk in recipes]
+        else:
+            recipes = {recipe.id: recipe for recipe in queryset}
+            results = self.get_serializer(
+                [recipes[pk] for pk in ids if pk in recipes], many=True
+            ).data
+        return Response({
+            'results': results,
+            'missing': [pk for pk in ids if pk not in recipes],
+        })
+
+    @action(
+        detail=True,
+        methods=['get'],
+        permission_classes=[AllowAny]
+    )
+    def similar(self, request, pk=None):
+        """Рецепты с похожим набором ингредиентов."""
+        recipe = self.get_object()
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            raise ValidationError({'limit': 'Ожидается число'})
+        scores = dict(similarity.find_similar(
+            recipe.id, max(1, min(limit, SIMILAR_MAX_LIMIT))
+        ))
+        recipes = Recipe.objects.filter(id__in=scores)
+        data = RecipeMinifiedSerializer(
+            sorted(recipes, key=lambda item: -scores[item.id]),
+            many=True, context={'request': request}
+        ).data
+        for item in data:
+            item['similarity'] = round(scores[item['id']], 3)
+        return Response(data)
+
+    @action(
+        detail=False,
+        methods=['get'],
+        permission_classes=[IsAuthenticated],
+        url_path='timeline'
+    )
+    def timeline(self, request):
+        """Лента рецептов авторов из подписок."""
+        try:
+            cursor = request.query_params.get('cursor')
+            cursor = timeline.decode_cursor(cursor) if cursor else None
+            limit = int(request.query_params.get(
+                'limit', self.paginator.page_size
+            ))
+        except ValueError:
+            raise ValidationError({'detail': 'Некорректный курсор или limit'})
+        limit = max(1, min(limit, self.paginator.max_page_size))
+        ids, next_cursor = timeline.get_page(request.user, cursor, limit)
+        serializer = FastRecipeSerializer(request)
+        recipes = {
+            recipe['id']: recipe for recipe in serializer.serialize(
+                serializer.values(self.get_queryset().filter(id__in=ids))
+            )
+        }
+        next_url = None
+        if next_cursor is not None:
+            next_url = replace_query_param(
+                request.build_absolute_uri(), 'cursor', next_cursor
+            )
+        return Response({
+            'next': next_url,
+            'results': [recipes[pk] for pk in ids if pk in recipes],
+        })
+
     @action(
         detail=True,
         methods=['post', 'delete'],
@@ -288,45 +622,88 @@ class RecipeViewSet(viewsets.ModelViewSet):
         methods=['get'],
         permission_classes=[IsAuthenticated]
     )
+    @conditional(shopping_cart_validators)
     def download_shopping_cart(self, request):
         """Скачивание списка покупок."""
-        ingredients = self._get_ingredients_for_shopping_cart(request)
-        if not ingredients.exists():
+        version = self.get_shopping_cart_version(request)
+        if version is None:
             raise ValidationError({'detail': 'Список покупок пуст'})
-        shopping_list_content = self._generate_shopping_list_content(ingredients)
-        return self._create_file_response(shopping_list_content)
+        name = f'shopping_cart/{request.user.id}/{version["version"]}.txt'
+        delivery.get_or_create_export(
+            name,
+            lambda: self._generate_shopping_list_content(
+                self._get_ingredients_for_shopping_cart(request)
+            ).encode('utf-8')
+        )
+        return delivery.send_file(
+            request, name, 'shopping_list.txt', 'text/plain; charset=utf-8'
+        )
+
+    def get_shopping_cart_version(self, request):
+        """Версия списка покупок для кеширования файла и ETag.
+
+        Счетчик изменений списка растет при добавлении и удалении
+        рецептов, а updated_at рецептов — при замене их ингредиентов.
+        Результат запоминается на время запроса. Для пустого списка
+        возвращается None.
+        """
+        if not hasattr(request, '_shopping_cart_version'):
+            row = User.objects.filter(pk=request.user.pk).values(
+                'shopping_cart_version', 'shopping_cart_updated_at'
+            ).annotate(
+                recipes_updated_at=Max('shopping_cart__recipe__updated_at')
+            ).order_by('pk').first()
+            version = None
+            if row is not None and row['recipes_updated_at'] is not None:
+                last_modified = max(
+                    row['recipes_updated_at'],
+                    row['shopping_cart_updated_at']
+                    or row['recipes_updated_at']
+                )
+                version = {
+                    'version': '{}-{}'.format(
+                        row['shopping_cart_version'],
+                        int(row['recipes_updated_at'].timestamp() * 1e6)
+                    ),
+                    'last_modified': last_modified,
+                }
+            request._shopping_cart_version = version
+        return request._shopping_cart_version
 
     def _get_ingredients_for_shopping_cart(self, request):
-        """Получение ингредиентов для списка покупок."""
+        """Получение ингредиентов для списка покупок.
+
+        Варианты названия одного ингредиента и его единицы измерения
+        сводятся к каноническому ингредиенту и базовой единице
+        (см. api.units) и суммируются в том же запросе.
+        """
         return IngredientAmount.objects.filter(
-            recipe__shopping_cart__user=request.user
+            recipe__shopping_cart__user=request.user,
+            recipe__deleted_at__isnull=True,
         ).values(
-            'ingredient__name',
-            'ingredient__measurement_unit'
+            name=Coalesce(
+                'ingredient__canonical__name', 'ingredient__name'
+            ),
+            unit=Coalesce(
+                'ingredient__conversion__base_unit',
+                'ingredient__measurement_unit'
+            ),
         ).annotate(
-            amount=Sum('amount')
-        ).order_by('ingredient__name')
+            amount=Sum(F('amount') * Coalesce(
+                'ingredient__conversion__factor', 1
+            ))
+        ).order_by('name', 'unit')
 
     def _generate_shopping_list_content(self, ingredients):
         """Генерация содержимого списка покупок."""
         shopping_list = ['Список покупок:\n']
         for ingredient in ingredients:
-            name = ingredient['ingredient__name']
-            unit = ingredient['ingredient__measurement_unit']
+            name = ingredient['name']
+            unit = ingredient['unit']
             amount = ingredient['amount']
             shopping_list.append(f'{name} ({unit}) — {amount}\n')
         return ''.join(shopping_list)
 
-    def _create_file_response(self, content):
-        """Создание файлового ответа для скачивания."""
-        file = BytesIO(content.encode('utf-8'))
-        return FileResponse(
-            file,
-            as_attachment=True,
-            filename='shopping_list.txt',
-            content_type='text/plain; charset=utf-8'
-        )
-
     @action(
         detail=True,
         methods=['get'],
@@ -340,4 +717,105 @@ class RecipeViewSet(viewsets.ModelViewSet):
             recipe,
             context={'request': request}
         )
-        return Response(serializer.data)
\ No newline at end of file
+        return Response(serializer.data)
+
+
+class TokenCreateView(APIView):
+    """Получение токена по email и паролю.
+
+    Заменяет представление djoser, которое после проверки пароля еще раз
+    читает или создает токен.
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def post(self, request):
+        serializer = TokenCreateSerializer(
+            data=request.data, context={'request': request}
+        )
+        serializer.is_valid(raise_exception=True)
+        user_logged_in.send(
+            sender=User, request=request, user=serializer.user
+        )
+        return Response(serializer.validated_data)
+
+
+class ProfileView(APIView):
+    """Стеки профилируемых запросов этого воркера (см. api.profiling).
+
+    Без параметров — число запросов и снятых стеков по представлениям,
+    с ?view= — свернутые стеки представления для flamegraph.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        view = request.query_params.get('view')
+        if view is None:
+            return Response({
+                'pid': os.getpid(),
+                'views': profiler.summary(),
+            })
+        return HttpResponse(
+            profiler.folded(view), content_type='text/plain; charset=utf-8'
+        )
+
+    def delete(self, request):
+        profiler.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class AllocationsView(APIView):
+    """Крупнейшие выделения памяти по представлениям (tracemalloc)."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        try:
+            limit = int(request.query_params.get('limit', 20))
+        except ValueError:
+            raise ValidationError({'limit': 'Ожидается целое число'})
+        return Response({
+            'pid': os.getpid(),
+            'tracing': tracemalloc.is_tracing(),
+            'views': profiler.top_allocations(limit),
+        })
+
+
+class LivenessView(APIView):
+    """Процесс жив и обрабатывает запросы. База не проверяется, чтобы
+    ее недоступность не приводила к перезапуску контейнеров."""
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def get(self, request):
+        return Response({'status': 'ok'})
+
+
+class ReadinessView(APIView):
+    """Сервис готов принимать трафик: база доступна, миграции применены."""
+    authentication_classes = []
+    permission_classes = [AllowAny]
+    migrated = False
+
+    def get(self, request):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            # Граф миграций читается, только пока они не применены.
+            if not ReadinessView.migrated:
+                ReadinessView.migrated = not startup.pending_migrations()
+        except DatabaseError:
+            # Текст ошибки (адрес базы, драйвер) пишется только в лог.
+            logger.exception('Проверка готовности: база недоступна')
+            return Response(
+                {'status': 'unavailable'},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        if not ReadinessView.migrated:
+            return Response(
+                {
+                    'status': 'unavailable',
+                    'detail': 'Есть непримененные миграции'
+                },
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+        return Response({'status': 'ok'})
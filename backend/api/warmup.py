@@ -0,0 +1,106 @@
+"""Прогрев процесса перед fork воркеров gunicorn.
+
+Всё, что загружено здесь в мастер-процессе, воркеры получают готовым и
+разделяют с мастером по copy-on-write, вместо того чтобы строить заново
+при первом запросе в каждом воркере.
+"""
+import inspect
+import logging
+import time
+
+from django.apps import apps
+from django.db import connections
+from django.urls import URLResolver, get_resolver
+from rest_framework import serializers as drf_serializers
+
+from . import catalogue
+from . import serializers
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up_urls(resolver=None):
+    """Заполняет словари reverse/resolve всех вложенных URLResolver."""
+    resolver = resolver or get_resolver()
+    resolver.reverse_dict
+    count = 0
+    for pattern in resolver.url_patterns:
+        if isinstance(pattern, URLResolver):
+            count += warm_up_urls(pattern)
+        else:
+            count += 1
+    return count
+
+
+def warm_up_models():
+    """Строит кеши _meta (поля, обратные связи) всех моделей."""
+    models = apps.get_models()
+    for model in models:
+        model._meta.get_fields()
+    return len(models)
+
+
+def warm_up_serializers():
+    """Строит поля сериализаторов api: при этом заполняются кеши моделей,
+    валидаторов и ленивых переводов, которые DRF использует повторно."""
+    count = 0
+    for _, serializer_class in inspect.getmembers(
+        serializers, inspect.isclass
+    ):
+        if not issubclass(serializer_class, drf_serializers.Serializer):
+            continue
+        try:
+            serializer_class(context={}).fields
+        except Exception:
+            logger.debug('Не удалось прогреть %s', serializer_class,
+                         exc_info=True)
+            continue
+        count += 1
+    return count
+
+
+def warm_up():
+    """Выполняет все шаги прогрева и возвращает их длительность в мс."""
+    timings = {}
+    for name, step in (
+        ('urls', warm_up_urls),
+        ('models', warm_up_models),
+        ('serializers', warm_up_serializers),
+        ('ingredients', lambda: len(catalogue.load().rows)),
+    ):
+        started = time.perf_counter()
+        count = step()
+        timings[name] = (count, (time.perf_counter() - started) * 1000)
+    # Соединения мастера нельзя наследовать воркерам.
+    connections.close_all()
+    return timings
+
+
+def memory_usage():
+    """RSS, PSS и приватная память процесса в МБ.
+
+    PSS делит разделяемые страницы между процессами, поэтому разница между
+    RSS и приватной памятью показывает, сколько воркер получил от мастера
+    по copy-on-write.
+    """
+    usage = {}
+    try:
+        with open('/proc/self/smaps_rollup') as file:
+            for line in file:
+                key, _, value = line.partition(':')
+                if key in ('Rss', 'Pss', 'Private_Clean', 'Private_Dirty'):
+                    usage[key] = int(value.split()[0]) / 1024
+    except OSError:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        return {'rss': rss}
+    return {
+        'rss': usage.get('Rss', 0),
+        'pss': usage.get('Pss', 0),
+        'private': usage.get('Private_Clean', 0)
+        + usage.get('Private_Dirty', 0),
+    }
+
+
+def format_memory(usage):
+    return ', '.join(f'{key} {value:.1f} МБ' for key, value in usage.items())
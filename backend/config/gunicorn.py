@@ -0,0 +1,108 @@
+"""Конфигурация gunicorn: gunicorn -c python:config.gunicorn
+
+Приложение загружается в мастер-процессе (preload_app) и прогревается до
+fork, поэтому воркеры разделяют с мастером импортированные модули, URL,
+метаданные моделей и каталог ингредиентов. Воркеры пишут в лог время до
+первого запроса и память после него и при завершении.
+
+Переменные окружения:
+    GUNICORN_WORKER_CLASS  gthread (по умолчанию) или gevent
+    GUNICORN_WORKERS       число воркеров, по умолчанию 2 * CPU + 1
+    GUNICORN_THREADS       потоков на воркер gthread
+    GUNICORN_WORKER_CONNECTIONS  одновременных соединений воркера gevent
+    GUNICORN_MAX_REQUESTS  перезапуск воркера после N запросов (0 — никогда)
+    GUNICORN_MAX_REQUESTS_JITTER  случайная добавка к max_requests
+"""
+import gc
+import multiprocessing
+import os
+import time
+
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+if worker_class not in ('gthread', 'gevent', 'sync'):
+    raise RuntimeError(
+        f'Неподдерживаемый GUNICORN_WORKER_CLASS: {worker_class}'
+    )
+
+if worker_class == 'gevent':
+    # С preload_app приложение импортируется до того, как воркер gevent
+    # успеет пропатчить модули, поэтому патчим при загрузке конфигурации.
+    from gevent import monkey
+    monkey.patch_all()
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
+
+wsgi_app = 'config.wsgi:application'
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv(
+    'GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1
+))
+threads = int(os.getenv('GUNICORN_THREADS', '4'))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '100'))
+preload_app = True
+
+# Перезапуск воркеров ограничивает рост памяти, а разброс не даёт им
+# перезапуститься одновременно.
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '2000'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', '200'))
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '30'))
+graceful_timeout = 30
+keepalive = 5
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+_started_at = time.monotonic()
+_forked_at = None
+_first_request_at = None
+_served_first = False
+
+
+def when_ready(server):
+    from api.warmup import format_memory, memory_usage, warm_up
+
+    for name, (count, elapsed) in warm_up().items():
+        server.log.info('Прогрев %s: %d объектов за %.0f мс',
+                        name, count, elapsed)
+    # Объекты, созданные до fork, переносятся в постоянное поколение,
+    # чтобы сборщик мусора в воркерах не копировал их страницы.
+    gc.freeze()
+    server.log.info('Мастер готов за %.2f с, память: %s',
+                    time.monotonic() - _started_at,
+                    format_memory(memory_usage()))
+
+
+def post_fork(server, worker):
+    global _forked_at
+    _forked_at = time.monotonic()
+
+
+def pre_request(worker, req):
+    global _first_request_at
+    if _first_request_at is None:
+        _first_request_at = time.monotonic()
+
+
+def post_request(worker, req, environ, resp):
+    global _served_first
+    if _served_first:
+        return
+    _served_first = True
+    from api.warmup import format_memory, memory_usage
+
+    worker.log.info(
+        'Воркер %s: первый запрос обработан за %.0f мс, пришел через '
+        '%.0f мс после fork, память: %s',
+        worker.pid, (time.monotonic() - _first_request_at) * 1000,
+        (_first_request_at - _forked_at) * 1000,
+        format_memory(memory_usage())
+    )
+
+
+def worker_exit(server, worker):
+    from api.warmup import format_memory, memory_usage
+
+    server.log.info('Воркер %s завершается, память: %s',
+                    worker.pid, format_memory(memory_usage()))
@@ -47,7 +47,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.CompressionMiddleware',
+    'api.middleware.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -88,10 +91,24 @@ REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.TokenAuthentication',
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 6,
 }
 
+# Response compression
+COMPRESSION_MIN_SIZE = int(os.getenv('COMPRESSION_MIN_SIZE', '1024'))
+COMPRESSION_GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', '6'))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', '4'))
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -125,6 +142,46 @@ DATABASES = {
     }
 }
 
+# Read replicas: DB_REPLICA_HOSTS=host[:port],host[:port]
+REPLICA_DATABASES = []
+for number, address in enumerate(
+    filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(','))
+):
+    host, _, port = address.strip().partition(':')
+    alias = f'replica_{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ['api.db_router.ReplicaRouter']
+
+# Seconds a client keeps reading from the primary after a write
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', '5'))
+REPLICA_PIN_COOKIE = 'pin_primary'
+
+
+# Password hashing. PASSWORD_HASHER selects the hasher for new hashes;
+# the others still verify existing hashes, which are upgraded on login.
+PASSWORD_HASHER_CHOICES = {
+    'argon2': 'api.hashers.TunedArgon2PasswordHasher',
+    'bcrypt': 'api.hashers.TunedBCryptSHA256PasswordHasher',
+    'pbkdf2': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+}
+PASSWORD_HASHERS = [
+    PASSWORD_HASHER_CHOICES[os.getenv('PASSWORD_HASHER', 'argon2')],
+]
+PASSWORD_HASHERS += [
+    hasher for hasher in PASSWORD_HASHER_CHOICES.values()
+    if hasher not in PASSWORD_HASHERS
+] + ['django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher']
+ARGON2_TIME_COST = int(os.getenv('ARGON2_TIME_COST', '2'))
+ARGON2_MEMORY_COST = int(os.getenv('ARGON2_MEMORY_COST', '19456'))
+ARGON2_PARALLELISM = int(os.getenv('ARGON2_PARALLELISM', '1'))
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', '12'))
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -166,6 +223,67 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+STORAGES = {
+    'default': {
+        'BACKEND': 'api.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
+# Generated downloads (shopping lists), served by nginx via X-Accel-Redirect
+EXPORTS_ROOT = os.getenv('EXPORTS_ROOT', os.path.join(BASE_DIR, 'exports'))
+EXPORTS_URL = '/protected/exports/'
+# Seconds an outdated export is kept for downloads that already chose it
+EXPORTS_GRACE_SECONDS = 300
+
+# Directories under MEDIA_ROOT swept by `manage.py gc_media`
+GC_MEDIA_DIRS = ['recipes', 'avatars']
+
+# Subscription timeline
+TIMELINE_MAX_LENGTH = int(os.getenv('TIMELINE_MAX_LENGTH', '1000'))
+TIMELINE_FANOUT_LIMIT = int(os.getenv('TIMELINE_FANOUT_LIMIT', '10000'))
+# Seconds between `manage.py run_tasks` passes trimming overfull timelines
+TIMELINE_TRIM_INTERVAL = int(os.getenv('TIMELINE_TRIM_INTERVAL', '600'))
+
+# Seconds before a worker re-reads the in-memory ingredient catalogue
+INGREDIENT_CATALOGUE_TTL = int(os.getenv('INGREDIENT_CATALOGUE_TTL', '300'))
+
+# Ingredient suggestions returned for a name prefix, most used first
+INGREDIENT_AUTOCOMPLETE_LIMIT = int(
+    os.getenv('INGREDIENT_AUTOCOMPLETE_LIMIT', '20')
+)
+
+# Background tasks (`manage.py run_tasks`)
+TASKS_RETRY_DELAY = 10
+TASKS_VISIBILITY_TIMEOUT = 300
+TASKS_RETENTION = 7 * 24 * 3600
+
+# Rows removed per step of a background user/recipe deletion (api.deletion)
+DELETION_BATCH_SIZE = int(os.getenv('DELETION_BATCH_SIZE', '1000'))
+
+# Edge cache in nginx (api.edge_cache): seconds anonymous responses are
+# kept, and the nginx server used to refresh changed pages
+EDGE_CACHE_RECIPES_TTL = int(os.getenv('EDGE_CACHE_RECIPES_TTL', '10'))
+EDGE_CACHE_INGREDIENTS_TTL = int(
+    os.getenv('EDGE_CACHE_INGREDIENTS_TTL', '300')
+)
+EDGE_CACHE_PURGE_URL = os.getenv('EDGE_CACHE_PURGE_URL', '')
+EDGE_CACHE_HOST = os.getenv('EDGE_CACHE_HOST', '')
+EDGE_CACHE_PURGE_TIMEOUT = 5
+
+# Request profiling (api.profiling), off unless a rate or token is set.
+# Requests with the header `X-Profile: <PROFILING_TOKEN>` are always
+# profiled; PROFILING_TRACEMALLOC also traces their allocations.
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', '0'))
+PROFILING_TOKEN = os.getenv('PROFILING_TOKEN', '')
+PROFILING_INTERVAL = float(os.getenv('PROFILING_INTERVAL', '0.005'))
+PROFILING_MAX_STACKS = 5000
+PROFILING_TRACEMALLOC = os.getenv('PROFILING_TRACEMALLOC', 'False') == 'True'
+PROFILING_TRACEMALLOC_FRAMES = 1
+PROFILING_TOP_ALLOCATIONS = 20
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
@@ -210,3 +328,39 @@ LOGGING = {
         },
     },
 }
+
+# Settings profiles. DJANGO_SETTINGS_PROFILE=bench runs the whole API
+# without the docker-compose stack: SQLite (or Postgres with
+# BENCH_DATABASE=postgres), local-memory cache and fast password hashing.
+SETTINGS_PROFILE = os.getenv('DJANGO_SETTINGS_PROFILE', '')
+
+if SETTINGS_PROFILE == 'bench':
+    DEBUG = os.getenv('DEBUG', 'False') == 'True'
+    if os.getenv('BENCH_DATABASE', 'sqlite') == 'sqlite':
+        DATABASES = {
+            'default': {
+                'ENGINE': 'django.db.backends.sqlite3',
+                'NAME': os.getenv(
+                    'BENCH_DATABASE_PATH',
+                    os.path.join(BASE_DIR, 'bench.sqlite3')
+                ),
+                'OPTIONS': {'timeout': 20},
+            }
+        }
+        REPLICA_DATABASES = []
+        SQLITE_PRAGMAS = {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'cache_size': -64000,
+            'temp_store': 'MEMORY',
+            'mmap_size': 268435456,
+        }
+        # SQLite has no INCLUDE columns; the indexes are created without
+        # them, which is enough for benchmarking.
+        SILENCED_SYSTEM_CHECKS = ['models.W040']
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+    PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']